@@ -0,0 +1,135 @@
+from bisect import bisect_left
+from django.core.cache import cache
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import CustomUser
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AccountAutocompleteIndex:
+    """账号自动完成索引（进程内有序邮箱列表 + 按前缀缓存结果）
+
+    版本号保存在缓存中。当前配置的 LocMemCache 是进程内缓存，其他进程（调度进程中的
+    delete_marked_users、其他 Web 进程）增删账号时不会更新本进程的版本号，所以本地索引
+    最多使用 INDEX_MAX_AGE 秒后重建；换成共享缓存（如 Redis）后版本号跨进程生效。
+    """
+
+    CACHE_KEY_VERSION = 'account_autocomplete_version'
+    CACHE_KEY_PREFIX = 'account_autocomplete'
+    CACHE_TIMEOUT = 300  # 5分钟
+    INDEX_MAX_AGE = 60  # 本地索引最多使用1分钟
+    MAX_RESULTS = 10
+
+    # 进程内索引：(版本号, 重建编号, 重建时间, 小写邮箱有序列表, 对应的 (id, email) 列表)
+    # 作为一个元组整体替换，并发的搜索线程不会读到不一致的两个列表
+    _index = None
+    _builds = 0
+
+    @classmethod
+    def get_version(cls):
+        """获取索引版本号（用于判断本地索引是否过期）"""
+        version = cache.get(cls.CACHE_KEY_VERSION)
+        if version is None:
+            version = 1
+            cache.add(cls.CACHE_KEY_VERSION, version, None)
+        return version
+
+    @classmethod
+    def invalidate(cls):
+        """用户增删后使索引失效"""
+        try:
+            cache.incr(cls.CACHE_KEY_VERSION)
+        except ValueError:
+            cache.set(cls.CACHE_KEY_VERSION, 1, None)
+        logger.info("账号自动完成索引已失效")
+
+    @classmethod
+    def _ensure_index(cls, version):
+        """本地索引版本落后或超过 INDEX_MAX_AGE 时，用一次查询重建有序邮箱列表
+
+        Returns:
+            tuple: 当前索引 (版本号, 重建编号, 重建时间, keys, entries)
+        """
+        index = cls._index
+        if index is not None and index[0] == version and time.monotonic() - index[2] < cls.INDEX_MAX_AGE:
+            return index
+
+        rows = CustomUser.objects.filter(
+            is_superuser=False
+        ).values_list('id', 'email')
+        entries = sorted(
+            (email.lower(), user_id, email) for user_id, email in rows.iterator()
+        )
+        cls._builds += 1
+        index = (
+            version, cls._builds, time.monotonic(),
+            [key for key, _, _ in entries],
+            [(user_id, email) for _, user_id, email in entries],
+        )
+        cls._index = index
+        logger.info(f"账号自动完成索引已重建，包含 {len(entries)} 个账号")
+        return index
+
+    @classmethod
+    def search(cls, query):
+        """按邮箱前缀搜索非医师账号，返回精简的 [{'id', 'email'}] 列表"""
+        prefix = query.strip().lower()
+        if not prefix:
+            return []
+
+        version, build, _, keys, entries = cls._ensure_index(cls.get_version())
+        # 结果按本地索引的重建编号缓存，索引定期重建后旧结果不再使用
+        cache_key = f'{cls.CACHE_KEY_PREFIX}_{version}_{build}_{prefix}'
+        results = cache.get(cache_key)
+        if results is not None:
+            return results
+
+        # 二分查找前缀起点，向后取连续匹配项
+        results = []
+        index = bisect_left(keys, prefix)
+        while (index < len(keys) and len(results) < cls.MAX_RESULTS
+               and keys[index].startswith(prefix)):
+            user_id, email = entries[index]
+            results.append({'id': user_id, 'email': email})
+            index += 1
+
+        cache.set(cache_key, results, cls.CACHE_TIMEOUT)
+        return results
+
+
+# 只有新增、删除账号或修改邮箱/身份时才需要重建索引
+INDEX_RELATED_FIELDS = ('email', 'is_superuser')
+
+@receiver(pre_save, sender=CustomUser)
+def capture_user_index_fields(sender, instance, update_fields=None, **kwargs):
+    """保存前读取数据库中的邮箱和身份，供 handle_user_save 判断是否变化"""
+    instance._index_fields_before_save = None
+    if instance.pk is None or instance._state.adding:
+        return
+    if update_fields is not None and not set(INDEX_RELATED_FIELDS) & set(update_fields):
+        return
+    instance._index_fields_before_save = CustomUser.objects.filter(
+        pk=instance.pk
+    ).values_list(*INDEX_RELATED_FIELDS).first()
+
+@receiver(post_save, sender=CustomUser)
+def handle_user_save(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        AccountAutocompleteIndex.invalidate()
+        return
+    before = getattr(instance, '_index_fields_before_save', None)
+    instance._index_fields_before_save = None
+    if before is None:
+        # 没有读取保存前的值：update_fields 不含相关字段时无需处理，否则（如记录不存在）安全起见使索引失效
+        if update_fields is None or set(INDEX_RELATED_FIELDS) & set(update_fields):
+            AccountAutocompleteIndex.invalidate()
+        return
+    after = tuple(getattr(instance, field) for field in INDEX_RELATED_FIELDS)
+    if before != after:
+        AccountAutocompleteIndex.invalidate()
+
+@receiver(post_delete, sender=CustomUser)
+def handle_user_delete(sender, instance, **kwargs):
+    AccountAutocompleteIndex.invalidate()
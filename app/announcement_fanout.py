@@ -0,0 +1,152 @@
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from datetime import timedelta
+from .mail_outbox import EmailOutboxManager
+from .models import Announcement, CustomUser
+import threading
+import pytz
+import logging
+
+logger = logging.getLogger(__name__)
+
+class AnnouncementFanout:
+    """公告邮件分发：流式读取收件人，分批写入发件箱（每人一封），并记录进度
+
+    实际发送由发件箱完成：复用同一SMTP连接，单个收件人失败时按退避间隔重试，
+    超过次数后标记为发送失败，不影响其他收件人。
+    """
+
+    CHUNK_SIZE = 100
+    STALE_TIMEOUT = 600  # 发送中超过10分钟无进度视为中断，可重新领取
+
+    @staticmethod
+    def build_message(announcement):
+        """构建公告邮件主题和纯文本内容"""
+        # 将时间转换为东八区时间（北京时间）
+        beijing_tz = pytz.timezone('Asia/Shanghai')
+        beijing_time = announcement.created_at.astimezone(beijing_tz)
+
+        subject = f'【缥缈旅】公告：{announcement.title}'
+        message = f"""
+=== 伯里欧斯的公告 ===
+
+标题：{announcement.title}
+
+公告内容：
+{announcement.content}
+
+发布时间：{beijing_time.strftime('%Y年%m月%d日 %H:%M')}（北京时间）
+
+=== 温馨提示 ===
+1. 此邮件由系统自动发送，请勿直接回复
+2. 感谢您使用缥缈旅
+
+伯里欧斯的小助手
+"""
+        return subject, message
+
+    @classmethod
+    def start(cls, announcement):
+        """事务提交后在后台线程中分发，不阻塞发布请求"""
+        def run():
+            try:
+                cls.deliver(announcement.id)
+            except Exception as e:
+                logger.error(f"公告邮件分发失败 (ID: {announcement.id}): {e}")
+            finally:
+                connection.close()
+
+        transaction.on_commit(
+            lambda: threading.Thread(target=run, daemon=True).start()
+        )
+
+    @classmethod
+    def _claim(cls, announcement_id):
+        """领取分发任务，避免多个进程重复发送"""
+        now = timezone.now()
+        claimed = Announcement.objects.filter(id=announcement_id).filter(
+            Q(notify_status='pending') |
+            Q(notify_status='sending', notify_updated_at__lt=now - timedelta(seconds=cls.STALE_TIMEOUT))
+        ).update(notify_status='sending', notify_updated_at=now)
+        return claimed == 1
+
+    @classmethod
+    def deliver(cls, announcement_id):
+        """从进度游标处继续分发公告邮件
+
+        Returns:
+            int: 本次写入发件箱的邮件数量
+        """
+        if not cls._claim(announcement_id):
+            return 0
+
+        announcement = Announcement.objects.get(id=announcement_id)
+        subject, message = cls.build_message(announcement)
+
+        # 只读取ID和邮箱，按ID顺序流式遍历，便于从游标处继续
+        recipients = CustomUser.objects.filter(
+            is_active=True,
+            is_superuser=False,
+            id__gt=announcement.notify_cursor
+        ).exclude(email='').order_by('id').values_list('id', 'email')
+
+        queued_total = 0
+        try:
+            chunk = []
+            for user_id, email in recipients.iterator(chunk_size=cls.CHUNK_SIZE):
+                chunk.append((user_id, email))
+                if len(chunk) >= cls.CHUNK_SIZE:
+                    queued_total += cls._enqueue_chunk(announcement, subject, message, chunk)
+                    chunk = []
+            if chunk:
+                queued_total += cls._enqueue_chunk(announcement, subject, message, chunk)
+        except Exception:
+            # 保留进度，交给定时任务从游标处重试
+            Announcement.objects.filter(id=announcement.id).update(notify_status='pending')
+            raise
+
+        Announcement.objects.filter(id=announcement.id).update(
+            notify_status='done',
+            notify_finished_at=timezone.now(),
+        )
+        logger.info(f"公告邮件分发完成 (ID: {announcement.id})，本次写入发件箱 {queued_total} 封")
+        return queued_total
+
+    @classmethod
+    def _enqueue_chunk(cls, announcement, subject, message, chunk):
+        """把一批单独寻址的邮件写入发件箱并推进进度游标
+
+        写入与游标在同一事务中提交：失败时整批回滚，重试时不会重复写入。
+        """
+        with transaction.atomic():
+            outboxes = EmailOutboxManager.enqueue_many([
+                (subject, message, [email], None) for _, email in chunk
+            ])
+
+            announcement.notify_cursor = chunk[-1][0]
+            announcement.notified_count += len(outboxes)
+            Announcement.objects.filter(id=announcement.id).update(
+                notify_cursor=announcement.notify_cursor,
+                notified_count=announcement.notified_count,
+                notify_updated_at=timezone.now(),
+            )
+        return len(outboxes)
+
+    @classmethod
+    def resume_pending(cls):
+        """继续分发未完成的公告（定时任务调用）"""
+        stale_before = timezone.now() - timedelta(seconds=cls.STALE_TIMEOUT)
+        announcement_ids = Announcement.objects.filter(
+            Q(notify_status='pending') |
+            Q(notify_status='sending', notify_updated_at__lt=stale_before)
+        ).values_list('id', flat=True)
+
+        queued_total = 0
+        for announcement_id in announcement_ids:
+            # 单个公告失败不影响其他公告，下次定时任务从游标处重试
+            try:
+                queued_total += cls.deliver(announcement_id)
+            except Exception as e:
+                logger.error(f"公告邮件分发失败 (ID: {announcement_id}): {e}")
+        return queued_total
@@ -7,8 +7,14 @@ class AppConfig(AppConfig):
     name = 'app'
     
     def ready(self):
-        # 确保只在主进程中运行一次
+        # 注册账号自动完成索引的失效信号
+        from . import account_index  # noqa: F401
+        # 注册 SQLite 连接初始化（WAL、busy_timeout 等 PRAGMA）
+        from . import db_connection  # noqa: F401
+
+        # 定时任务默认由单独的调度进程（manage.py run_scheduler）执行，Web 进程不启动调度器；
+        # 单进程部署可开启 SCHEDULER_AUTOSTART，在 Web 进程内启动（有进程锁，多个进程也只会运行一个）
         import os
-        if os.environ.get('RUN_MAIN') or not settings.DEBUG:
+        if getattr(settings, 'SCHEDULER_AUTOSTART', False) and (os.environ.get('RUN_MAIN') or not settings.DEBUG):
             from .scheduler import start
             start()
\ No newline at end of file
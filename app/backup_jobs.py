@@ -0,0 +1,234 @@
+from django.db import connection
+from django.utils import timezone
+from datetime import datetime, timedelta
+from .backup_utils import DataBackupManager
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+class BackupJobManager:
+    """备份/恢复后台任务：在后台线程中执行，进度写入备份目录下的任务文件供页面轮询
+
+    任务状态不存数据库：恢复在事务内进行，写入数据库的进度在提交前轮询不到，
+    快照恢复还会整库覆盖，任务记录本身也会被替换。
+    """
+
+    JOBS_DIRNAME = 'jobs'
+    PROGRESS_INTERVAL = 0.5  # 进度写入的最小间隔（秒）
+    STALE_TIMEOUT = 600  # 运行中超过10分钟没有进度视为进程中断
+    HEARTBEAT_INTERVAL = 60  # 没有进度回调的步骤（数据库快照、快照恢复）期间定时写入任务文件，表明进程仍在运行
+    KEEP_JOBS = 20
+
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_jobs_directory():
+        """获取任务文件目录"""
+        jobs_dir = os.path.join(DataBackupManager.get_backup_directory(), BackupJobManager.JOBS_DIRNAME)
+        os.makedirs(jobs_dir, exist_ok=True)
+        return jobs_dir
+
+    @staticmethod
+    def _job_path(job_id):
+        # 只接受本模块生成的任务ID，避免拼出目录外的路径
+        return os.path.join(BackupJobManager.get_jobs_directory(), f'{uuid.UUID(job_id).hex}.json')
+
+    @staticmethod
+    def _save(job):
+        """原子写入任务文件（先写临时文件再替换），轮询不会读到写了一半的内容"""
+        job['updated_at'] = timezone.now().isoformat()
+        path = BackupJobManager._job_path(job['id'])
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def get_job(job_id):
+        """读取任务状态，不存在时返回 None"""
+        try:
+            with open(BackupJobManager._job_path(job_id), 'r', encoding='utf-8') as f:
+                job = json.load(f)
+        except (ValueError, OSError):
+            return None
+
+        if job['status'] in ('pending', 'running'):
+            updated_at = datetime.fromisoformat(job['updated_at'])
+            if timezone.now() - updated_at > timedelta(seconds=BackupJobManager.STALE_TIMEOUT):
+                job['status'] = 'failed'
+                job['error'] = '任务长时间没有进度，执行进程可能已中断'
+        return job
+
+    @staticmethod
+    def list_jobs(limit=10):
+        """最近的任务，新任务在前"""
+        jobs_dir = BackupJobManager.get_jobs_directory()
+        filenames = sorted(
+            (name for name in os.listdir(jobs_dir) if name.endswith('.json')),
+            key=lambda name: os.path.getmtime(os.path.join(jobs_dir, name)),
+            reverse=True
+        )
+        jobs = []
+        for name in filenames[:limit]:
+            job = BackupJobManager.get_job(name[:-len('.json')])
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    @staticmethod
+    def _prune():
+        """只保留最近的 KEEP_JOBS 个任务，删除更早任务的任务文件和上传文件
+
+        等待中和运行中的任务不删除（长时间没有进度的任务由 get_job 视为失败，可以删除）。
+        """
+        jobs_dir = BackupJobManager.get_jobs_directory()
+        filenames = sorted(
+            (name for name in os.listdir(jobs_dir) if name.endswith('.json')),
+            key=lambda name: os.path.getmtime(os.path.join(jobs_dir, name)),
+            reverse=True
+        )
+        for name in filenames[BackupJobManager.KEEP_JOBS:]:
+            job_id = name[:-len('.json')]
+            job = BackupJobManager.get_job(job_id)
+            if job is not None and job['status'] in ('pending', 'running'):
+                continue
+            for path in (os.path.join(jobs_dir, name), os.path.join(jobs_dir, f'{job_id}.zip')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _create(kind, options, user=None):
+        BackupJobManager._prune()
+        now = timezone.now().isoformat()
+        job = {
+            'id': uuid.uuid4().hex,
+            'kind': kind,
+            'status': 'pending',
+            'options': options,
+            'progress': {'current': None, 'tables': {}},
+            'filename': options.get('filename'),
+            'result': None,
+            'error': '',
+            'created_by': getattr(user, 'email', None),
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+        }
+        BackupJobManager._save(job)
+        return job
+
+    @staticmethod
+    def _progress_reporter(job):
+        """返回进度回调 progress(表名, 已处理行数, done=False)，可在多个导出线程中调用
+
+        按间隔节流写入任务文件，表处理完成时立即写入。
+        """
+        last_saved = [0.0]
+
+        def progress(name, rows, done=False):
+            with BackupJobManager._lock:
+                job['progress']['current'] = name
+                job['progress']['tables'][name] = rows
+                now = time.monotonic()
+                if done or now - last_saved[0] >= BackupJobManager.PROGRESS_INTERVAL:
+                    last_saved[0] = now
+                    BackupJobManager._save(job)
+
+        return progress
+
+    @staticmethod
+    def _start(job, target):
+        """在后台线程中执行任务，记录开始/结束时间和结果
+
+        执行期间另起心跳线程定时写入任务文件，没有进度回调的长时间步骤不会被误判为进程中断。
+        任务结束后心跳不再写入，最终状态只写一次。
+        """
+        finished = threading.Event()
+
+        def heartbeat():
+            while not finished.wait(BackupJobManager.HEARTBEAT_INTERVAL):
+                with BackupJobManager._lock:
+                    if not finished.is_set():
+                        BackupJobManager._save(job)
+
+        def run():
+            job['status'] = 'running'
+            job['started_at'] = timezone.now().isoformat()
+            BackupJobManager._save(job)
+            threading.Thread(target=heartbeat, daemon=True).start()
+            status, error = 'done', ''
+            try:
+                target(job, BackupJobManager._progress_reporter(job))
+            except Exception as e:
+                logger.exception(f"后台{'备份' if job['kind'] == 'backup' else '恢复'}任务失败 (ID: {job['id']})")
+                status, error = 'failed', str(e)
+            finally:
+                finished.set()
+                connection.close()
+            with BackupJobManager._lock:
+                job['status'] = status
+                job['error'] = error
+                job['finished_at'] = timezone.now().isoformat()
+                BackupJobManager._save(job)
+
+        threading.Thread(target=run, daemon=True).start()
+        return job
+
+    @staticmethod
+    def start_backup(mode='full', codec=None, user=None):
+        """提交后台备份任务
+
+        Args:
+            mode: full / incremental / snapshot
+        """
+        job = BackupJobManager._create('backup', {'mode': mode, 'codec': codec}, user)
+
+        def target(job, progress):
+            if mode == 'snapshot':
+                backup_path = DataBackupManager.create_snapshot(codec=codec)
+            else:
+                backup_path = DataBackupManager.create_backup(
+                    incremental=mode == 'incremental', codec=codec, progress=progress
+                )
+            job['filename'] = os.path.basename(backup_path)
+
+        return BackupJobManager._start(job, target)
+
+    @staticmethod
+    def start_restore(upload=None, filename=None, user=None):
+        """提交后台恢复任务：恢复上传的备份文件，或按备份链恢复服务器上的备份"""
+        job = BackupJobManager._create('restore', {'filename': filename}, user)
+
+        upload_path = None
+        if upload is not None:
+            # 请求结束后上传文件即被清理，先保存到任务目录；已落盘的上传文件直接移动
+            upload_path = os.path.join(BackupJobManager.get_jobs_directory(), f"{job['id']}.zip")
+            if hasattr(upload, 'temporary_file_path'):
+                shutil.move(upload.temporary_file_path(), upload_path)
+            else:
+                with open(upload_path, 'wb') as f:
+                    for chunk in upload.chunks():
+                        f.write(chunk)
+            job['filename'] = upload.name
+
+        def target(job, progress):
+            if upload_path is None:
+                job['result'] = DataBackupManager.restore_chain(filename, progress=progress)
+                return
+            try:
+                if DataBackupManager.read_backup_info(upload_path).get('backup_type') == 'snapshot':
+                    job['result'] = DataBackupManager.restore_snapshot(upload_path)
+                else:
+                    job['result'] = DataBackupManager.restore_backup(upload_path, progress=progress)
+            finally:
+                os.remove(upload_path)
+
+        return BackupJobManager._start(job, target)
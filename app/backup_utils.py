@@ -1,14 +1,33 @@
+import hashlib
+import io
 import json
+import lzma
+import sqlite3
+import threading
+import time
 import zipfile
 import tempfile
 import os
+import zlib
 import django  # 添加django导入
 from django.core import serializers
+from django.apps import apps
 from django.conf import settings
-from django.db import transaction
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.migrations.recorder import MigrationRecorder
 from django.utils import timezone
-from datetime import datetime
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pytz  # 添加pytz时区库
+try:
+    from compression import zstd  # noqa: F401  Python 3.14 起标准库提供 Zstandard
+    ZIP_ZSTANDARD = zipfile.ZIP_ZSTANDARD
+    ZSTD_ERRORS = (zstd.ZstdError,)
+except ImportError:
+    ZIP_ZSTANDARD = None
+    ZSTD_ERRORS = ()
+from .db_router import ReplicaMonitor
 from .models import (
     CustomUser, Appointment, Profile, ProfileRecord, 
     DailyAppointmentCreation, Announcement, DoctorProcessingPool
@@ -17,145 +36,510 @@ from .models import (
 class DataBackupManager:
     """数据备份管理器"""
     
+    # 备份的数据表：(名称, 查询集, 说明, 增量水位字段, 记录标识字段)，按此顺序写入备份信息
+    # 用户外键按邮箱（自然键）导出，需要连带查询用户，避免逐条查询
+    # 没有可靠修改时间的表（水位字段为 None）在增量备份中仍完整导出
+    BACKUP_TABLES = (
+        ('users', lambda: CustomUser.objects.filter(is_superuser=False, is_staff=False), '用户数据', None, 'email'),
+        ('appointments', lambda: Appointment.objects.select_related('guest'), '预约数据', 'updated_at', 'pk'),
+        ('profiles', lambda: Profile.objects.select_related('account', 'created_by'), '档案数据', 'updated_at', 'pk'),
+        ('profile_records', lambda: ProfileRecord.objects.select_related('created_by'), '档案记录数据', 'created_at', 'pk'),
+        ('daily_creations', lambda: DailyAppointmentCreation.objects.select_related('user'), '每日创建记录', 'created_at', 'pk'),
+        ('announcements', lambda: Announcement.objects.select_related('created_by'), '公告数据', None, 'pk'),
+        ('processing_pools', lambda: DoctorProcessingPool.objects.all(), '处理池数据', None, 'pk'),
+    )
+    BACKUP_FORMAT = 'jsonl'  # 每行一条记录，旧版备份为整表JSON数组（.json）
+    EXPORT_CHUNK_SIZE = 2000
+    EXPORT_WORKERS = 4  # 并行导出的线程数，每个线程使用独立的数据库连接
+    RESTORE_BATCH_SIZE = 500
+    WATERMARK_OVERLAP = 60  # 增量备份向前多取60秒，覆盖备份开始时尚未提交的修改
+
+    # 备份目录索引：创建备份时写入大小、记录数、压缩方式和各成员的SHA-256，
+    # 列表和详情直接读索引，不再逐个打开备份文件
+    CATALOG_FILENAME = 'catalog.json'
+    HASH_CHUNK_SIZE = 1024 * 1024
+    _catalog_lock = threading.Lock()
+    # 解压损坏的成员时各压缩方式抛出的异常（deflate 数据损坏时抛出 zlib.error，而不是 BadZipFile）
+    DECOMPRESS_ERRORS = (zipfile.BadZipFile, OSError, EOFError, zlib.error, lzma.LZMAError) + ZSTD_ERRORS
+
+    # 可选的压缩方式：名称 -> (ZIP压缩类型, 默认压缩级别)
+    BACKUP_CODECS = {
+        'stored': (zipfile.ZIP_STORED, None),
+        'deflate': (zipfile.ZIP_DEFLATED, 6),
+        'lzma': (zipfile.ZIP_LZMA, None),
+        'zstd': (ZIP_ZSTANDARD, 3),
+    }
+
     @staticmethod
     def get_backup_directory():
         """获取备份目录"""
         backup_dir = os.path.join(settings.BASE_DIR, 'backups')
         os.makedirs(backup_dir, exist_ok=True)
         return backup_dir
-    
+
     @staticmethod
-    def create_backup():
+    def read_backup_info(backup_file):
+        """读取备份文件中的备份信息"""
+        with zipfile.ZipFile(backup_file, 'r') as zipf:
+            with zipf.open('backup_info.json') as f:
+                return json.load(f)
+
+    @staticmethod
+    def get_latest_backup_info():
+        """获取最近一次可作为增量基准的备份信息（旧版备份没有水位，不能作为基准）
+
+        Returns:
+            tuple: (文件名, 备份信息)，没有时返回 (None, None)
+        """
+        for backup in DataBackupManager.list_backups():
+            backup_info = backup['backup_info']
+            if backup_info and backup_info.get('watermark'):
+                return backup['filename'], backup_info
+        return None, None
+
+    @staticmethod
+    def _iter_keys(zipf, member):
+        """逐行读取备份中的记录标识列表（每行一个JSON值）"""
+        with zipf.open(member) as raw, io.TextIOWrapper(raw, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    @staticmethod
+    def _resolve_codec(codec=None, level=None):
+        """解析压缩方式（未指定时使用 settings.BACKUP_CODEC / BACKUP_CODEC_LEVEL）
+
+        Returns:
+            tuple: (压缩方式名称, ZIP压缩类型, 压缩级别)
+        """
+        codec = codec or getattr(settings, 'BACKUP_CODEC', 'deflate')
+        if codec not in DataBackupManager.BACKUP_CODECS:
+            raise ValueError(f"不支持的压缩方式: {codec}")
+
+        compress_type, default_level = DataBackupManager.BACKUP_CODECS[codec]
+        if compress_type is None:
+            raise ValueError("当前Python不支持Zstandard压缩（需要Python 3.14的 compression.zstd）")
+
+        if default_level is None:
+            # 存储和LZMA没有可调的压缩级别
+            return codec, compress_type, None
+        if level is None:
+            level = getattr(settings, 'BACKUP_CODEC_LEVEL', None)
+        return codec, compress_type, default_level if level is None else int(level)
+
+    @staticmethod
+    def _write_member(zipf, path, arcname, member_stats):
+        """压缩写入一个成员，记录原始大小、压缩后大小、压缩用时和SHA-256
+
+        按块读取源文件，写入的同时计算校验和，不再单独读一遍。
+        """
+        started = time.monotonic()
+        digest = hashlib.sha256()
+        force_zip64 = os.path.getsize(path) > zipfile.ZIP64_LIMIT
+        with open(path, 'rb') as source, zipf.open(arcname, 'w', force_zip64=force_zip64) as target:
+            for chunk in iter(lambda: source.read(DataBackupManager.HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                target.write(chunk)
+        zip_info = zipf.getinfo(arcname)
+        member_stats[arcname] = {
+            'size': zip_info.file_size,
+            'compressed_size': zip_info.compress_size,
+            'seconds': round(time.monotonic() - started, 3),
+            'sha256': digest.hexdigest(),
+        }
+
+    @staticmethod
+    def _write_backup_info(zipf, backup_info):
+        """写入备份信息，返回其SHA-256（备份信息不能包含自身的校验和，记录在目录索引中）"""
+        data = json.dumps(backup_info, ensure_ascii=False, indent=2).encode('utf-8')
+        zipf.writestr('backup_info.json', data)
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def _compression_summary(codec, level, member_stats):
+        """汇总压缩效果，写入备份信息（ratio = 压缩后大小 / 原始大小）"""
+        original_size = sum(stats['size'] for stats in member_stats.values())
+        compressed_size = sum(stats['compressed_size'] for stats in member_stats.values())
+        return {
+            'codec': codec,
+            'level': level,
+            'seconds': round(sum(stats['seconds'] for stats in member_stats.values()), 3),
+            'original_size': original_size,
+            'compressed_size': compressed_size,
+            'ratio': round(compressed_size / original_size, 4) if original_size else None,
+            'members': member_stats,
+        }
+
+    @staticmethod
+    def _export_table(table, temp_dir, since=None, base_path=None, progress=None, using=DEFAULT_DB_ALIAS):
+        """导出一张表到临时文件
+
+        在导出线程中运行，使用该线程自己的数据库连接（using 指定的主库或只读副本），结束后关闭。
+        用 iterator() 按块从数据库读取（PostgreSQL 上为服务端游标），内存占用与表大小无关；记录数在写入过程中顺带统计，
+        每读完一块通过 progress(表名, 已写入记录数) 报告一次进度。
+
+        - {name}.jsonl：数据，增量备份只含水位之后新增/修改的记录
+        - {name}.ids：当前全部记录的标识，供下一次增量备份比对已删除的记录
+        - {name}.deleted：增量备份中自基准备份以来被删除的记录标识
+
+        Returns:
+            dict: {'records': 写入的记录数, 'deleted': 删除的记录数}
+        """
+        name, get_queryset, _, watermark_field, key_field = table
+        written = [0]
+
+        def counted(objects):
+            for obj in objects:
+                written[0] += 1
+                if progress is not None and written[0] % DataBackupManager.EXPORT_CHUNK_SIZE == 0:
+                    progress(name, written[0])
+                yield obj
+
+        try:
+            queryset = get_queryset().using(using)
+            rows = queryset
+            if since is not None and watermark_field:
+                rows = rows.filter(**{f'{watermark_field}__gte': since})
+
+            serializer = serializers.get_serializer('jsonl')()
+            rows = rows.order_by('pk').iterator(chunk_size=DataBackupManager.EXPORT_CHUNK_SIZE)
+            with open(os.path.join(temp_dir, f'{name}.jsonl'), 'w', encoding='utf-8', newline='\n') as stream:
+                serializer.serialize(counted(rows), stream=stream, use_natural_foreign_keys=True)
+
+            keys = queryset.order_by('pk').values_list(key_field, flat=True)
+            with open(os.path.join(temp_dir, f'{name}.ids'), 'w', encoding='utf-8', newline='\n') as stream:
+                for key in keys.iterator(chunk_size=DataBackupManager.EXPORT_CHUNK_SIZE):
+                    stream.write(json.dumps(key) + '\n')
+
+            deleted = 0
+            if base_path is not None:
+                # 基准备份中有、现在整张表中都没有的记录即为已删除
+                # （与全表而非导出范围比较，账号升级为医师不算删除）
+                current_keys = set(
+                    queryset.model._base_manager.using(using).values_list(key_field, flat=True).iterator()
+                )
+                with zipfile.ZipFile(base_path, 'r') as base_zipf, \
+                        open(os.path.join(temp_dir, f'{name}.deleted'), 'w', encoding='utf-8', newline='\n') as stream:
+                    for key in DataBackupManager._iter_keys(base_zipf, f'{name}.ids'):
+                        if key not in current_keys:
+                            stream.write(json.dumps(key) + '\n')
+                            deleted += 1
+
+            if progress is not None:
+                progress(name, written[0], done=True)
+            return {'records': written[0], 'deleted': deleted}
+        finally:
+            connections[using].close()
+
+    @staticmethod
+    def create_backup(incremental=False, codec=None, level=None, progress=None, scheduled=False):
         """
         创建数据备份
         返回备份文件的路径
+
+        Args:
+            incremental: 是否只导出自上次备份水位以来新增/修改的记录（没有可用基准时创建完整备份）
+            codec: 压缩方式 stored / deflate / lzma / zstd，默认取 settings.BACKUP_CODEC
+            level: 压缩级别（deflate 0-9，zstd 1-22），默认取各压缩方式的推荐级别
+            progress: 进度回调 progress(表名, 已导出记录数, done=False)，会在导出线程中调用
+            scheduled: 是否为定时备份（只有定时备份按保留策略清理，见 apply_retention）
         """
+        started = time.monotonic()
+        codec, compress_type, level = DataBackupManager._resolve_codec(codec, level)
         backup_dir = DataBackupManager.get_backup_directory()
-        
-        # 创建临时目录存储JSON文件
-        with tempfile.TemporaryDirectory() as temp_dir:
-            backup_files = {}
-            
+
+        base_filename, base_info = None, None
+        if incremental:
+            base_filename, base_info = DataBackupManager.get_latest_backup_info()
+            if base_info is None:
+                print("没有可作为基准的备份，改为创建完整备份")
+        since = None
+        if base_info is not None:
+            since = datetime.fromisoformat(base_info['watermark']) - timedelta(
+                seconds=DataBackupManager.WATERMARK_OVERLAP
+            )
+        base_path = os.path.join(backup_dir, base_filename) if base_filename else None
+
+        # 只读副本可用时从副本导出（导出线程不继承 use_replica()，在这里选定一次）
+        replica = ReplicaMonitor.get_replica()
+        using = replica[0] if replica else DEFAULT_DB_ALIAS
+
+        # 水位取导出开始前的时间，导出期间的修改会被下一次增量备份覆盖；
+        # 从副本导出时取副本数据的时间点，副本尚未同步的修改同样留给下一次增量备份
+        watermark = min(timezone.now(), replica[1]) if replica else timezone.now()
+
+        # 获取北京时间
+        beijing_tz = pytz.timezone('Asia/Shanghai')
+        beijing_time = datetime.now(beijing_tz)
+
+        # 创建ZIP文件 - 使用北京时间
+        timestamp = beijing_time.strftime('%Y%m%d_%H%M%S')
+        zip_filename = f'backup_{timestamp}_incr.zip' if base_info else f'backup_{timestamp}.zip'
+        zip_path = os.path.join(backup_dir, zip_filename)
+
+        tables = DataBackupManager.BACKUP_TABLES
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                ThreadPoolExecutor(max_workers=min(DataBackupManager.EXPORT_WORKERS, len(tables))) as executor:
             try:
-                # 1. 备份用户数据（排除超级用户/医师账号）
-                users = CustomUser.objects.filter(is_superuser=False, is_staff=False)
-                users_data = serializers.serialize('json', users, use_natural_foreign_keys=True)
-                users_file = os.path.join(temp_dir, 'users.json')
-                with open(users_file, 'w', encoding='utf-8') as f:
-                    f.write(users_data)
-                backup_files['users'] = users_file
-                print(f"备份用户数据: {users.count()} 条记录")
-                
-                # 2. 备份预约数据
-                appointments = Appointment.objects.all()
-                appointments_data = serializers.serialize('json', appointments, use_natural_foreign_keys=True)
-                appointments_file = os.path.join(temp_dir, 'appointments.json')
-                with open(appointments_file, 'w', encoding='utf-8') as f:
-                    f.write(appointments_data)
-                backup_files['appointments'] = appointments_file
-                print(f"备份预约数据: {appointments.count()} 条记录")
-                
-                # 3. 备份档案数据
-                profiles = Profile.objects.all()
-                profiles_data = serializers.serialize('json', profiles, use_natural_foreign_keys=True)
-                profiles_file = os.path.join(temp_dir, 'profiles.json')
-                with open(profiles_file, 'w', encoding='utf-8') as f:
-                    f.write(profiles_data)
-                backup_files['profiles'] = profiles_file
-                print(f"备份档案数据: {profiles.count()} 条记录")
-                
-                # 4. 备份档案记录数据
-                profile_records = ProfileRecord.objects.all()
-                profile_records_data = serializers.serialize('json', profile_records, use_natural_foreign_keys=True)
-                profile_records_file = os.path.join(temp_dir, 'profile_records.json')
-                with open(profile_records_file, 'w', encoding='utf-8') as f:
-                    f.write(profile_records_data)
-                backup_files['profile_records'] = profile_records_file
-                print(f"备份档案记录数据: {profile_records.count()} 条记录")
-                
-                # 5. 备份每日创建记录
-                daily_creations = DailyAppointmentCreation.objects.all()
-                daily_creations_data = serializers.serialize('json', daily_creations, use_natural_foreign_keys=True)
-                daily_creations_file = os.path.join(temp_dir, 'daily_creations.json')
-                with open(daily_creations_file, 'w', encoding='utf-8') as f:
-                    f.write(daily_creations_data)
-                backup_files['daily_creations'] = daily_creations_file
-                print(f"备份每日创建记录: {daily_creations.count()} 条记录")
-                
-                # 6. 备份公告数据
-                announcements = Announcement.objects.all()
-                announcements_data = serializers.serialize('json', announcements, use_natural_foreign_keys=True)
-                announcements_file = os.path.join(temp_dir, 'announcements.json')
-                with open(announcements_file, 'w', encoding='utf-8') as f:
-                    f.write(announcements_data)
-                backup_files['announcements'] = announcements_file
-                print(f"备份公告数据: {announcements.count()} 条记录")
-                
-                # 7. 备份处理池数据
-                processing_pools = DoctorProcessingPool.objects.all()
-                processing_pools_data = serializers.serialize('json', processing_pools, use_natural_foreign_keys=True)
-                processing_pools_file = os.path.join(temp_dir, 'processing_pools.json')
-                with open(processing_pools_file, 'w', encoding='utf-8') as f:
-                    f.write(processing_pools_data)
-                backup_files['processing_pools'] = processing_pools_file
-                print(f"备份处理池数据: {processing_pools.count()} 条记录")
-                
-                # 获取北京时间
-                beijing_tz = pytz.timezone('Asia/Shanghai')
-                beijing_time = datetime.now(beijing_tz)
-                
-                # 创建备份信息文件
-                backup_info = {
-                    'backup_date': beijing_time.isoformat(),
-                    'django_version': django.get_version(),  # 使用django.get_version()获取版本
-                    'models_backed_up': list(backup_files.keys()),
-                    'record_counts': {
-                        'users': users.count(),
-                        'appointments': appointments.count(),
-                        'profiles': profiles.count(),
-                        'profile_records': profile_records.count(),
-                        'daily_creations': daily_creations.count(),
-                        'announcements': announcements.count(),
-                        'processing_pools': processing_pools.count(),
-                    },
-                    'timezone': 'Asia/Shanghai'
+                # 各表并行导出到各自的临时文件
+                futures = {
+                    executor.submit(
+                        DataBackupManager._export_table, table, temp_dir, since, base_path, progress, using
+                    ): table
+                    for table in tables
                 }
-                
-                backup_info_file = os.path.join(temp_dir, 'backup_info.json')
-                with open(backup_info_file, 'w', encoding='utf-8') as f:
-                    json.dump(backup_info, f, ensure_ascii=False, indent=2)
-                
-                # 创建ZIP文件 - 使用北京时间
-                timestamp = beijing_time.strftime('%Y%m%d_%H%M%S')
-                zip_filename = f'backup_{timestamp}.zip'
-                zip_path = os.path.join(backup_dir, zip_filename)
-                
-                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                    # 添加所有JSON文件到ZIP
-                    zipf.write(backup_info_file, 'backup_info.json')
-                    zipf.write(users_file, 'users.json')
-                    zipf.write(appointments_file, 'appointments.json')
-                    zipf.write(profiles_file, 'profiles.json')
-                    zipf.write(profile_records_file, 'profile_records.json')
-                    zipf.write(daily_creations_file, 'daily_creations.json')
-                    zipf.write(announcements_file, 'announcements.json')
-                    zipf.write(processing_pools_file, 'processing_pools.json')
-                
-                print(f"备份完成，文件保存在: {zip_path}")
+
+                # 哪张表先导出完成就先压缩写入，压缩与其余表的导出同时进行
+                exported = {}
+                member_stats = {}
+                with zipfile.ZipFile(zip_path, 'w', compress_type, compresslevel=level) as zipf:
+                    for future in as_completed(futures):
+                        name, _, label, _, _ = futures[future]
+                        exported[name] = future.result()
+                        for member in (f'{name}.jsonl', f'{name}.ids', f'{name}.deleted'):
+                            member_path = os.path.join(temp_dir, member)
+                            if os.path.exists(member_path):
+                                DataBackupManager._write_member(zipf, member_path, member, member_stats)
+                        print(f"备份{label}: {exported[name]['records']} 条记录")
+
+                    # 备份信息最后写入，记录数来自导出过程
+                    record_counts = {name: exported[name]['records'] for name, *_ in tables}
+                    backup_info = {
+                        'backup_date': beijing_time.isoformat(),
+                        'django_version': django.get_version(),  # 使用django.get_version()获取版本
+                        'format': DataBackupManager.BACKUP_FORMAT,
+                        'backup_type': 'incremental' if base_info else 'full',
+                        'watermark': watermark.isoformat(),
+                        'since': since.isoformat() if since else None,
+                        'base_backup': base_filename,
+                        # 恢复时从完整备份开始依次重放
+                        'chain': (base_info.get('chain') or [base_filename]) + [zip_filename] if base_info else [zip_filename],
+                        'models_backed_up': list(record_counts.keys()),
+                        'record_counts': record_counts,
+                        'deleted_counts': {name: exported[name]['deleted'] for name, *_ in tables},
+                        'compression': DataBackupManager._compression_summary(codec, level, member_stats),
+                        'scheduled': scheduled,
+                        'timezone': 'Asia/Shanghai'
+                    }
+                    info_sha256 = DataBackupManager._write_backup_info(zipf, backup_info)
+
+                DataBackupManager._register_backup(zip_path, {
+                    **{member: stats['sha256'] for member, stats in member_stats.items()},
+                    'backup_info.json': info_sha256,
+                }, seconds=round(time.monotonic() - started, 3))
+                print(f"备份完成，用时 {time.monotonic() - started:.2f} 秒，文件保存在: {zip_path}")
                 return zip_path
-                
+
             except Exception as e:
                 print(f"备份过程中出错: {str(e)}")
+                executor.shutdown(cancel_futures=True)
+                # 不保留写了一半的备份文件
+                if os.path.exists(zip_path):
+                    os.remove(zip_path)
                 raise
-    
+
+    @staticmethod
+    def _iter_json_array(stream, chunk_size=64 * 1024):
+        """增量解析旧版整表JSON数组，每次只在内存中保留一小段文本"""
+        decoder = json.JSONDecoder()
+        buffer = ''
+        position = 0
+        eof = False
+
+        while True:
+            # 跳过数组起止符、分隔符和空白
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] in '[,]'):
+                position += 1
+
+            if position < len(buffer):
+                try:
+                    record, position = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                else:
+                    yield record
+                    continue
+            elif eof:
+                return
+
+            # 剩余文本不足以解析出完整记录，继续读取
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+    @staticmethod
+    def _read_records(zipf, name):
+        """从ZIP成员流中逐条读取一张表的原始记录，兼容JSONL格式和旧版JSON格式"""
+        members = set(zipf.namelist())
+
+        if f'{name}.jsonl' in members:
+            with zipf.open(f'{name}.jsonl') as raw, io.TextIOWrapper(raw, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            return
+
+        if f'{name}.json' in members:
+            with zipf.open(f'{name}.json') as raw, io.TextIOWrapper(raw, encoding='utf-8') as f:
+                yield from DataBackupManager._iter_json_array(f)
+
+    @staticmethod
+    def _resolve_user_keys(records, user_keys, missing_users):
+        """将以邮箱（自然键）表示的用户外键换成ID，避免反序列化时逐条查询用户
+
+        找不到的邮箱换成 None 并记入 missing_users[(模型, 主键, 字段)]，
+        由各表的外键校验按"关联用户不存在"处理。
+        """
+        user_fields = {}
+        for record in records:
+            model_label = record['model']
+            if model_label not in user_fields:
+                model = apps.get_model(model_label)
+                user_fields[model_label] = [
+                    field.name for field in model._meta.concrete_fields
+                    if field.is_relation and field.related_model is CustomUser
+                ]
+            fields = record['fields']
+            for field_name in user_fields[model_label]:
+                value = fields.get(field_name)
+                if isinstance(value, (list, tuple)):
+                    fields[field_name] = user_keys.get(value[0])
+                    if fields[field_name] is None:
+                        missing_users[(model_label, record.get('pk'), field_name)] = value[0]
+            yield record
+
+    @staticmethod
+    def _deserialize_table(zipf, name, user_keys=None, missing_users=None):
+        """反序列化一张表；传入 {邮箱: ID} 时在内存中解析用户外键"""
+        records = DataBackupManager._read_records(zipf, name)
+        if user_keys is not None:
+            records = DataBackupManager._resolve_user_keys(
+                records, user_keys, {} if missing_users is None else missing_users
+            )
+        yield from serializers.deserialize('python', records)
+
+    @staticmethod
+    def _load_ids(model):
+        """一次查询加载表中全部ID，用于在内存中校验外键"""
+        return set(model._base_manager.values_list('id', flat=True).iterator())
+
+    @staticmethod
+    def _bulk_upsert(model, objs):
+        """批量写入，主键已存在时更新，保留备份中的创建/更新时间
+
+        bulk_create 没有原始模式（raw），写入前会用当前时间覆盖 auto_now/auto_now_add 字段，
+        也会改写传入对象上的这些字段（写入失败时同样如此，逐条重试前需要还原）。
+        所以先记下备份中的时间，写入后用一条 executemany 的 UPDATE 按主键写回；
+        bulk_update 生成的 CASE WHEN 语句在大批量时慢得多（2 万条预约约 13 秒）。
+        """
+        opts = model._meta
+        fields = [f for f in opts.concrete_fields if not f.generated]
+        auto_fields = [f for f in fields if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)]
+        backup_times = [[getattr(obj, f.attname) for f in auto_fields] for obj in objs]
+        try:
+            model._base_manager.bulk_create(
+                objs,
+                update_conflicts=True,
+                unique_fields=[opts.pk.name],
+                update_fields=[f.name for f in fields if not f.primary_key],
+            )
+        finally:
+            for obj, values in zip(objs, backup_times):
+                for field, value in zip(auto_fields, values):
+                    setattr(obj, field.attname, value)
+
+        if auto_fields:
+            quote_name = connection.ops.quote_name
+            assignments = ', '.join(f'{quote_name(f.column)} = %s' for f in auto_fields)
+            sql = f'UPDATE {quote_name(opts.db_table)} SET {assignments} WHERE {quote_name(opts.pk.column)} = %s'
+            with connection.cursor() as cursor:
+                cursor.executemany(sql, [
+                    [field.get_db_prep_save(value, connection) for field, value in zip(auto_fields, values)]
+                    + [opts.pk.get_db_prep_save(obj.pk, connection)]
+                    for obj, values in zip(objs, backup_times)
+                ])
+
+    @staticmethod
+    def _restore_objects(model, objects, prepare, restore_stats, stats_key, error_label, describe=None, progress=None):
+        """按批恢复反序列化对象
+
+        prepare 在内存中校验/修正单条记录，返回 False 表示跳过（错误由其自行记录）。
+        整批写入失败时逐条重试，错误信息与逐条恢复时一致。
+        每写完一批通过 progress(表名, 已恢复记录数) 报告一次进度。
+        """
+        describe = describe or (lambda obj: f"ID: {obj.object.id}")
+
+        def flush(batch):
+            try:
+                with transaction.atomic():
+                    DataBackupManager._bulk_upsert(model, [obj.object for obj in batch])
+                    for obj in batch:
+                        # 多对多关系只在有数据时写入
+                        for accessor_name, object_list in (obj.m2m_data or {}).items():
+                            if object_list:
+                                getattr(obj.object, accessor_name).set(object_list)
+                restore_stats[stats_key] += len(batch)
+            except Exception:
+                for obj in batch:
+                    try:
+                        with transaction.atomic():
+                            obj.save()
+                        restore_stats[stats_key] += 1
+                    except Exception as e:
+                        restore_stats['errors'].append(f"{error_label} ({describe(obj)}): {str(e)}")
+            if progress is not None:
+                progress(stats_key, restore_stats[stats_key])
+
+        batch = []
+        for obj in objects:
+            if not prepare(obj):
+                continue
+            batch.append(obj)
+            if len(batch) >= DataBackupManager.RESTORE_BATCH_SIZE:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+        if progress is not None:
+            progress(stats_key, restore_stats[stats_key], done=True)
+
+    @staticmethod
+    def _apply_tombstones(zipf, restore_stats):
+        """增量备份：删除自基准备份以来已被删除的记录（子表在前，级联删除与原库一致）"""
+        members = set(zipf.namelist())
+        for name, get_queryset, _, _, key_field in reversed(DataBackupManager.BACKUP_TABLES):
+            if f'{name}.deleted' not in members:
+                continue
+            model = get_queryset().model
+            targets = model._base_manager.all()
+            if model is CustomUser:
+                # 不删除医师账号
+                targets = targets.filter(is_superuser=False)
+
+            def delete_batch(keys):
+                _, deleted_by_model = targets.filter(**{f'{key_field}__in': keys}).delete()
+                restore_stats['deleted'] += deleted_by_model.get(model._meta.label, 0)
+
+            keys = []
+            for key in DataBackupManager._iter_keys(zipf, f'{name}.deleted'):
+                keys.append(key)
+                if len(keys) >= DataBackupManager.RESTORE_BATCH_SIZE:
+                    delete_batch(keys)
+                    keys = []
+            if keys:
+                delete_batch(keys)
+
     @staticmethod
     @transaction.atomic
-    def restore_backup(backup_file):
+    def restore_backup(backup_file, progress=None):
         """
         恢复数据备份
         
         Args:
             backup_file: 上传的备份文件路径或文件对象
+            progress: 进度回调 progress(表名, 已恢复记录数, done=False)
         
         Returns:
             dict: 恢复统计信息
@@ -168,21 +552,18 @@ class DataBackupManager:
             'daily_creations': 0,
             'announcements': 0,
             'processing_pools': 0,
+            'deleted': 0,
             'errors': []
         }
         
-        with tempfile.TemporaryDirectory() as temp_dir:
+        # 直接从ZIP成员流中逐条读取，不解压到磁盘
+        with zipfile.ZipFile(backup_file, 'r') as zipf:
             try:
-                # 解压备份文件
-                with zipfile.ZipFile(backup_file, 'r') as zipf:
-                    zipf.extractall(temp_dir)
-                
                 # 读取备份信息
-                backup_info_path = os.path.join(temp_dir, 'backup_info.json')
-                if not os.path.exists(backup_info_path):
+                if 'backup_info.json' not in zipf.namelist():
                     raise ValueError("备份文件无效：缺少备份信息文件")
                 
-                with open(backup_info_path, 'r', encoding='utf-8') as f:
+                with zipf.open('backup_info.json') as f:
                     backup_info = json.load(f)
                 
                 # 解析备份时间
@@ -199,164 +580,138 @@ class DataBackupManager:
                     print("开始恢复备份，备份时间未知")
                 
                 # 1. 恢复用户数据
-                users_path = os.path.join(temp_dir, 'users.json')
-                if os.path.exists(users_path):
-                    with open(users_path, 'r', encoding='utf-8') as f:
-                        users_data = f.read()
-                    
-                    # 使用Django的反序列化
-                    for obj in serializers.deserialize('json', users_data):
-                        try:
-                            # 检查是否已存在相同邮箱的用户
-                            existing_user = CustomUser.objects.filter(email=obj.object.email).first()
-                            if existing_user:
-                                # 跳过超级用户账号
-                                if existing_user.is_superuser:
-                                    print(f"跳过医师账号: {obj.object.email}")
-                                    continue
-                                # 更新现有用户（包括密码）
-                                for field, value in obj.object.__dict__.items():
-                                    if field not in ['id', '_state']:  # 只排除id和_state
-                                        setattr(existing_user, field, value)
-                                existing_user.save()
-                            else:
-                                obj.save()
-                            restore_stats['users'] += 1
-                        except Exception as e:
-                            restore_stats['errors'].append(f"用户恢复错误 (邮箱: {obj.object.email}): {str(e)}")
-                
+                # 一次性加载现有账号，按邮箱匹配时不再逐条查询
+                existing_users = {
+                    email: (user_id, is_superuser)
+                    for email, user_id, is_superuser in CustomUser.objects.values_list(
+                        'email', 'id', 'is_superuser'
+                    ).iterator()
+                }
+
+                def prepare_user(obj):
+                    existing = existing_users.get(obj.object.email)
+                    if existing:
+                        user_id, is_superuser = existing
+                        # 跳过超级用户账号
+                        if is_superuser:
+                            print(f"跳过医师账号: {obj.object.email}")
+                            return False
+                        # 更新现有用户（包括密码），保留现有ID
+                        obj.object.pk = user_id
+                        obj.m2m_data = None
+                    return True
+
+                DataBackupManager._restore_objects(
+                    CustomUser, DataBackupManager._deserialize_table(zipf, 'users'),
+                    prepare_user, restore_stats, 'users', '用户恢复错误',
+                    describe=lambda obj: f"邮箱: {obj.object.email}", progress=progress
+                )
+                # 用户外键以邮箱（自然键）存储，在内存中换成ID
+                user_keys = dict(CustomUser.objects.values_list('email', 'id').iterator())
+                user_ids = set(user_keys.values())
+                missing_users = {}
+
+                def user_ref(obj, field_name):
+                    """错误信息中的用户标识：未能解析的显示备份中的邮箱"""
+                    user_id = getattr(obj.object, f'{field_name}_id')
+                    if user_id is None:
+                        return missing_users.get(
+                            (obj.object._meta.label_lower, obj.object.pk, field_name), user_id
+                        )
+                    return user_id
+
                 # 2. 恢复档案数据
-                profiles_path = os.path.join(temp_dir, 'profiles.json')
-                if os.path.exists(profiles_path):
-                    with open(profiles_path, 'r', encoding='utf-8') as f:
-                        profiles_data = f.read()
-                    
-                    for obj in serializers.deserialize('json', profiles_data):
-                        try:
-                            # 检查关联用户是否存在
-                            if obj.object.account:
-                                try:
-                                    # 确保用户对象存在
-                                    obj.object.account = CustomUser.objects.get(id=obj.object.account.id)
-                                except CustomUser.DoesNotExist:
-                                    # 用户不存在，设为None
-                                    obj.object.account = None
-                                    print(f"警告：档案 {obj.object.name} 的关联用户不存在，已解除关联")
-                            
-                            obj.save()
-                            restore_stats['profiles'] += 1
-                        except Exception as e:
-                            restore_stats['errors'].append(f"档案恢复错误 (ID: {obj.object.id}): {str(e)}")
-                
+                def prepare_profile(obj):
+                    # 关联用户不存在时解除关联
+                    if obj.object.account_id is not None and obj.object.account_id not in user_ids:
+                        obj.object.account_id = None
+                        print(f"警告：档案 {obj.object.name} 的关联用户不存在，已解除关联")
+                    return True
+
+                DataBackupManager._restore_objects(
+                    Profile, DataBackupManager._deserialize_table(zipf, 'profiles', user_keys, missing_users),
+                    prepare_profile, restore_stats, 'profiles', '档案恢复错误', progress=progress
+                )
+                profile_ids = DataBackupManager._load_ids(Profile)
+
                 # 3. 恢复档案记录数据
-                profile_records_path = os.path.join(temp_dir, 'profile_records.json')
-                if os.path.exists(profile_records_path):
-                    with open(profile_records_path, 'r', encoding='utf-8') as f:
-                        profile_records_data = f.read()
-                    
-                    for obj in serializers.deserialize('json', profile_records_data):
-                        try:
-                            # 检查关联档案是否存在
-                            try:
-                                obj.object.profile = Profile.objects.get(id=obj.object.profile.id)
-                            except Profile.DoesNotExist:
-                                restore_stats['errors'].append(f"档案记录恢复错误: 关联档案不存在 (ID: {obj.object.profile.id})")
-                                continue
-                            
-                            # 检查创建者是否存在
-                            try:
-                                obj.object.created_by = CustomUser.objects.get(id=obj.object.created_by.id)
-                            except CustomUser.DoesNotExist:
-                                restore_stats['errors'].append(f"档案记录恢复错误: 创建者用户不存在 (ID: {obj.object.created_by.id})")
-                                continue
-                            
-                            obj.save()
-                            restore_stats['profile_records'] += 1
-                        except Exception as e:
-                            restore_stats['errors'].append(f"档案记录恢复错误 (ID: {obj.object.id}): {str(e)}")
-                
+                def prepare_profile_record(obj):
+                    if obj.object.profile_id not in profile_ids:
+                        restore_stats['errors'].append(f"档案记录恢复错误: 关联档案不存在 (ID: {obj.object.profile_id})")
+                        return False
+                    if obj.object.created_by_id not in user_ids:
+                        restore_stats['errors'].append(f"档案记录恢复错误: 创建者用户不存在 (ID: {user_ref(obj, 'created_by')})")
+                        return False
+                    return True
+
+                DataBackupManager._restore_objects(
+                    ProfileRecord, DataBackupManager._deserialize_table(zipf, 'profile_records', user_keys, missing_users),
+                    prepare_profile_record, restore_stats, 'profile_records', '档案记录恢复错误', progress=progress
+                )
+
                 # 4. 恢复预约数据
-                appointments_path = os.path.join(temp_dir, 'appointments.json')
-                if os.path.exists(appointments_path):
-                    with open(appointments_path, 'r', encoding='utf-8') as f:
-                        appointments_data = f.read()
-                    
-                    for obj in serializers.deserialize('json', appointments_data):
-                        try:
-                            # 检查关联用户是否存在
-                            try:
-                                obj.object.guest = CustomUser.objects.get(id=obj.object.guest.id)
-                            except CustomUser.DoesNotExist:
-                                restore_stats['errors'].append(f"预约恢复错误: 关联用户不存在 (ID: {obj.object.guest.id})")
-                                continue
-                            
-                            obj.save()
-                            restore_stats['appointments'] += 1
-                        except Exception as e:
-                            restore_stats['errors'].append(f"预约恢复错误 (ID: {obj.object.id}): {str(e)}")
-                
+                def prepare_appointment(obj):
+                    if obj.object.guest_id not in user_ids:
+                        restore_stats['errors'].append(f"预约恢复错误: 关联用户不存在 (ID: {user_ref(obj, 'guest')})")
+                        return False
+                    # 旧版本备份没有 status 字段，按布尔字段推出（新备份中两者一致）
+                    appointment = obj.object
+                    appointment.status = Appointment.status_from_flags(
+                        appointment.is_responded, appointment.is_processed, appointment.is_urged, appointment.is_deleted
+                    )
+                    return True
+
+                DataBackupManager._restore_objects(
+                    Appointment, DataBackupManager._deserialize_table(zipf, 'appointments', user_keys, missing_users),
+                    prepare_appointment, restore_stats, 'appointments', '预约恢复错误', progress=progress
+                )
+                appointment_ids = DataBackupManager._load_ids(Appointment)
+
                 # 5. 恢复每日创建记录
-                daily_creations_path = os.path.join(temp_dir, 'daily_creations.json')
-                if os.path.exists(daily_creations_path):
-                    with open(daily_creations_path, 'r', encoding='utf-8') as f:
-                        daily_creations_data = f.read()
-                    
-                    for obj in serializers.deserialize('json', daily_creations_data):
-                        try:
-                            # 检查关联用户是否存在
-                            try:
-                                obj.object.user = CustomUser.objects.get(id=obj.object.user.id)
-                            except CustomUser.DoesNotExist:
-                                restore_stats['errors'].append(f"每日创建记录恢复错误: 关联用户不存在 (ID: {obj.object.user.id})")
-                                continue
-                            
-                            obj.save()
-                            restore_stats['daily_creations'] += 1
-                        except Exception as e:
-                            restore_stats['errors'].append(f"每日创建记录恢复错误 (ID: {obj.object.id}): {str(e)}")
-                
+                def prepare_daily_creation(obj):
+                    if obj.object.user_id not in user_ids:
+                        restore_stats['errors'].append(f"每日创建记录恢复错误: 关联用户不存在 (ID: {user_ref(obj, 'user')})")
+                        return False
+                    return True
+
+                DataBackupManager._restore_objects(
+                    DailyAppointmentCreation, DataBackupManager._deserialize_table(zipf, 'daily_creations', user_keys, missing_users),
+                    prepare_daily_creation, restore_stats, 'daily_creations', '每日创建记录恢复错误', progress=progress
+                )
+
                 # 6. 恢复公告数据
-                announcements_path = os.path.join(temp_dir, 'announcements.json')
-                if os.path.exists(announcements_path):
-                    with open(announcements_path, 'r', encoding='utf-8') as f:
-                        announcements_data = f.read()
-                    
-                    for obj in serializers.deserialize('json', announcements_data):
-                        try:
-                            # 检查创建者是否存在
-                            if obj.object.created_by:
-                                try:
-                                    obj.object.created_by = CustomUser.objects.get(id=obj.object.created_by.id)
-                                except CustomUser.DoesNotExist:
-                                    # 创建者不存在，设为None
-                                    obj.object.created_by = None
-                                    print(f"警告：公告 {obj.object.title} 的创建者不存在，已设为空")
-                            
-                            obj.save()
-                            restore_stats['announcements'] += 1
-                        except Exception as e:
-                            restore_stats['errors'].append(f"公告恢复错误 (ID: {obj.object.id}): {str(e)}")
-                
+                def prepare_announcement(obj):
+                    # 创建者不存在时设为空
+                    if obj.object.created_by_id is not None and obj.object.created_by_id not in user_ids:
+                        obj.object.created_by_id = None
+                        print(f"警告：公告 {obj.object.title} 的创建者不存在，已设为空")
+                    return True
+
+                DataBackupManager._restore_objects(
+                    Announcement, DataBackupManager._deserialize_table(zipf, 'announcements', user_keys, missing_users),
+                    prepare_announcement, restore_stats, 'announcements', '公告恢复错误', progress=progress
+                )
+
                 # 7. 恢复处理池数据
-                processing_pools_path = os.path.join(temp_dir, 'processing_pools.json')
-                if os.path.exists(processing_pools_path):
-                    with open(processing_pools_path, 'r', encoding='utf-8') as f:
-                        processing_pools_data = f.read()
-                    
-                    for obj in serializers.deserialize('json', processing_pools_data):
-                        try:
-                            # 检查关联预约是否存在
-                            try:
-                                obj.object.appointment = Appointment.objects.get(id=obj.object.appointment.id)
-                            except Appointment.DoesNotExist:
-                                restore_stats['errors'].append(f"处理池恢复错误: 关联预约不存在 (ID: {obj.object.appointment.id})")
-                                continue
-                            
-                            obj.save()
-                            restore_stats['processing_pools'] += 1
-                        except Exception as e:
-                            restore_stats['errors'].append(f"处理池恢复错误 (ID: {obj.object.id}): {str(e)}")
-                
+                def prepare_processing_pool(obj):
+                    if obj.object.appointment_id not in appointment_ids:
+                        restore_stats['errors'].append(f"处理池恢复错误: 关联预约不存在 (ID: {obj.object.appointment_id})")
+                        return False
+                    return True
+
+                DataBackupManager._restore_objects(
+                    DoctorProcessingPool, DataBackupManager._deserialize_table(zipf, 'processing_pools'),
+                    prepare_processing_pool, restore_stats, 'processing_pools', '处理池恢复错误', progress=progress
+                )
+
+                # 8. 增量备份：删除自基准备份以来已删除的记录
+                DataBackupManager._apply_tombstones(zipf, restore_stats)
+
+                DataBackupManager._reset_sequences()
+
+                # 提交后再清除缓存，避免并发请求读到旧数据后重新写入缓存
+                transaction.on_commit(DataBackupManager.invalidate_caches)
+
                 print(f"恢复完成: {restore_stats}")
                 return restore_stats
                 
@@ -365,23 +720,395 @@ class DataBackupManager:
                 restore_stats['errors'].append(f"恢复过程错误: {str(e)}")
                 raise
     
+    @staticmethod
+    def _reset_sequences():
+        """恢复的记录沿用备份中的主键，PostgreSQL 的自增序列不会随之前进；
+        把各表的序列调整到当前最大主键，之后新建记录才不会主键冲突（SQLite 不需要，没有语句）
+        """
+        statements = connection.ops.sequence_reset_sql(no_style(), [
+            CustomUser, Appointment, Profile, ProfileRecord,
+            DailyAppointmentCreation, Announcement, DoctorProcessingPool
+        ])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+    
+    @staticmethod
+    def restore_chain(filename, progress=None):
+        """恢复服务器上的备份：按备份链依次重放完整备份及其后的增量备份，数据库快照直接整库恢复
+
+        progress 为恢复进度回调，参见 restore_backup
+
+        Returns:
+            dict: 合计的恢复统计信息
+        """
+        backup_dir = DataBackupManager.get_backup_directory()
+        backup_path = os.path.join(backup_dir, filename)
+        backup_info = DataBackupManager.read_backup_info(backup_path)
+        if backup_info.get('backup_type') == 'snapshot':
+            chain = [filename]
+        else:
+            chain = [os.path.basename(name) for name in backup_info.get('chain') or [filename]]
+
+        missing = [name for name in chain if not os.path.exists(os.path.join(backup_dir, name))]
+        if missing:
+            raise ValueError(f"备份链不完整，缺少: {', '.join(missing)}")
+
+        # 重放前先校验整条备份链，避免恢复到一半才发现文件损坏
+        for name in chain:
+            result = DataBackupManager.verify_backup(name)
+            if not result['ok']:
+                raise ValueError(f"备份文件 {name} 校验失败: {'; '.join(result['errors'])}")
+
+        if backup_info.get('backup_type') == 'snapshot':
+            return DataBackupManager.restore_snapshot(backup_path)
+
+        total_stats = None
+        with transaction.atomic():
+            for name in chain:
+                print(f"重放备份: {name}")
+                restore_stats = DataBackupManager.restore_backup(os.path.join(backup_dir, name), progress=progress)
+                if total_stats is None:
+                    total_stats = restore_stats
+                    continue
+                for key, value in restore_stats.items():
+                    total_stats[key] += value
+        return total_stats
+
+    @staticmethod
+    def invalidate_caches():
+        """恢复数据后清除依赖数据库内容的缓存（批量写入不会触发模型信号）"""
+        from .account_index import AccountAutocompleteIndex
+        from .queue_manager import AppointmentQueueManager
+        from .work_buffer import DoctorWorkBuffer
+
+        AppointmentQueueManager.invalidate_queue()
+        DoctorWorkBuffer.invalidate()
+        AccountAutocompleteIndex.invalidate()
+
+    @staticmethod
+    def _get_sqlite_path():
+        """获取SQLite数据库文件路径，其他数据库不支持快照备份"""
+        database = settings.DATABASES['default']
+        if database['ENGINE'] != 'django.db.backends.sqlite3':
+            raise ValueError("数据库快照仅支持SQLite数据库")
+        return str(database['NAME'])
+
+    @staticmethod
+    def create_snapshot(vacuum=True, codec=None, level=None, scheduled=False):
+        """
+        创建数据库快照：用SQLite在线备份接口按页复制整个数据库，不经过ORM
+        返回快照文件的路径
+
+        Args:
+            vacuum: 是否同时整理碎片（VACUUM INTO，一次读取生成紧凑副本）
+            codec: 压缩方式（同 create_backup），stored 打包最快
+            level: 压缩级别
+            scheduled: 是否为定时备份（同 create_backup）
+        """
+        codec, compress_type, level = DataBackupManager._resolve_codec(codec, level)
+        db_path = DataBackupManager._get_sqlite_path()
+        backup_dir = DataBackupManager.get_backup_directory()
+
+        # 获取北京时间
+        beijing_tz = pytz.timezone('Asia/Shanghai')
+        beijing_time = datetime.now(beijing_tz)
+        timestamp = beijing_time.strftime('%Y%m%d_%H%M%S')
+        zip_path = os.path.join(backup_dir, f'snapshot_{timestamp}.zip')
+
+        started = time.monotonic()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            snapshot_path = os.path.join(temp_dir, 'db.sqlite3')
+
+            # 两种方式都在一个读事务内完成，得到一致的快照，不阻塞其他连接读取
+            source = sqlite3.connect(db_path, timeout=30)
+            try:
+                if vacuum:
+                    source.execute('VACUUM INTO ?', (snapshot_path,))
+                else:
+                    target = sqlite3.connect(snapshot_path)
+                    try:
+                        source.backup(target)
+                    finally:
+                        target.close()
+            finally:
+                source.close()
+            copied = time.monotonic()
+
+            try:
+                member_stats = {}
+                with zipfile.ZipFile(zip_path, 'w', compress_type, compresslevel=level) as zipf:
+                    DataBackupManager._write_member(zipf, snapshot_path, 'db.sqlite3', member_stats)
+                    backup_info = {
+                        'backup_date': beijing_time.isoformat(),
+                        'django_version': django.get_version(),
+                        'format': 'sqlite',
+                        'backup_type': 'snapshot',
+                        'database_size': os.path.getsize(db_path),
+                        'snapshot_size': os.path.getsize(snapshot_path),
+                        'vacuumed': vacuum,
+                        'copy_seconds': round(copied - started, 3),
+                        'compression': DataBackupManager._compression_summary(codec, level, member_stats),
+                        'scheduled': scheduled,
+                        'timezone': 'Asia/Shanghai'
+                    }
+                    info_sha256 = DataBackupManager._write_backup_info(zipf, backup_info)
+                DataBackupManager._register_backup(zip_path, {
+                    'db.sqlite3': member_stats['db.sqlite3']['sha256'],
+                    'backup_info.json': info_sha256,
+                }, seconds=round(time.monotonic() - started, 3))
+            except Exception:
+                if os.path.exists(zip_path):
+                    os.remove(zip_path)
+                raise
+
+        print(f"数据库快照完成，复制用时 {copied - started:.2f} 秒，文件保存在: {zip_path}")
+        return zip_path
+
+    @staticmethod
+    def restore_snapshot(backup_file):
+        """
+        从数据库快照恢复整个数据库
+
+        快照先解出为临时文件并校验，再用在线备份接口整库覆盖当前数据库。
+        与直接替换文件相比，其他进程已打开的连接会看到新数据，WAL日志也不会错配。
+
+        Args:
+            backup_file: 快照文件路径或文件对象
+
+        Returns:
+            dict: 恢复后的各表记录数（与逻辑恢复的统计格式一致）
+        """
+        db_path = DataBackupManager._get_sqlite_path()
+
+        with zipfile.ZipFile(backup_file, 'r') as zipf, tempfile.TemporaryDirectory() as temp_dir:
+            if 'db.sqlite3' not in zipf.namelist():
+                raise ValueError("备份文件无效：不是数据库快照")
+            snapshot_path = zipf.extract('db.sqlite3', temp_dir)
+
+            snapshot = sqlite3.connect(snapshot_path)
+            try:
+                if snapshot.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+                    raise ValueError("快照文件已损坏")
+
+                # 数据库结构必须与当前版本一致，否则恢复后代码无法使用
+                snapshot_migrations = set(snapshot.execute('SELECT app, name FROM django_migrations'))
+                current_migrations = set(MigrationRecorder(connection).applied_migrations())
+                if snapshot_migrations != current_migrations:
+                    raise ValueError("快照的数据库结构与当前版本不一致，请先迁移到相同版本后再恢复")
+
+                connections.close_all()
+                live = sqlite3.connect(db_path, timeout=30)
+                try:
+                    snapshot.backup(live)
+                finally:
+                    live.close()
+            finally:
+                snapshot.close()
+
+        DataBackupManager.invalidate_caches()
+        restore_stats = DataBackupManager.get_database_info()
+        restore_stats.update({'deleted': 0, 'errors': []})
+        print(f"数据库快照恢复完成: {restore_stats}")
+        return restore_stats
+
+    @staticmethod
+    def _sha256_file(fileobj):
+        """按块计算文件对象的SHA-256"""
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: fileobj.read(DataBackupManager.HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _catalog_path():
+        return os.path.join(DataBackupManager.get_backup_directory(), DataBackupManager.CATALOG_FILENAME)
+
+    @staticmethod
+    def _load_catalog():
+        """读取目录索引：{文件名: 条目}，索引丢失或损坏时返回空目录，由 list_backups 重新登记"""
+        try:
+            with open(DataBackupManager._catalog_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _save_catalog(catalog):
+        """原子写入目录索引"""
+        path = DataBackupManager._catalog_path()
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(catalog, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _build_catalog_entry(zip_path, member_hashes=None):
+        """生成备份文件的目录条目
+
+        member_hashes 为写入时计算的成员校验和；没有时（旧备份补登记）解压各成员计算。
+        """
+        stat = os.stat(zip_path)
+        member_hashes = member_hashes or {}
+        with zipfile.ZipFile(zip_path, 'r') as zipf:
+            with zipf.open('backup_info.json') as f:
+                backup_info = json.load(f)
+            members = {}
+            for zip_info in zipf.infolist():
+                sha256 = member_hashes.get(zip_info.filename)
+                if sha256 is None:
+                    with zipf.open(zip_info) as f:
+                        sha256 = DataBackupManager._sha256_file(f)
+                members[zip_info.filename] = {
+                    'size': zip_info.file_size,
+                    'compressed_size': zip_info.compress_size,
+                    'sha256': sha256,
+                }
+        with open(zip_path, 'rb') as f:
+            archive_sha256 = DataBackupManager._sha256_file(f)
+
+        return {
+            'filename': os.path.basename(zip_path),
+            'size': stat.st_size,
+            'created_time': stat.st_ctime,
+            'modified_time': stat.st_mtime,
+            'sha256': archive_sha256,
+            'backup_type': backup_info.get('backup_type', 'full'),
+            'codec': (backup_info.get('compression') or {}).get('codec'),
+            'record_counts': backup_info.get('record_counts', {}),
+            'backup_info': backup_info,
+            'members': members,
+            'seconds': None,
+        }
+
+    @staticmethod
+    def _register_backup(zip_path, member_hashes=None, seconds=None):
+        """把备份文件登记到目录索引，seconds 为创建备份的总用时"""
+        entry = DataBackupManager._build_catalog_entry(zip_path, member_hashes)
+        entry['seconds'] = seconds
+        with DataBackupManager._catalog_lock:
+            catalog = DataBackupManager._load_catalog()
+            catalog[entry['filename']] = entry
+            DataBackupManager._save_catalog(catalog)
+        return entry
+
+    @staticmethod
+    def _sync_catalog():
+        """目录索引与备份目录对齐：补登记索引中没有的备份（旧版本创建或手动放入），移除已不存在的文件
+
+        Returns:
+            dict: 目录索引；无法读取的备份文件不登记，条目中 backup_info 为 None
+        """
+        backup_dir = DataBackupManager.get_backup_directory()
+        filenames = {filename for filename in os.listdir(backup_dir) if filename.endswith('.zip')}
+
+        with DataBackupManager._catalog_lock:
+            catalog = DataBackupManager._load_catalog()
+            changed = False
+            for filename in catalog.keys() - filenames:
+                del catalog[filename]
+                changed = True
+
+            unreadable = {}
+            for filename in filenames - catalog.keys():
+                filepath = os.path.join(backup_dir, filename)
+                try:
+                    catalog[filename] = DataBackupManager._build_catalog_entry(filepath)
+                    changed = True
+                except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+                    print(f"无法登记备份文件 {filename}: {str(e)}")
+                    stat = os.stat(filepath)
+                    unreadable[filename] = {
+                        'filename': filename,
+                        'size': stat.st_size,
+                        'created_time': stat.st_ctime,
+                        'modified_time': stat.st_mtime,
+                        'sha256': None,
+                        'backup_type': None,
+                        'codec': None,
+                        'record_counts': {},
+                        'backup_info': None,
+                        'members': {},
+                        'seconds': None,
+                    }
+            if changed:
+                DataBackupManager._save_catalog(catalog)
+
+        return {**catalog, **unreadable}
+
+    @staticmethod
+    def get_backup_entry(filename):
+        """获取备份文件的目录条目（大小、记录数、压缩方式、校验和和备份信息），不存在时返回 None"""
+        entry = DataBackupManager._load_catalog().get(filename)
+        if entry is None and os.path.exists(os.path.join(DataBackupManager.get_backup_directory(), filename)):
+            entry = DataBackupManager._sync_catalog().get(filename)
+        return entry
+
+    @staticmethod
+    def verify_backup(filename, deep=False):
+        """
+        校验备份文件，不执行恢复
+
+        先比对文件大小和整个文件的SHA-256（顺序读一遍，很快）；
+        不一致或 deep=True 时逐个解压成员比对SHA-256，找出损坏的成员。
+
+        Returns:
+            dict: {'filename', 'ok', 'errors', 'seconds'}
+        """
+        started = time.monotonic()
+        entry = DataBackupManager.get_backup_entry(filename)
+        if entry is None:
+            raise ValueError(f"备份文件不存在: {filename}")
+
+        errors = []
+        filepath = os.path.join(DataBackupManager.get_backup_directory(), filename)
+        if entry['sha256'] is None:
+            errors.append("备份文件无法读取")
+        elif os.path.getsize(filepath) != entry['size']:
+            errors.append("文件大小与目录记录不一致")
+        else:
+            with open(filepath, 'rb') as f:
+                if DataBackupManager._sha256_file(f) != entry['sha256']:
+                    errors.append("文件校验和与目录记录不一致")
+
+        if entry['sha256'] is not None and (errors or deep):
+            try:
+                with zipfile.ZipFile(filepath, 'r') as zipf:
+                    names = set(zipf.namelist())
+                    for name, member in entry['members'].items():
+                        if name not in names:
+                            errors.append(f"缺少成员: {name}")
+                            continue
+                        try:
+                            with zipf.open(name) as f:
+                                if DataBackupManager._sha256_file(f) != member['sha256']:
+                                    errors.append(f"成员校验和不一致: {name}")
+                        except DataBackupManager.DECOMPRESS_ERRORS as e:
+                            errors.append(f"成员无法解压: {name} ({str(e)})")
+            except (zipfile.BadZipFile, OSError) as e:
+                errors.append(f"不是有效的ZIP文件: {str(e)}")
+
+        return {
+            'filename': filename,
+            'ok': not errors,
+            'errors': errors,
+            'seconds': round(time.monotonic() - started, 3),
+        }
+
     @staticmethod
     def list_backups():
-        """列出所有备份文件"""
+        """列出所有备份文件（读取目录索引，不逐个打开备份文件）"""
         backup_dir = DataBackupManager.get_backup_directory()
         backups = []
-        
-        for filename in os.listdir(backup_dir):
-            if filename.endswith('.zip'):
-                filepath = os.path.join(backup_dir, filename)
-                stat = os.stat(filepath)
-                backups.append({
-                    'filename': filename,
-                    'path': filepath,
-                    'size': stat.st_size,
-                    'created_time': datetime.fromtimestamp(stat.st_ctime),
-                    'modified_time': datetime.fromtimestamp(stat.st_mtime),
-                })
+
+        for filename, entry in DataBackupManager._sync_catalog().items():
+            backups.append({
+                **entry,
+                'path': os.path.join(backup_dir, filename),
+                'created_time': datetime.fromtimestamp(entry['created_time']),
+                'modified_time': datetime.fromtimestamp(entry['modified_time']),
+            })
         
         # 按修改时间倒序排序
         backups.sort(key=lambda x: x['modified_time'], reverse=True)
@@ -395,9 +1122,57 @@ class DataBackupManager:
         
         if os.path.exists(filepath):
             os.remove(filepath)
+            with DataBackupManager._catalog_lock:
+                catalog = DataBackupManager._load_catalog()
+                if catalog.pop(filename, None) is not None:
+                    DataBackupManager._save_catalog(catalog)
             return True
         return False
     
+    @staticmethod
+    def apply_retention(keep_daily, keep_weekly):
+        """
+        按保留策略清理旧的定时备份：保留最近 keep_daily 天每天最新的一个定时备份、
+        最近 keep_weekly 周每周最新的一个定时备份，其余定时备份删除
+
+        只清理定时备份（备份信息中 scheduled 为 True，包括定时的数据库快照）：
+        手动创建的备份、快照和旧版本创建的备份不参与按天/按周挑选，也不会被删除，需要手动删除；
+        同一天手动创建的备份也不会顶替当天的定时备份。
+        保留的备份和所有手动备份依赖的备份链（增量备份的完整备份及之前的增量备份）一并保留。
+        无法读取的文件（可能正在写入）不会被删除。
+
+        Returns:
+            list: 删除的备份文件名
+        """
+        beijing_tz = pytz.timezone('Asia/Shanghai')
+        backups = [backup for backup in DataBackupManager.list_backups() if backup['backup_info'] is not None]
+        scheduled = [backup for backup in backups if backup['backup_info'].get('scheduled')]
+
+        # list_backups 按修改时间倒序，每天/每周第一个出现的即为最新的备份
+        keep = {backup['filename'] for backup in backups if not backup['backup_info'].get('scheduled')}
+        days, weeks = set(), set()
+        for backup in scheduled:
+            day = datetime.fromtimestamp(backup['modified_time'].timestamp(), beijing_tz).date()
+            week = tuple(day.isocalendar())[:2]
+            if day not in days and len(days) < keep_daily:
+                days.add(day)
+                keep.add(backup['filename'])
+            if week not in weeks and len(weeks) < keep_weekly:
+                weeks.add(week)
+                keep.add(backup['filename'])
+
+        for backup in backups:
+            if backup['filename'] in keep:
+                keep.update(os.path.basename(name) for name in backup['backup_info'].get('chain') or [])
+
+        removed = []
+        for backup in scheduled:
+            if backup['filename'] not in keep and DataBackupManager.delete_backup(backup['filename']):
+                removed.append(backup['filename'])
+        if removed:
+            print(f"按保留策略删除旧备份: {', '.join(removed)}")
+        return removed
+
     @staticmethod
     def get_database_info():
         """获取数据库统计信息"""
@@ -3,32 +3,16 @@ from .models import Appointment
 def doctor_stats(request):
     """为所有医师模板提供统计数据"""
     if request.user.is_authenticated and request.user.is_superuser:
-        # 计算统计数据
-        urge_count = Appointment.objects.filter(
-            is_urged=True,
-            is_processed=False,
-            is_deleted=False
-        ).count()
+        # 计算统计数据（按状态计数，都只读 status 索引）
+        urge_count = Appointment.objects.filter(status=Appointment.STATUS_URGED).count()
         
-        unresponded_count = Appointment.objects.filter(
-            is_responded=False,
-            is_processed=False,
-            is_deleted=False
-        ).exclude(is_urged=True).count()
+        unresponded_count = Appointment.objects.filter(status=Appointment.STATUS_PENDING).count()
         
-        unprocessed_count = Appointment.objects.filter(
-            is_urged=False,
-            is_responded=True,
-            is_processed=False,
-            is_deleted=False
-        ).count()
+        unprocessed_count = Appointment.objects.filter(status=Appointment.STATUS_RESPONDED).count()
         
-        processed_count = Appointment.objects.filter(
-            is_processed=True,
-            is_deleted=False
-        ).count()
+        processed_count = Appointment.objects.filter(status=Appointment.STATUS_PROCESSED).count()
         
-        all_count = Appointment.objects.filter(is_deleted=False).count()
+        all_count = Appointment.objects.filter(status__lt=Appointment.STATUS_DELETED).count()
         
         return {
             'urge_count': urge_count,
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 新建 SQLite 连接时执行的 PRAGMA（可用 settings.SQLITE_PRAGMAS 覆盖，值为 None 表示不设置该项）
+# journal_mode 写入数据库文件，对所有连接生效；其余各项只对当前连接有效，所以每个连接都要设置
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # 读写互不阻塞：读取的是提交时的快照，写入追加到 WAL 文件
+    'synchronous': 'NORMAL',  # WAL 模式下只在检查点时同步到磁盘；断电最多丢失最近的提交，不会损坏数据库
+    'busy_timeout': 10000,  # 写锁被占用时最多等待10秒（毫秒），而不是立即报 database is locked
+    'mmap_size': 256 * 1024 * 1024,  # 用内存映射读取数据库文件（最多256MB），减少读取时的复制
+    'cache_size': -32000,  # 每个连接的页缓存约32MB（负数的单位为KB）
+    'temp_store': 'MEMORY',  # 排序、临时索引放在内存中
+}
+
+def get_sqlite_pragmas():
+    """合并默认 PRAGMA 与 settings.SQLITE_PRAGMAS"""
+    pragmas = dict(SQLITE_PRAGMAS)
+    pragmas.update(getattr(settings, 'SQLITE_PRAGMAS', {}))
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+def apply_sqlite_pragmas(cursor, pragmas=None):
+    """在 SQLite 游标上执行 PRAGMA（Django 连接和 sqlite3 连接的游标都可以）"""
+    for name, value in (get_sqlite_pragmas() if pragmas is None else pragmas).items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """新建数据库连接时设置 SQLite 参数（配合 CONN_MAX_AGE，每个连接只执行一次）"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_sqlite_pragmas(cursor)
+    logger.debug(f"SQLite 连接已初始化: {connection.alias}")
@@ -0,0 +1,122 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils import timezone
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = 'replica'
+
+# 当前代码是否请求使用只读副本（协程、线程各自独立；线程池中的线程不继承，需要在线程内重新进入）
+_replica_requested = ContextVar('use_replica', default=False)
+
+@contextmanager
+def use_replica():
+    """在此范围内的只读查询发往只读副本（也可用作装饰器 @use_replica()）
+
+    只用于可以接受短暂延迟的报表、统计和导出；副本未配置、不可用或延迟超过
+    REPLICA_MAX_LAG 时仍使用主库。写入始终发往主库。
+    """
+    token = _replica_requested.set(True)
+    try:
+        yield
+    finally:
+        _replica_requested.reset(token)
+
+class ReplicaMonitor:
+    """只读副本状态：读取副本上的复制心跳计算延迟，结果在进程内缓存 REPLICA_CHECK_INTERVAL 秒"""
+
+    _lock = threading.Lock()
+    _checked_at = None  # time.monotonic()
+    _synced_at = None  # 副本上的心跳时间，副本不可用时为 None
+    _available = None
+
+    @staticmethod
+    def is_configured():
+        return REPLICA_ALIAS in settings.DATABASES
+
+    @classmethod
+    def beat(cls):
+        """在主库上更新复制心跳（由调度进程定时执行）"""
+        from .models import ReplicationHeartbeat
+        ReplicationHeartbeat.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            pk=1, defaults={'beat_at': timezone.now()}
+        )
+
+    @classmethod
+    def _read_heartbeat(cls):
+        from .models import ReplicationHeartbeat
+        try:
+            return ReplicationHeartbeat.objects.using(REPLICA_ALIAS).filter(pk=1).values_list(
+                'beat_at', flat=True
+            ).first()
+        except DatabaseError as e:
+            logger.warning(f"只读副本不可用: {e}")
+            connections[REPLICA_ALIAS].close()
+            return None
+
+    @classmethod
+    def get_replica(cls):
+        """返回可用的只读副本 (别名, 副本数据的时间点)
+
+        Returns:
+            tuple | None: 未配置、不可用、没有心跳或延迟超过 REPLICA_MAX_LAG 秒时返回 None
+        """
+        if not cls.is_configured():
+            return None
+
+        with cls._lock:
+            now = time.monotonic()
+            if cls._checked_at is None or now - cls._checked_at >= getattr(settings, 'REPLICA_CHECK_INTERVAL', 5):
+                cls._synced_at = cls._read_heartbeat()
+                cls._checked_at = now
+            synced_at = cls._synced_at
+
+            # 两次检查之间延迟按当前时间计算，只会偏大
+            lag = (timezone.now() - synced_at).total_seconds() if synced_at else None
+            available = lag is not None and lag <= getattr(settings, 'REPLICA_MAX_LAG', 60)
+            if available != cls._available:
+                cls._available = available
+                if available:
+                    logger.info(f"只读副本可用，延迟 {lag:.1f} 秒")
+                else:
+                    logger.warning(f"只读副本{'不可用' if lag is None else f'延迟 {lag:.1f} 秒'}，只读查询改用主库")
+
+        return (REPLICA_ALIAS, synced_at) if available else None
+
+    @classmethod
+    def reset(cls):
+        """清除缓存的检查结果，下一次查询时重新检查"""
+        with cls._lock:
+            cls._checked_at = None
+            cls._synced_at = None
+
+class ReplicaRouter:
+    """数据库路由：use_replica() 范围内的读取发往只读副本，其余查询使用主库
+
+    设置在 settings.DATABASE_ROUTERS 中，没有配置副本时不改变任何查询。
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_requested.get():
+            replica = ReplicaMonitor.get_replica()
+            if replica is not None:
+                return replica[0]
+        # 不指定：默认使用主库，从副本读出的对象的关联查询仍在副本上
+        return None
+
+    def db_for_write(self, model, **hints):
+        # 从副本读出的对象保存时也写入主库
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本与主库是同一份数据
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 副本的表结构随复制（或 sync_replica）从主库得到
+        return db == DEFAULT_DB_ALIAS
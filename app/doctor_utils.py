@@ -1,11 +1,58 @@
 from .queue_manager import AppointmentQueueManager
 from .models import Appointment
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 
 class DoctorQueueManager:
     """医师队列管理器（使用新的队列系统）"""
 
+    # 状态转换表：操作 -> (允许的当前状态, 目标状态)。预约状态只能通过 transition 修改
+    TRANSITIONS = {
+        'respond': ((Appointment.STATUS_PENDING,), Appointment.STATUS_RESPONDED),
+        'urge': ((Appointment.STATUS_RESPONDED,), Appointment.STATUS_URGED),  # 访客催单
+        'resolve_urge': ((Appointment.STATUS_URGED,), Appointment.STATUS_RESPONDED),  # 医师处理催单
+        'process': (
+            (Appointment.STATUS_PENDING, Appointment.STATUS_RESPONDED, Appointment.STATUS_URGED),
+            Appointment.STATUS_PROCESSED
+        ),
+        'delete': (
+            (Appointment.STATUS_PENDING, Appointment.STATUS_RESPONDED,
+             Appointment.STATUS_URGED, Appointment.STATUS_PROCESSED),
+            Appointment.STATUS_DELETED
+        ),
+    }
+
+    @staticmethod
+    def can_transition(appointment, action):
+        """预约当前状态是否允许该操作"""
+        return appointment.status in DoctorQueueManager.TRANSITIONS[action][0]
+
+    @staticmethod
+    def transition(appointment, action):
+        """按状态转换表修改预约状态（只修改内存中的对象，由调用方保存）
+
+        Returns:
+            list: 被修改的字段名
+
+        Raises:
+            ValueError: 当前状态不允许该操作
+        """
+        allowed, target = DoctorQueueManager.TRANSITIONS[action]
+        if appointment.status not in allowed:
+            raise ValueError(
+                f"预约 #{appointment.id} 当前状态为“{appointment.get_status_display()}”，不能执行 {action} 操作"
+            )
+        return appointment.set_status(target)
+
+    @staticmethod
+    def lock_appointment(appointment_id):
+        """在事务中重新读取并锁定预约
+
+        缓存中的预约对象可能已过期（如已被其他医师处理），修改前应以数据库中的状态为准。
+        """
+        return Appointment.objects.select_for_update().get(id=appointment_id)
+
     @staticmethod
     def fresh(appointment):
         AppointmentQueueManager.handle_appointment_change(appointment)
@@ -14,21 +61,12 @@ class DoctorQueueManager:
     @staticmethod
     def get_urge_appointment():
         """处理催单：查找ID最小的标记为催单的预约"""
-        return Appointment.objects.filter(
-            is_urged=True,
-            is_responded=True,
-            is_processed=False,
-            is_deleted=False
-        ).order_by('id').first()
+        return Appointment.objects.filter(status=Appointment.STATUS_URGED).order_by('id').first()
     
     @staticmethod
     def get_unresponded_appointment():
         """回应预约：查找ID最小且未回应的预约"""
-        return Appointment.objects.filter(
-            is_responded=False,
-            is_processed=False,
-            is_deleted=False
-        ).order_by('id').first()
+        return Appointment.objects.filter(status=Appointment.STATUS_PENDING).order_by('id').first()
     
     @staticmethod
     def get_next_processing_appointment():
@@ -74,20 +112,20 @@ class DoctorQueueManager:
     
     @staticmethod
     def process_appointment(appointment, annotation='', note=''):
-        """处理预约的通用方法"""
-        if not appointment.is_responded:
-            # 如果未回应，先标记为已回应
-            appointment.is_responded = True
+        """处理预约的通用方法（未回应的预约可以直接处理）"""
+        # 标记为已处理（当前状态不允许时抛出 ValueError，不做任何修改）
+        update_fields = DoctorQueueManager.transition(appointment, 'process')
         
         # 更新批注和备注
         if annotation is not None:
             appointment.annotation = annotation
+            update_fields.append('annotation')
         if note is not None:
             appointment.note = note
+            update_fields.append('note')
         
-        # 标记为已处理
-        appointment.is_processed = True
-        appointment.save()
+        # 只写入修改过的字段，不覆盖其他请求同时修改的字段
+        appointment.save(update_fields=update_fields + ['updated_at'])
         
         # 添加到处理池
         DoctorQueueManager.add_to_processing_pool(appointment)
@@ -102,18 +140,22 @@ class DoctorQueueManager:
     
     @staticmethod
     def urge_appointment(appointment, annotation='', note='', priority=None):
+        """处理催单：回到已回应状态，留在处理队列中"""
+        update_fields = DoctorQueueManager.transition(appointment, 'resolve_urge')
+
         if priority is not None:
             appointment.priority = priority
+            update_fields.append('priority')
 
         # 更新批注和备注
         if annotation is not None:
             appointment.annotation = annotation
+            update_fields.append('annotation')
         if note is not None:
             appointment.note = note
+            update_fields.append('note')
         
-        # 标记为已回应
-        appointment.is_urged = False
-        appointment.save()
+        appointment.save(update_fields=update_fields + ['updated_at'])
 
         AppointmentQueueManager.handle_appointment_change(appointment)
         
@@ -122,34 +164,132 @@ class DoctorQueueManager:
     @staticmethod
     def delete_appointment(appointment):
         # 软删除：标记为已删除，记录删除时间
-        appointment.is_deleted = True
+        update_fields = DoctorQueueManager.transition(appointment, 'delete')
         appointment.deleted_at = timezone.now()
-        appointment.save()
+        appointment.save(update_fields=update_fields + ['deleted_at', 'updated_at'])
         AppointmentQueueManager.handle_appointment_change(appointment)
         return appointment
 
+    @staticmethod
+    def delete_guest_appointments(guest):
+        """软删除访客的全部预约（删除账号时使用）
+
+        Returns:
+            int: 删除的预约数量
+        """
+        allowed, target = DoctorQueueManager.TRANSITIONS['delete']
+        now = timezone.now()
+        count = Appointment.objects.filter(guest=guest, status__in=allowed).update(
+            status=target,
+            deleted_at=now,
+            updated_at=now,
+            **Appointment.STATUS_FLAGS[target]
+        )
+        AppointmentQueueManager.invalidate_queue()
+        return count
     
     @staticmethod
     def respond_appointment(appointment, annotation='', note='', priority=None):
         """回应预约的通用方法"""
+        update_fields = DoctorQueueManager.transition(appointment, 'respond')
+
         # 更新优先级（如果提供）
         if priority is not None:
             appointment.priority = priority
+            update_fields.append('priority')
         
         # 更新批注和备注
         if annotation is not None:
             appointment.annotation = annotation
+            update_fields.append('annotation')
         if note is not None:
             appointment.note = note
+            update_fields.append('note')
         
-        # 标记为已回应
-        appointment.is_responded = True
-        appointment.save()
+        appointment.save(update_fields=update_fields + ['updated_at'])
 
         AppointmentQueueManager.handle_appointment_change(appointment)
         
         return appointment
     
+    # 批量操作对应的状态转换（可作用的预约即转换表中允许的当前状态）
+    BULK_ACTION_TRANSITIONS = {
+        'respond': 'respond',
+        'process': 'process',
+        'urge': 'resolve_urge',
+    }
+
+    @staticmethod
+    def bulk_action(action, appointment_ids, annotation='', note='', priority=None):
+        """批量回应/处理/催单：一个事务内 bulk_update，队列只失效一次
+
+        Returns:
+            list: 实际被更新的预约（不符合条件的ID会被忽略）
+        """
+        from .models import DoctorProcessingPool
+
+        if action not in DoctorQueueManager.BULK_ACTION_TRANSITIONS:
+            raise ValueError(f"不支持的批量操作: {action}")
+        transition = DoctorQueueManager.BULK_ACTION_TRANSITIONS[action]
+
+        with transaction.atomic():
+            appointments = list(
+                Appointment.objects.select_for_update().select_related('guest').filter(
+                    id__in=appointment_ids,
+                    status__in=DoctorQueueManager.TRANSITIONS[transition][0]
+                ).order_by('id')
+            )
+            if not appointments:
+                return []
+
+            update_fields = []
+            if annotation is not None:
+                update_fields.append('annotation')
+            if note is not None:
+                update_fields.append('note')
+            if priority is not None and action != 'process':
+                update_fields.append('priority')
+
+            # bulk_update 不会触发 auto_now，显式更新修改时间
+            update_fields.append('updated_at')
+            now = timezone.now()
+
+            for appointment in appointments:
+                appointment.updated_at = now
+                if annotation is not None:
+                    appointment.annotation = annotation
+                if note is not None:
+                    appointment.note = note
+                if priority is not None and action != 'process':
+                    appointment.priority = priority
+                status_fields = DoctorQueueManager.transition(appointment, transition)
+
+            Appointment.objects.bulk_update(appointments, update_fields + status_fields)
+
+            if action == 'process':
+                # 批量加入处理池（跳过已在池中的预约）
+                pooled_ids = set(DoctorProcessingPool.objects.filter(
+                    appointment__in=appointments,
+                    is_removed=False
+                ).values_list('appointment_id', flat=True))
+                DoctorProcessingPool.objects.bulk_create([
+                    DoctorProcessingPool(appointment=appointment)
+                    for appointment in appointments
+                    if appointment.id not in pooled_ids
+                ])
+
+                # 以最后处理的非4级预约更新轮询起点
+                last_priority = next(
+                    (app.priority for app in reversed(appointments) if app.priority != 4),
+                    None
+                )
+                if last_priority is not None:
+                    AppointmentQueueManager.update_last_processed_priority(last_priority)
+
+        AppointmentQueueManager.invalidate_queue()
+
+        return appointments
+
     @staticmethod
     def get_queue_stats():
         """获取队列统计信息"""
@@ -0,0 +1,180 @@
+from django.conf import settings
+from django.core.mail import get_connection, EmailMultiAlternatives
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import timedelta
+from .models import EmailOutbox
+import threading
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+class EmailOutboxManager:
+    """邮件发件箱管理器：请求内只写入发件箱，由后台任务复用SMTP连接统一发送"""
+
+    BATCH_SIZE = 50
+    MAX_ATTEMPTS = 5
+    RETRY_BASE_SECONDS = 60  # 重试间隔：60秒、120秒、240秒……
+    CLAIM_TIMEOUT = 600  # 领取后10分钟未完成视为发送进程中断
+
+    _drain_lock = threading.Lock()
+
+    @classmethod
+    def _build(cls, subject, message, recipient_list, html_message=None, from_email=None):
+        return EmailOutbox(
+            subject=subject,
+            body=message,
+            html_body=html_message or '',
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            recipients=list(recipient_list),
+        )
+
+    @classmethod
+    def enqueue(cls, subject, message, recipient_list, html_message=None, from_email=None):
+        """写入一封待发邮件（随当前事务提交），提交后唤醒后台发送"""
+        outbox = cls._build(subject, message, recipient_list, html_message, from_email)
+        outbox.save()
+        transaction.on_commit(cls.wake_worker)
+        return outbox
+
+    @classmethod
+    def enqueue_many(cls, email_messages, wake=True):
+        """批量写入待发邮件
+
+        Args:
+            email_messages: (subject, message, recipient_list, html_message) 元组列表
+            wake: 提交后是否立即唤醒后台发送；管理命令中应为 False，交给发送进程处理
+        """
+        outboxes = EmailOutbox.objects.bulk_create([
+            cls._build(*email_message) for email_message in email_messages
+        ], batch_size=500)
+        if outboxes and wake:
+            transaction.on_commit(cls.wake_worker)
+        return outboxes
+
+    @classmethod
+    def wake_worker(cls):
+        """在后台线程中发送待发邮件（同一进程内只运行一个发送线程）"""
+        if not cls._drain_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                cls.deliver_pending()
+            except Exception as e:
+                logger.error(f"后台发送邮件失败: {e}")
+            finally:
+                cls._drain_lock.release()
+                connection.close()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    @classmethod
+    def _claim_batch(cls, batch_size):
+        """领取一批到期的待发邮件，避免多个进程重复发送"""
+        now = timezone.now()
+
+        # 回收发送进程中断后遗留的邮件
+        EmailOutbox.objects.filter(
+            status='sending',
+            claimed_at__lt=now - timedelta(seconds=cls.CLAIM_TIMEOUT)
+        ).update(status='pending', claim_token='')
+
+        due_ids = list(EmailOutbox.objects.filter(
+            status='pending',
+            next_attempt_at__lte=now
+        ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:batch_size])
+        if not due_ids:
+            return []
+
+        token = uuid.uuid4().hex
+        EmailOutbox.objects.filter(id__in=due_ids, status='pending').update(
+            status='sending', claim_token=token, claimed_at=now
+        )
+        return list(EmailOutbox.objects.filter(claim_token=token, status='sending'))
+
+    @classmethod
+    def deliver_pending(cls, batch_size=None, max_batches=None):
+        """发送到期的待发邮件，失败的按指数退避重试，超过次数后标记为发送失败
+
+        Returns:
+            dict: 发送统计 {'sent', 'retried', 'dead'}
+        """
+        batch_size = batch_size or cls.BATCH_SIZE
+        stats = {'sent': 0, 'retried': 0, 'dead': 0}
+        mail_connection = None
+        batches = 0
+
+        try:
+            while max_batches is None or batches < max_batches:
+                outboxes = cls._claim_batch(batch_size)
+                if not outboxes:
+                    break
+                batches += 1
+
+                if mail_connection is None:
+                    mail_connection = get_connection()
+                    try:
+                        mail_connection.open()
+                    except Exception as e:
+                        # 连接失败时逐封重试，由重试机制处理
+                        logger.warning(f"SMTP连接失败: {e}")
+
+                for outbox in outboxes:
+                    cls._deliver_one(outbox, mail_connection, stats)
+        finally:
+            if mail_connection is not None:
+                try:
+                    mail_connection.close()
+                except Exception:
+                    pass
+
+        if any(stats.values()):
+            logger.info(f"邮件发送完成: 成功 {stats['sent']}，待重试 {stats['retried']}，失败 {stats['dead']}")
+        return stats
+
+    @classmethod
+    def _deliver_one(cls, outbox, mail_connection, stats):
+        message = EmailMultiAlternatives(
+            subject=outbox.subject,
+            body=outbox.body,
+            from_email=outbox.from_email or settings.DEFAULT_FROM_EMAIL,
+            to=outbox.recipients,
+            connection=mail_connection,
+        )
+        if outbox.html_body:
+            message.attach_alternative(outbox.html_body, 'text/html')
+
+        outbox.attempts += 1
+        try:
+            message.send()
+        except Exception as e:
+            outbox.last_error = str(e)
+            if outbox.attempts >= cls.MAX_ATTEMPTS:
+                outbox.status = 'dead'
+                stats['dead'] += 1
+                logger.error(f"邮件发送失败已放弃 (ID: {outbox.id}): {e}")
+            else:
+                outbox.status = 'pending'
+                outbox.next_attempt_at = timezone.now() + timedelta(
+                    seconds=cls.RETRY_BASE_SECONDS * 2 ** (outbox.attempts - 1)
+                )
+                stats['retried'] += 1
+                logger.warning(f"邮件发送失败，稍后重试 (ID: {outbox.id}): {e}")
+            # 连接可能已断开，重新建立连接供后续邮件复用
+            try:
+                mail_connection.close()
+                mail_connection.open()
+            except Exception:
+                pass
+        else:
+            outbox.status = 'sent'
+            outbox.sent_at = timezone.now()
+            outbox.last_error = ''
+            stats['sent'] += 1
+
+        outbox.claim_token = ''
+        outbox.save(update_fields=[
+            'status', 'attempts', 'next_attempt_at', 'last_error', 'claim_token', 'sent_at'
+        ])
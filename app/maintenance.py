@@ -0,0 +1,178 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from datetime import timedelta
+from .models import Appointment, DoctorProcessingPool, DailyAppointmentCreation
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MaintenanceManager:
+    """低峰期维护任务：清理热点表中不再需要的行，由调度进程定时执行，不在请求中运行
+
+    每个任务按主键分块处理，每块一个短事务，不长时间占用写锁；
+    整体受时间预算限制，超时后停止，剩余部分留到下一次执行。
+    """
+
+    CHUNK_SIZE = 500
+    TIME_BUDGET = 300  # 一次维护的总时长上限（秒）
+    DAILY_CREATION_KEEP_DAYS = 30  # 每日创建记录只用于当天计数，保留30天便于排查
+
+    @staticmethod
+    def _run_chunked(task, queryset, action, deadline):
+        """按块处理 queryset 中的记录
+
+        Args:
+            task: 任务名称（用于统计和日志）
+            queryset: 待处理的记录，每块重新查询前 CHUNK_SIZE 条的主键
+            action: action(主键列表) 处理一块并返回处理的行数，在事务中执行
+            deadline: time.monotonic() 截止时间
+
+        Returns:
+            dict: {'task', 'processed', 'chunks', 'seconds', 'complete'}
+        """
+        started = time.monotonic()
+        processed = 0
+        chunks = 0
+        complete = False
+        while time.monotonic() < deadline:
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:MaintenanceManager.CHUNK_SIZE])
+            if not ids:
+                complete = True
+                break
+            with transaction.atomic():
+                processed += action(ids)
+            chunks += 1
+            if len(ids) < MaintenanceManager.CHUNK_SIZE:
+                complete = True
+                break
+
+        metrics = {
+            'task': task,
+            'processed': processed,
+            'chunks': chunks,
+            'seconds': round(time.monotonic() - started, 3),
+            'complete': complete,
+        }
+        logger.info(
+            f"维护任务 {task}: 处理 {processed} 行，{chunks} 块，用时 {metrics['seconds']} 秒"
+            f"{'' if complete else '，超出时间预算，剩余部分下次继续'}"
+        )
+        return metrics
+
+    @staticmethod
+    def _deadline(time_budget):
+        return time.monotonic() + (MaintenanceManager.TIME_BUDGET if time_budget is None else time_budget)
+
+    @staticmethod
+    def reset_modification_counts(deadline=None):
+        """重置最后修改日期不是今天的预约的每日修改次数
+
+        按本地日期（北京时间）比较，与 __date 查询一致；凌晨执行时UTC日期还是前一天。
+        """
+        today = timezone.localdate()
+        queryset = Appointment.objects.exclude(
+            last_modified_at__date=today
+        ).filter(today_modified_count__gt=0)
+
+        def action(ids):
+            # 批量更新不会触发 auto_now，显式更新修改时间，增量备份才能带上这些变化
+            return Appointment.objects.filter(pk__in=ids).update(today_modified_count=0, updated_at=timezone.now())
+
+        return MaintenanceManager._run_chunked(
+            'reset_modification_counts', queryset, action, deadline or MaintenanceManager._deadline(None)
+        )
+
+    @staticmethod
+    def purge_deleted_appointments(deadline=None):
+        """彻底删除昨天及更早软删除的预约（处理池中的关联记录级联删除）"""
+        yesterday = timezone.now().date() - timedelta(days=1)
+        queryset = Appointment.objects.filter(status=Appointment.STATUS_DELETED, deleted_at__date__lte=yesterday)
+
+        def action(ids):
+            _, deleted_by_model = Appointment.objects.filter(pk__in=ids).delete()
+            return deleted_by_model.get(Appointment._meta.label, 0)
+
+        return MaintenanceManager._run_chunked(
+            'purge_deleted_appointments', queryset, action, deadline or MaintenanceManager._deadline(None)
+        )
+
+    @staticmethod
+    def compact_processing_pool(deadline=None):
+        """删除处理池中已移除的记录（页面只显示未移除的记录）"""
+        queryset = DoctorProcessingPool.objects.filter(is_removed=True)
+
+        def action(ids):
+            _, deleted_by_model = DoctorProcessingPool.objects.filter(pk__in=ids).delete()
+            return deleted_by_model.get(DoctorProcessingPool._meta.label, 0)
+
+        return MaintenanceManager._run_chunked(
+            'compact_processing_pool', queryset, action, deadline or MaintenanceManager._deadline(None)
+        )
+
+    @staticmethod
+    def prune_daily_creations(deadline=None):
+        """删除 DAILY_CREATION_KEEP_DAYS 天前的每日创建记录（只有当天的记录参与计数）"""
+        cutoff = timezone.now().date() - timedelta(days=MaintenanceManager.DAILY_CREATION_KEEP_DAYS)
+        queryset = DailyAppointmentCreation.objects.filter(creation_date__lt=cutoff)
+
+        def action(ids):
+            _, deleted_by_model = DailyAppointmentCreation.objects.filter(pk__in=ids).delete()
+            return deleted_by_model.get(DailyAppointmentCreation._meta.label, 0)
+
+        return MaintenanceManager._run_chunked(
+            'prune_daily_creations', queryset, action, deadline or MaintenanceManager._deadline(None)
+        )
+
+    @staticmethod
+    def optimize_database(deadline=None):
+        """SQLite：更新查询规划器的统计信息（PRAGMA optimize），并把 WAL 文件合并回数据库后截断
+
+        连接长期保持（CONN_MAX_AGE）时不会在关闭连接时执行 optimize，由维护任务定期执行；
+        有读连接一直打开时 WAL 文件不会自动截断，低峰期截断一次。
+        """
+        started = time.monotonic()
+        processed = 0
+        # 前面的任务已用完时间预算时留到下一次
+        run = connection.vendor == 'sqlite' and started < (deadline or MaintenanceManager._deadline(None))
+        if run:
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA optimize')
+                # 返回 (是否被阻塞, WAL 页数, 已合并页数)
+                cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                row = cursor.fetchone()
+                processed = row[2] if row and row[2] > 0 else 0
+
+        metrics = {
+            'task': 'optimize_database',
+            'processed': processed,
+            'chunks': 1 if run else 0,
+            'seconds': round(time.monotonic() - started, 3),
+            'complete': run or connection.vendor != 'sqlite',
+        }
+        logger.info(f"维护任务 optimize_database: 合并 WAL {processed} 页，用时 {metrics['seconds']} 秒")
+        return metrics
+
+    @staticmethod
+    def run_all(time_budget=None):
+        """依次执行全部维护任务，共用一个时间预算
+
+        Returns:
+            list: 各任务的统计信息
+        """
+        deadline = MaintenanceManager._deadline(time_budget)
+        started = time.monotonic()
+        results = [
+            task(deadline) for task in (
+                MaintenanceManager.reset_modification_counts,
+                MaintenanceManager.purge_deleted_appointments,
+                MaintenanceManager.compact_processing_pool,
+                MaintenanceManager.prune_daily_creations,
+                MaintenanceManager.optimize_database,
+            )
+        ]
+        logger.info(
+            f"维护完成，总用时 {time.monotonic() - started:.1f} 秒，"
+            f"处理 {sum(result['processed'] for result in results)} 行"
+        )
+        return results
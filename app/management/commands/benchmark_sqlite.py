@@ -0,0 +1,149 @@
+from django.core.management.base import BaseCommand
+from app.db_connection import get_sqlite_pragmas, apply_sqlite_pragmas
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+class Command(BaseCommand):
+    help = '对比默认 SQLite 配置与调优配置（WAL、busy_timeout、持久连接等）的并发读写性能（使用临时数据库，不影响现有数据）'
+
+    # 对比的两种配置：
+    # default: 原来的配置——回滚日志、延迟事务、每个请求新建连接（CONN_MAX_AGE=0）
+    # tuned: 当前配置——db_connection 中的 PRAGMA、IMMEDIATE 事务、持久连接
+    PROFILES = ('default', 'tuned')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=5, help='每种配置的运行时长（秒）')
+        parser.add_argument('--readers', type=int, default=4, help='读线程数（模拟访客页面和医师统计）')
+        parser.add_argument('--writers', type=int, default=2, help='写线程数（模拟医师处理预约）')
+        parser.add_argument('--rows', type=int, default=20000, help='测试表的行数')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            results = []
+            for profile in self.PROFILES:
+                path = os.path.join(temp_dir, f'{profile}.sqlite3')
+                self._create_database(path, options['rows'])
+                results.append(self._run(profile, path, options))
+
+        self.stdout.write(f"{'配置':<10}{'读/秒':>10}{'写/秒':>10}{'锁错误':>8}{'写P95(ms)':>12}")
+        for result in results:
+            self.stdout.write(
+                f"{result['profile']:<10}{result['reads_per_second']:>10.0f}{result['writes_per_second']:>10.0f}"
+                f"{result['lock_errors']:>8}{result['write_p95_ms']:>12.1f}"
+            )
+        default, tuned = results
+        if default['reads_per_second'] and default['writes_per_second']:
+            self.stdout.write(self.style.SUCCESS(
+                f"读取 {tuned['reads_per_second'] / default['reads_per_second']:.1f} 倍，"
+                f"写入 {tuned['writes_per_second'] / default['writes_per_second']:.1f} 倍"
+            ))
+
+    def _create_database(self, path, rows):
+        """建立与预约表查询模式相近的测试表"""
+        conn = sqlite3.connect(path)
+        conn.execute(
+            'CREATE TABLE appointment (id INTEGER PRIMARY KEY, status INTEGER NOT NULL, '
+            'priority INTEGER NOT NULL, demand TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX appointment_status ON appointment (status, priority, id)')
+        conn.executemany(
+            'INSERT INTO appointment (status, priority, demand, updated_at) VALUES (?, ?, ?, ?)',
+            ((random.choice((10, 20, 30, 40, 40, 40, 90)), random.randint(1, 4), 'x' * 200, time.time())
+             for _ in range(rows))
+        )
+        conn.commit()
+        conn.close()
+
+    def _connect(self, profile, path):
+        # isolation_level=None：事务由下面显式的 BEGIN 控制，与 Django 的 autocommit 行为一致
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        if profile == 'tuned':
+            apply_sqlite_pragmas(conn.cursor(), get_sqlite_pragmas())
+        return conn
+
+    def _run(self, profile, path, options):
+        if profile == 'default':
+            conn = sqlite3.connect(path)
+            conn.execute('PRAGMA journal_mode = DELETE')
+            conn.close()
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'reads': 0, 'writes': 0, 'lock_errors': 0, 'write_latencies': []}
+        persistent = profile == 'tuned'
+        begin = 'BEGIN IMMEDIATE' if profile == 'tuned' else 'BEGIN'
+        max_id = options['rows']
+
+        def read(conn):
+            # 医师统计和分页：按状态计数，读一页记录
+            conn.execute('SELECT COUNT(*) FROM appointment WHERE status = ?', (random.choice((10, 20, 30)),)).fetchone()
+            start = random.randint(1, max_id)
+            conn.execute('SELECT * FROM appointment WHERE id >= ? ORDER BY id LIMIT 20', (start,)).fetchall()
+
+        def write(conn):
+            # 处理预约：事务内先读后写（与 DoctorQueueManager 的批量操作相同）
+            conn.execute(begin)
+            try:
+                row = conn.execute(
+                    'SELECT id FROM appointment WHERE status = 20 AND id >= ? ORDER BY id LIMIT 1',
+                    (random.randint(1, max_id),)
+                ).fetchone()
+                conn.execute(
+                    'UPDATE appointment SET status = ?, updated_at = ? WHERE id = ?',
+                    (random.choice((20, 30, 40)), time.time(), row[0] if row else 1)
+                )
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+        def worker(kind):
+            conn = self._connect(profile, path) if persistent else None
+            while not stop.is_set():
+                started = time.monotonic()
+                try:
+                    # 不保持连接时每次操作（一个请求）新建连接
+                    request_conn = conn or self._connect(profile, path)
+                    try:
+                        (read if kind == 'read' else write)(request_conn)
+                    finally:
+                        if conn is None:
+                            request_conn.close()
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e) and 'busy' not in str(e):
+                        raise
+                    with lock:
+                        stats['lock_errors'] += 1
+                    continue
+                with lock:
+                    if kind == 'read':
+                        stats['reads'] += 1
+                    else:
+                        stats['writes'] += 1
+                        stats['write_latencies'].append(time.monotonic() - started)
+            if conn is not None:
+                conn.close()
+
+        threads = [threading.Thread(target=worker, args=('read',)) for _ in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('write',)) for _ in range(options['writers'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        latencies = sorted(stats['write_latencies'])
+        return {
+            'profile': profile,
+            'reads_per_second': stats['reads'] / elapsed,
+            'writes_per_second': stats['writes'] / elapsed,
+            'lock_errors': stats['lock_errors'],
+            'write_p95_ms': latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0,
+        }
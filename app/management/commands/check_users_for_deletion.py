@@ -1,13 +1,11 @@
-import os
-import sys
-import django
+import time
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from datetime import datetime, timedelta
-from django.conf import settings
-from django.core.mail import send_mail
+from django.db import transaction
+from django.db.models import Q, Exists, OuterRef
 from app.models import CustomUser, Appointment
-from django.db.models import Q
+from app.mail_outbox import EmailOutboxManager
+from app.db_router import use_replica
 import logging
 
 # 设置日志
@@ -17,70 +15,98 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = '每月1日检查用户账户，标记无未处理预约的账户为待删除并发送通知邮件'
     
+    # 在主库上按主键分批更新，每批一条 IN 查询
+    CHUNK_SIZE = 500
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只统计将被标记和通知的账户，不写入数据库、不发送邮件')
+        parser.add_argument('--force', action='store_true', help='忽略日期检查，非1号也执行')
+    
     def handle(self, *args, **options):
+        dry_run = options['dry_run']
         today = timezone.now().date()
         
         # 检查是否是每月1日
-        if today.day != 1:
+        if today.day != 1 and not options['force']:
             self.stdout.write(f"今天不是1号，跳过检查。今天是：{today}")
             return
         
-        self.stdout.write(f"开始执行每月1日的账户检查...")
+        self.stdout.write(f"开始执行每月1日的账户检查{'（试运行）' if dry_run else ''}...")
+        started = time.monotonic()
+        
+        now = timezone.now()
+        month_start = timezone.localtime(now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
-        # 获取所有普通用户（非超级用户/医师）
-        users = CustomUser.objects.filter(is_superuser=False, is_staff=False)
+        # 候选账户：普通用户中没有未处理预约（不包括已删除的）的账户，一次子查询完成
+        unprocessed_appointments = Appointment.objects.filter(
+            guest=OuterRef('pk'),
+            is_processed=False,
+            is_deleted=False
+        )
+        candidates = CustomUser.objects.filter(
+            is_superuser=False,
+            is_staff=False
+        ).filter(~Exists(unprocessed_appointments))
         
-        marked_count = 0
-        notified_count = 0
+        # 需要通知的账户：新标记的，或本月还没有通知过的
+        notify_filter = (
+            Q(to_be_deleted=False) |
+            Q(to_be_deleted_notified_at__isnull=True) |
+            Q(to_be_deleted_notified_at__lt=month_start)
+        )
         
-        for user in users:
-            try:
-                # 检查用户是否有未处理的预约（不包括已删除的）
-                has_unprocessed_appointments = Appointment.objects.filter(
-                    guest=user,
-                    is_processed=False,
-                    is_deleted=False
-                ).exists()
-                
-                if not has_unprocessed_appointments:
-                    # 标记为待删除
-                    if not user.to_be_deleted:
-                        user.to_be_deleted = True
-                        user.to_be_deleted_notified_at = timezone.now()
-                        user.save()
-                        marked_count += 1
-                    
-                    # 发送通知邮件（如果本月还没发送过）
-                    # 检查本月是否已发送过通知
-                    if (not user.to_be_deleted_notified_at or 
-                        user.to_be_deleted_notified_at.month != today.month or
-                        user.to_be_deleted_notified_at.year != today.year):
-                        
-                        self.send_deletion_notification_email(user)
-                        user.to_be_deleted_notified_at = timezone.now()
-                        user.save()
-                        notified_count += 1
-                        
-                        self.stdout.write(f"已通知用户 {user.email} 账户将被删除")
-                    else:
-                        self.stdout.write(f"用户 {user.email} 本月已收到通知，跳过重复通知")
-                        
-            except Exception as e:
-                logger.error(f"处理用户 {user.email} 时出错: {e}")
-                self.stdout.write(f"处理用户 {user.email} 时出错: {e}")
+        # 扫描全部账户的查询在只读副本上执行（未配置或延迟过大时仍用主库），只取主键
+        with use_replica():
+            candidate_ids = list(candidates.values_list('pk', flat=True))
+        query_seconds = time.monotonic() - started
         
+        if dry_run:
+            with use_replica():
+                marked_count = candidates.filter(to_be_deleted=False).count()
+                notify_emails = list(candidates.filter(notify_filter).values_list('email', flat=True))
+            self.stdout.write(f"将标记 {marked_count} 个待删除账户，将通知 {len(notify_emails)} 个账户")
+            for email in notify_emails[:20]:
+                self.stdout.write(f"  将通知: {email}")
+            if len(notify_emails) > 20:
+                self.stdout.write(f"  ……其余 {len(notify_emails) - 20} 个账户省略")
+            self.stdout.write(f"查询耗时 {query_seconds:.2f} 秒")
+            return
+        
+        with transaction.atomic():
+            # 在主库上按主键分批更新；条件在主库上重新判断，副本同步后新建了预约或已被通知的账户不会被误标记
+            notify_emails = []
+            marked_count = 0
+            for i in range(0, len(candidate_ids), self.CHUNK_SIZE):
+                chunk = candidates.filter(pk__in=candidate_ids[i:i + self.CHUNK_SIZE])
+                to_notify = chunk.filter(notify_filter)
+                notify_emails.extend(to_notify.values_list('email', flat=True))
+                # 先记录通知时间，再标记待删除
+                to_notify.update(to_be_deleted_notified_at=now)
+                marked_count += chunk.filter(to_be_deleted=False).update(to_be_deleted=True)
+            update_seconds = time.monotonic() - started - query_seconds
+            
+            # 通知邮件批量写入发件箱，由邮件发送任务复用连接发送
+            EmailOutboxManager.enqueue_many([
+                self.build_deletion_notification_email(email) for email in notify_emails
+            ], wake=False)
+        
+        total_seconds = time.monotonic() - started
+        self.stdout.write(
+            f"耗时：查询 {query_seconds:.2f} 秒，更新 {update_seconds:.2f} 秒，"
+            f"写入邮件 {total_seconds - query_seconds - update_seconds:.2f} 秒，共 {total_seconds:.2f} 秒"
+        )
         self.stdout.write(
             self.style.SUCCESS(
-                f"检查完成！标记了 {marked_count} 个待删除账户，发送了 {notified_count} 封通知邮件"
+                f"检查完成！标记了 {marked_count} 个待删除账户，{len(notify_emails)} 封通知邮件已加入发送队列"
             )
         )
     
-    def send_deletion_notification_email(self, user):
-        """发送账户即将被删除的通知邮件"""
+    def build_deletion_notification_email(self, email):
+        """构建账户即将被删除的通知邮件 (subject, message, recipient_list, html_message)"""
         subject = '【缥缈旅】您的账户即将被删除'
         
         message = f'''
-亲爱的用户 {user.email}：
+亲爱的用户 {email}：
 
 伯里欧斯的小助手检查发现，您的账户目前没有未处理的预约。
 
@@ -95,15 +121,4 @@ class Command(BaseCommand):
 伯里欧斯的小助理
         '''
         
-        try:
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
-            return True
-        except Exception as e:
-            logger.error(f"发送删除通知邮件失败: {e}")
-            return False
\ No newline at end of file
+        return subject, message, [email], None
@@ -1,9 +1,7 @@
-import os
-import sys
-import django
+import time
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from django.utils import timezone
-from datetime import datetime
 from app.models import CustomUser
 import logging
 
@@ -11,19 +9,27 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class Command(BaseCommand):
-    help = '每月7日删除标记为待删除的账户'
+    help = '每月7日删除标记为待删除的账户（分批删除，中断后重新执行即可继续删除剩余账户）'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200, help='每批删除的账户数量，每批为一个独立事务')
+        parser.add_argument('--pause', type=float, default=0.1, help='每批之间的暂停时间（秒），让出数据库给网站请求')
+        parser.add_argument('--force', action='store_true', help='忽略日期检查，非7号也执行')
     
     def handle(self, *args, **options):
         today = timezone.now().date()
         
         # 检查是否是每月7日
-        if today.day != 7:
+        if today.day != 7 and not options['force']:
             self.stdout.write(f"今天不是7号，跳过删除。今天是：{today}")
             return
         
         self.stdout.write(f"开始执行每月7日的账户删除...")
         
-        # 获取所有标记为待删除的账户
+        batch_size = options['batch_size']
+        started = time.monotonic()
+        
+        # 标记为待删除的账户；登录后标记会被清除，因此每批删除时重新检查
         users_to_delete = CustomUser.objects.filter(
             to_be_deleted=True,
             is_superuser=False,
@@ -31,23 +37,58 @@ class Command(BaseCommand):
         )
         
         deleted_count = 0
+        related_count = 0
+        failed_batches = 0
+        # 本次执行内按ID顺序推进，失败的批次跳过（保留待删除标记）；进度不需要持久化：
+        # 已删除的账户不会再被查到，中断或失败后重新执行命令即从剩余的标记账户继续
+        last_id = 0
         
-        for user in users_to_delete:
+        while True:
+            batch = list(
+                users_to_delete.filter(id__gt=last_id).order_by('id').values_list('id', 'email')[:batch_size]
+            )
+            if not batch:
+                break
+            
+            batch_ids = [user_id for user_id, _ in batch]
+            last_id = batch_ids[-1]
+            batch_started = time.monotonic()
+            
             try:
-                # 记录用户信息（可选，用于审计）
-                user_email = user.email
-                user_date_joined = user.date_joined
-                
-                # 删除用户
-                user.delete()
-                deleted_count += 1
-                
-                self.stdout.write(f"已删除用户: {user_email} (注册时间: {user_date_joined})")
-                
+                # 每批一个短事务，由Django按批级联删除预约、档案、记录等关联数据
+                with transaction.atomic():
+                    total, per_model = users_to_delete.filter(id__in=batch_ids).delete()
             except Exception as e:
-                logger.error(f"删除用户 {user.email} 时出错: {e}")
-                self.stdout.write(f"删除用户 {user.email} 时出错: {e}")
+                failed_batches += 1
+                logger.error(f"删除账户批次 (ID {batch_ids[0]}-{last_id}) 时出错: {e}")
+                self.stdout.write(f"删除账户批次 (ID {batch_ids[0]}-{last_id}) 时出错: {e}")
+                continue
+            
+            batch_deleted = per_model.get(CustomUser._meta.label, 0)
+            deleted_count += batch_deleted
+            related_count += total - batch_deleted
+            
+            batch_seconds = time.monotonic() - batch_started
+            self.stdout.write(
+                f"已删除 {batch_deleted} 个账户（关联数据 {total - batch_deleted} 条），"
+                f"已处理到 ID={last_id}，耗时 {batch_seconds:.2f} 秒"
+            )
+            if options['verbosity'] >= 2:
+                for _, email in batch:
+                    self.stdout.write(f"  已删除用户: {email}")
+            
+            if options['pause']:
+                time.sleep(options['pause'])
         
+        elapsed = time.monotonic() - started
+        rate = deleted_count / elapsed if elapsed > 0 else 0
+        self.stdout.write(
+            f"耗时 {elapsed:.2f} 秒，平均 {rate:.1f} 个账户/秒，关联数据共 {related_count} 条"
+        )
+        if failed_batches:
+            self.stdout.write(
+                self.style.WARNING(f"{failed_batches} 个批次删除失败，这些账户仍保留待删除标记，可重新执行命令继续删除")
+            )
         self.stdout.write(
             self.style.SUCCESS(f"删除完成！共删除了 {deleted_count} 个账户")
-        )
\ No newline at end of file
+        )
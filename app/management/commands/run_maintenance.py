@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from app.maintenance import MaintenanceManager
+
+class Command(BaseCommand):
+    help = '执行低峰期维护任务（重置修改次数、清理已删除预约、压缩处理池、清理每日创建记录、优化数据库）'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--time-budget', type=int, default=MaintenanceManager.TIME_BUDGET,
+            help='总时长上限（秒），超出部分下次继续'
+        )
+
+    def handle(self, *args, **options):
+        results = MaintenanceManager.run_all(time_budget=options['time_budget'])
+
+        for result in results:
+            self.stdout.write(
+                f"{result['task']}: 处理 {result['processed']} 行，{result['chunks']} 块，"
+                f"用时 {result['seconds']} 秒{'' if result['complete'] else '（未完成）'}"
+            )
+        self.stdout.write(self.style.SUCCESS("维护完成"))
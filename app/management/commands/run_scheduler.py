@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand, CommandError
+from app import scheduler
+
+class Command(BaseCommand):
+    help = '运行定时任务调度进程（账户检查/删除、邮件发送、定时备份等），部署时只启动一个'
+
+    def handle(self, *args, **options):
+        self.stdout.write("启动调度进程...")
+        if not scheduler.run():
+            raise CommandError("已有调度进程在运行")
+        self.stdout.write(self.style.SUCCESS("调度进程已退出"))
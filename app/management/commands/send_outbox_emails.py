@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from app.mail_outbox import EmailOutboxManager
+
+class Command(BaseCommand):
+    help = '发送发件箱中的待发邮件（可常驻运行作为邮件发送进程）'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='常驻运行，持续发送新邮件')
+        parser.add_argument('--interval', type=int, default=10, help='常驻运行时的轮询间隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=EmailOutboxManager.BATCH_SIZE, help='每批领取的邮件数量')
+    
+    def handle(self, *args, **options):
+        while True:
+            stats = EmailOutboxManager.deliver_pending(batch_size=options['batch_size'])
+            
+            if any(stats.values()) or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"发送完成！成功 {stats['sent']} 封，待重试 {stats['retried']} 封，失败 {stats['dead']} 封"
+                    )
+                )
+            
+            if not options['loop']:
+                return
+            
+            time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from app.db_router import REPLICA_ALIAS, ReplicaMonitor
+import sqlite3
+import time
+
+class Command(BaseCommand):
+    help = '把主库复制到 SQLite 只读副本（SQLITE_REPLICA_PATH），用于在本地测试只读副本路由和延迟回退'
+
+    def handle(self, *args, **options):
+        if not ReplicaMonitor.is_configured():
+            raise CommandError("没有配置只读副本（设置环境变量 SQLITE_REPLICA_PATH）")
+        primary, replica = settings.DATABASES['default'], settings.DATABASES[REPLICA_ALIAS]
+        if primary['ENGINE'] != 'django.db.backends.sqlite3' or replica['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("sync_replica 只用于 SQLite；PostgreSQL 副本由流复制同步")
+
+        started = time.monotonic()
+        # 先写心跳再复制，副本上的心跳时间即本次复制的时间点
+        ReplicaMonitor.beat()
+        connections[REPLICA_ALIAS].close()
+
+        # 在线备份接口在一个读事务内按页复制，得到一致的副本，不阻塞主库读写
+        source = sqlite3.connect(primary['NAME'], timeout=30)
+        try:
+            target = sqlite3.connect(replica['NAME'], timeout=30)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+
+        ReplicaMonitor.reset()
+        self.stdout.write(self.style.SUCCESS(
+            f"只读副本已同步: {replica['NAME']}，用时 {time.monotonic() - started:.2f} 秒"
+        ))
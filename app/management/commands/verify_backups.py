@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from app.backup_utils import DataBackupManager
+
+class Command(BaseCommand):
+    help = '校验备份文件的完整性（比对目录索引中的SHA-256，不执行恢复）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('filenames', nargs='*', help='要校验的备份文件名，默认校验全部')
+        parser.add_argument('--deep', action='store_true', help='逐个解压成员比对校验和')
+
+    def handle(self, *args, **options):
+        filenames = options['filenames'] or [backup['filename'] for backup in DataBackupManager.list_backups()]
+
+        failed = 0
+        for filename in filenames:
+            result = DataBackupManager.verify_backup(filename, deep=options['deep'])
+            if result['ok']:
+                self.stdout.write(f"{filename}: 通过 ({result['seconds']} 秒)")
+            else:
+                failed += 1
+                self.stdout.write(self.style.ERROR(f"{filename}: {'; '.join(result['errors'])}"))
+
+        if failed:
+            self.stdout.write(self.style.ERROR(f"校验完成，{failed}/{len(filenames)} 个备份文件异常"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"校验完成，{len(filenames)} 个备份文件全部通过"))
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0013_customuser_last_announcement_view_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255, verbose_name='主题')),
+                ('body', models.TextField(verbose_name='纯文本内容')),
+                ('html_body', models.TextField(blank=True, verbose_name='HTML内容')),
+                ('from_email', models.CharField(blank=True, max_length=255, verbose_name='发件人')),
+                ('recipients', models.JSONField(default=list, verbose_name='收件人')),
+                ('status', models.CharField(choices=[('pending', '待发送'), ('sending', '发送中'), ('sent', '已发送'), ('dead', '发送失败')], default='pending', max_length=10, verbose_name='状态')),
+                ('attempts', models.IntegerField(default=0, verbose_name='已尝试次数')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='下次尝试时间')),
+                ('last_error', models.TextField(blank=True, verbose_name='最后错误')),
+                ('claim_token', models.CharField(blank=True, max_length=32, verbose_name='领取标记')),
+                ('claimed_at', models.DateTimeField(blank=True, null=True, verbose_name='领取时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='发送时间')),
+            ],
+            options={
+                'verbose_name': '待发邮件',
+                'verbose_name_plural': '待发邮件',
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='app_outbox_due_idx')],
+            },
+        ),
+    ]
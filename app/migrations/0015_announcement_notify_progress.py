@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:05
+
+from django.db import migrations, models
+
+
+def mark_existing_announcements_notified(apps, schema_editor):
+    # 迁移前发布的公告已经同步发送过邮件，不能再次分发
+    Announcement = apps.get_model('app', 'Announcement')
+    Announcement.objects.update(notify_status='done')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_emailoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcement',
+            name='notified_count',
+            field=models.IntegerField(default=0, verbose_name='已通知人数'),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='notify_cursor',
+            field=models.BigIntegerField(default=0, verbose_name='已通知到的用户ID'),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='notify_finished_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='通知完成时间'),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='notify_status',
+            field=models.CharField(choices=[('pending', '待发送'), ('sending', '发送中'), ('done', '已完成')], default='pending', max_length=10, verbose_name='通知状态'),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='notify_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='通知进度更新时间'),
+        ),
+        migrations.RunPython(mark_existing_announcements_notified, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:30
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0015_announcement_notify_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now, verbose_name='更新时间'),
+            preserve_default=False,
+        ),
+    ]
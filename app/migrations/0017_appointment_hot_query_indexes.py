@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-19 03:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_appointment_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('is_processed', False), ('is_responded', False)), fields=['id'], name='appt_unresponded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('is_processed', False), ('is_responded', True)), fields=['id'], name='appt_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('is_deleted', False), ('is_processed', False), ('is_urged', True)), fields=['id'], name='appt_urged_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at'], name='appt_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['guest', '-created_at'], name='appt_guest_created_idx'),
+        ),
+    ]
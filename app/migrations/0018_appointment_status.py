@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:10
+
+from django.db import migrations, models
+
+
+def backfill_status(apps, schema_editor):
+    # 按布尔字段推出状态：后面的更新覆盖前面的（已删除优先，其次已处理、已催单、已回应）；
+    # 同时修正不可能的组合（如已处理但未回应），布尔字段此后与 status 保持一致
+    Appointment = apps.get_model('app', 'Appointment')
+    Appointment.objects.filter(is_responded=False, is_processed=False).update(
+        status=10, is_urged=False
+    )
+    Appointment.objects.filter(is_responded=True, is_processed=False, is_urged=False).update(status=20)
+    Appointment.objects.filter(is_responded=True, is_processed=False, is_urged=True).update(status=30)
+    Appointment.objects.filter(is_processed=True).update(status=40, is_responded=True, is_urged=False)
+    Appointment.objects.filter(is_deleted=True).update(status=90)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_appointment_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='status',
+            field=models.PositiveSmallIntegerField(choices=[(10, '待回应'), (20, '已回应'), (30, '已催单'), (40, '已处理'), (90, '已删除')], default=10, verbose_name='状态'),
+        ),
+        migrations.RunPython(backfill_status, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_unresponded_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_queue_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_urged_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='appointment',
+            name='appt_active_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'priority', 'id'], name='appt_status_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status__lt', 90)), fields=['-created_at'], name='appt_live_created_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-19 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_appointment_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicationHeartbeat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('beat_at', models.DateTimeField(verbose_name='心跳时间')),
+            ],
+            options={
+                'verbose_name': '复制心跳',
+                'verbose_name_plural': '复制心跳',
+            },
+        ),
+    ]
@@ -82,10 +82,39 @@ class Appointment(models.Model):
         (4, '危'),
     ]
 
+    # 预约状态：数值按流程递增，医师端的待办（已回应、已催单）相邻，
+    # 处理队列是一个连续区间；已删除排在最后，未删除即 status < STATUS_DELETED
+    STATUS_PENDING = 10
+    STATUS_RESPONDED = 20
+    STATUS_URGED = 30
+    STATUS_PROCESSED = 40
+    STATUS_DELETED = 90
+    STATUS_CHOICES = [
+        (STATUS_PENDING, '待回应'),
+        (STATUS_RESPONDED, '已回应'),
+        (STATUS_URGED, '已催单'),
+        (STATUS_PROCESSED, '已处理'),
+        (STATUS_DELETED, '已删除'),
+    ]
+    QUEUE_STATUSES = (STATUS_RESPONDED, STATUS_URGED)
+
+    # 各状态对应的布尔字段取值。布尔字段保留给模板、访客页面和旧版本备份使用，
+    # 只随 status 一起写入（见 set_status），不再单独修改
+    STATUS_FLAGS = {
+        STATUS_PENDING: {'is_responded': False, 'is_processed': False, 'is_urged': False, 'is_deleted': False},
+        STATUS_RESPONDED: {'is_responded': True, 'is_processed': False, 'is_urged': False, 'is_deleted': False},
+        STATUS_URGED: {'is_responded': True, 'is_processed': False, 'is_urged': True, 'is_deleted': False},
+        STATUS_PROCESSED: {'is_responded': True, 'is_processed': True, 'is_urged': False, 'is_deleted': False},
+        # 删除前的状态仍可从其他布尔字段看出（访客页面显示删除前是否已处理）
+        STATUS_DELETED: {'is_deleted': True},
+    }
+
     patient_name = models.CharField(max_length=100, verbose_name="预约人")
     demand = models.TextField(verbose_name="需求描述")
     wechat_id = models.CharField(max_length=100, verbose_name="微信号")
     priority = models.IntegerField(choices=PRIORITY_CHOICES, default=1, verbose_name="优先级")
+    # 状态只通过 DoctorQueueManager.transition 按状态转换表修改
+    status = models.PositiveSmallIntegerField(choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name="状态")
     
     is_responded = models.BooleanField(default=False, verbose_name="已回应")
     is_processed = models.BooleanField(default=False, verbose_name="已处理")
@@ -105,8 +134,34 @@ class Appointment(models.Model):
     is_deleted = models.BooleanField(default=False, verbose_name="是否已删除")
     deleted_at = models.DateTimeField(null=True, blank=True, verbose_name="删除时间")
 
+    # 任何修改都会更新，增量备份据此判断需要导出的记录
+    # （bulk_update/update() 不会自动更新，需显式写入）
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="更新时间")
+
     def __str__(self):
         return f"{self.patient_name} - {self.get_priority_display()}"
+
+    def set_status(self, status):
+        """设置状态并同步布尔字段（只修改内存中的对象，由调用方保存）
+
+        Returns:
+            list: 被修改的字段名，可用于 save(update_fields=...) 或 bulk_update
+        """
+        self.status = status
+        for field, value in self.STATUS_FLAGS[status].items():
+            setattr(self, field, value)
+        return ['status', *self.STATUS_FLAGS[status]]
+
+    @classmethod
+    def status_from_flags(cls, is_responded, is_processed, is_urged, is_deleted):
+        """由布尔字段推出状态（恢复没有 status 字段的旧版本备份时使用）"""
+        if is_deleted:
+            return cls.STATUS_DELETED
+        if is_processed:
+            return cls.STATUS_PROCESSED
+        if is_responded:
+            return cls.STATUS_URGED if is_urged else cls.STATUS_RESPONDED
+        return cls.STATUS_PENDING
     
     def can_modify_today_simple(self):
         """简化的检查方法"""
@@ -176,24 +231,24 @@ class Appointment(models.Model):
     class Meta:
         verbose_name = "预约"
         verbose_name_plural = "预约列表"
+        indexes = [
+            # 医师端的待办和统计查询都按 status 筛选：回应预约、处理催单、处理队列生成、
+            # 工作缓冲区和各状态数量都是这个索引上的单列等值/区间扫描，计数只读索引
+            models.Index(fields=['status', 'priority', 'id'], name='appt_status_priority_idx'),
+            # 所有预约页面（未删除，按创建时间倒序分页）；条件与查询的筛选条件一致，数据库才会使用
+            models.Index(
+                fields=['-created_at'], name='appt_live_created_idx',
+                condition=models.Q(status__lt=90),  # STATUS_DELETED（Meta 中不能引用外层类属性）
+            ),
+            # 访客的预约列表和统计（按创建时间倒序）
+            models.Index(fields=['guest', '-created_at'], name='appt_guest_created_idx'),
+        ]
     
     @classmethod
     def reset_daily_modification_counts(cls):
-        """重置所有预约的每日修改次数（可以在每日任务中调用）"""
-        # 找到今天修改过的预约，重置计数
-        from datetime import datetime
-        from django.utils import timezone
-        today = timezone.now().date()
-        
-        # 找到最后修改日期不是今天的预约，重置计数
-        appointments_to_reset = cls.objects.exclude(
-            last_modified_at__date=today
-        ).filter(today_modified_count__gt=0)
-        
-        count = appointments_to_reset.count()
-        appointments_to_reset.update(today_modified_count=0)
-        
-        return count
+        """重置所有预约的每日修改次数（由调度进程的维护任务分块执行）"""
+        from .maintenance import MaintenanceManager
+        return MaintenanceManager.reset_modification_counts()['processed']
 
 # 在 Appointment 模型后面添加处理池模型
 class DoctorProcessingPool(models.Model):
@@ -305,6 +360,12 @@ class ProfileRecord(models.Model):
 
 # 在 models.py 中添加 Announcement 模型
 class Announcement(models.Model):
+    NOTIFY_STATUS_CHOICES = [
+        ('pending', '待发送'),
+        ('sending', '发送中'),
+        ('done', '已完成'),
+    ]
+
     title = models.CharField(max_length=200, verbose_name="标题")
     content = models.TextField(verbose_name="内容")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="发布时间")
@@ -314,6 +375,13 @@ class Announcement(models.Model):
         null=True,
         verbose_name="发布者"
     )
+
+    # 邮件分发进度（按用户ID分批发送，中断后从游标处继续）
+    notify_status = models.CharField(max_length=10, choices=NOTIFY_STATUS_CHOICES, default='pending', verbose_name="通知状态")
+    notify_cursor = models.BigIntegerField(default=0, verbose_name="已通知到的用户ID")
+    notified_count = models.IntegerField(default=0, verbose_name="已通知人数")
+    notify_updated_at = models.DateTimeField(null=True, blank=True, verbose_name="通知进度更新时间")
+    notify_finished_at = models.DateTimeField(null=True, blank=True, verbose_name="通知完成时间")
     
     class Meta:
         verbose_name = "公告"
@@ -321,4 +389,51 @@ class Announcement(models.Model):
         ordering = ['-created_at']
     
     def __str__(self):
-        return self.title
\ No newline at end of file
+        return self.title
+
+class EmailOutbox(models.Model):
+    """邮件发件箱：与业务数据在同一事务中写入，由后台任务统一发送"""
+    STATUS_CHOICES = [
+        ('pending', '待发送'),
+        ('sending', '发送中'),
+        ('sent', '已发送'),
+        ('dead', '发送失败'),
+    ]
+
+    subject = models.CharField(max_length=255, verbose_name="主题")
+    body = models.TextField(verbose_name="纯文本内容")
+    html_body = models.TextField(blank=True, verbose_name="HTML内容")
+    from_email = models.CharField(max_length=255, blank=True, verbose_name="发件人")
+    recipients = models.JSONField(default=list, verbose_name="收件人")
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name="状态")
+    attempts = models.IntegerField(default=0, verbose_name="已尝试次数")
+    next_attempt_at = models.DateTimeField(default=timezone.now, verbose_name="下次尝试时间")
+    last_error = models.TextField(blank=True, verbose_name="最后错误")
+    claim_token = models.CharField(max_length=32, blank=True, verbose_name="领取标记")
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name="领取时间")
+
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="发送时间")
+
+    class Meta:
+        verbose_name = "待发邮件"
+        verbose_name_plural = "待发邮件"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='app_outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.get_status_display()})"
+
+
+class ReplicationHeartbeat(models.Model):
+    """复制心跳：主库定时更新（只有一行），只读副本上读到的心跳时间即副本数据的时间点，用于判断复制延迟"""
+    beat_at = models.DateTimeField(verbose_name="心跳时间")
+
+    class Meta:
+        verbose_name = "复制心跳"
+        verbose_name_plural = "复制心跳"
+
+    def __str__(self):
+        return f"复制心跳 {self.beat_at}"
@@ -61,12 +61,11 @@ class AppointmentQueueManager:
     @classmethod
     def _generate_queue(cls):
         """生成处理队列（按照优先级算法排序）"""
-        # 获取所有已回应、未处理、未删除的预约
+        # 获取所有已回应（含已催单）的预约；排序在内存中按优先级和ID完成，
+        # 只取这两列，查询只读 (status, priority, id) 索引
         appointments = Appointment.objects.filter(
-            is_responded=True,
-            is_processed=False,
-            is_deleted=False
-        ).order_by('id')
+            status__in=Appointment.QUEUE_STATUSES
+        ).only('id', 'priority')
         
         if not appointments.exists():
             # 空队列
@@ -162,7 +161,7 @@ class AppointmentQueueManager:
     @classmethod
     def get_queue_position(cls, appointment):
         """获取预约在队列中的位置"""
-        if not appointment or appointment.is_processed or appointment.is_deleted:
+        if not appointment or appointment.status not in Appointment.QUEUE_STATUSES:
             return None
         
         queue = cls.get_queue()
@@ -171,11 +170,7 @@ class AppointmentQueueManager:
             # 位置从1开始
             return queue.index(appointment.id) + 1
         except ValueError:
-            # 预约不在队列中，可能是未回应
-            if not appointment.is_responded:
-                return None
-            
-            # 重新生成队列并再次尝试
+            # 预约不在队列中，可能是队列缓存过期，重新生成队列并再次尝试
             cls.invalidate_queue()
             queue = cls.get_queue()
             
@@ -196,10 +191,10 @@ class AppointmentQueueManager:
         # 检查预约状态是否影响队列
         needs_refresh = False
         
-        if appointment.is_processed or appointment.is_deleted:
+        if appointment.status in (Appointment.STATUS_PROCESSED, Appointment.STATUS_DELETED):
             # 已处理或已删除，需要从队列中移除
             needs_refresh = True
-        elif appointment.is_responded and not appointment.is_processed and not appointment.is_deleted:
+        elif appointment.status in Appointment.QUEUE_STATUSES:
             # 已回应未处理，可能影响队列
             needs_refresh = True
         
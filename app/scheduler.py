@@ -1,52 +1,216 @@
 import logging
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
+from django_apscheduler import util
 from django_apscheduler.jobstores import DjangoJobStore
-from django_apscheduler.models import DjangoJobExecution
-from django.utils import timezone
+from django_apscheduler.models import DjangoJob, DjangoJobExecution
+from django.core.management import call_command
 from django.conf import settings
-import sys
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，开发环境下不加锁
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+# 任务函数都定义在模块级别：DjangoJobStore 按 "模块:函数名" 保存任务，
+# 嵌套函数无法序列化。每次执行前后关闭失效的数据库连接（调度进程常驻运行）。
+
+@util.close_old_connections
+def check_users_job():
+    """每月1日检查用户"""
+    logger.info("开始执行每月1日的账户检查...")
+    try:
+        call_command('check_users_for_deletion')
+    except Exception as e:
+        logger.error(f"检查用户任务失败: {e}")
+
+@util.close_old_connections
+def delete_users_job():
+    """每月7日删除用户"""
+    logger.info("开始执行每月7日的账户删除...")
+    try:
+        call_command('delete_marked_users')
+    except Exception as e:
+        logger.error(f"删除用户任务失败: {e}")
+
+@util.close_old_connections
+def send_outbox_emails_job():
+    """每分钟发送发件箱中的待发邮件（包括到期重试的邮件）"""
+    from app.mail_outbox import EmailOutboxManager
+    try:
+        EmailOutboxManager.deliver_pending()
+    except Exception as e:
+        logger.error(f"发送邮件任务失败: {e}")
+
+@util.close_old_connections
+def resume_announcement_fanout_job():
+    """每5分钟继续分发中断或未完成的公告邮件"""
+    from app.announcement_fanout import AnnouncementFanout
+    try:
+        AnnouncementFanout.resume_pending()
+    except Exception as e:
+        logger.error(f"公告邮件分发任务失败: {e}")
+
+@util.close_old_connections
+def scheduled_backup_job():
+    """定时备份，完成后按保留策略清理旧备份
+
+    备份用时记录在备份目录索引中，任务执行记录（DjangoJobExecution）中也有总用时。
+    """
+    from app.backup_utils import DataBackupManager
+
+    mode = getattr(settings, 'BACKUP_SCHEDULE_MODE', 'full')
+    started = time.monotonic()
+    try:
+        if mode == 'snapshot':
+            backup_path = DataBackupManager.create_snapshot(scheduled=True)
+        else:
+            backup_path = DataBackupManager.create_backup(incremental=mode == 'incremental', scheduled=True)
+        backup_seconds = time.monotonic() - started
+        removed = DataBackupManager.apply_retention(
+            getattr(settings, 'BACKUP_KEEP_DAILY', 7), getattr(settings, 'BACKUP_KEEP_WEEKLY', 4)
+        )
+        logger.info(
+            f"定时备份完成: {backup_path}，备份用时 {backup_seconds:.1f} 秒，"
+            f"总用时 {time.monotonic() - started:.1f} 秒，删除旧备份 {len(removed)} 个"
+        )
+    except Exception as e:
+        logger.error(f"定时备份任务失败（用时 {time.monotonic() - started:.1f} 秒）: {e}")
+
+@util.close_old_connections
+def maintenance_job():
+    """低峰期维护：分块清理热点表，受时间预算限制"""
+    from app.maintenance import MaintenanceManager
+    try:
+        MaintenanceManager.run_all(time_budget=getattr(settings, 'MAINTENANCE_TIME_BUDGET', None))
+    except Exception as e:
+        logger.error(f"维护任务失败: {e}")
+
+@util.close_old_connections
+def replica_heartbeat_job():
+    """在主库上更新复制心跳，只读副本据此判断延迟"""
+    from app.db_router import ReplicaMonitor
+    try:
+        ReplicaMonitor.beat()
+    except Exception as e:
+        logger.error(f"复制心跳任务失败: {e}")
+
+@util.close_old_connections
+def cleanup_job_executions_job():
+    """清理旧的任务执行记录"""
+    DjangoJobExecution.objects.delete_old_job_executions(604800)  # 删除7天前的记录
+
+def add_jobs(scheduler):
+    """注册所有定时任务（replace_existing：重启调度进程时覆盖任务库中的旧定义）"""
+    scheduler.add_jobstore(DjangoJobStore(), "default")
+
+    scheduler.add_job(check_users_job, 'cron', day='1', hour='0', minute='0', id='check_users', replace_existing=True)
+    scheduler.add_job(delete_users_job, 'cron', day='7', hour='0', minute='0', id='delete_users', replace_existing=True)
+    scheduler.add_job(send_outbox_emails_job, 'interval', minutes=1, id='send_outbox_emails', replace_existing=True)
+    scheduler.add_job(
+        resume_announcement_fanout_job, 'interval', minutes=5, id='resume_announcement_fanout', replace_existing=True
+    )
+
+    if getattr(settings, 'BACKUP_SCHEDULE_HOUR', None) is not None:
+        scheduler.add_job(
+            scheduled_backup_job, 'cron',
+            hour=settings.BACKUP_SCHEDULE_HOUR, minute=getattr(settings, 'BACKUP_SCHEDULE_MINUTE', 0),
+            id='scheduled_backup', replace_existing=True,
+            max_instances=1, coalesce=True,
+        )
+    else:
+        # 关闭定时备份后，任务库中保存的旧任务也要删除
+        DjangoJob.objects.filter(id='scheduled_backup').delete()
+
+    if getattr(settings, 'MAINTENANCE_SCHEDULE_HOUR', None) is not None:
+        scheduler.add_job(
+            maintenance_job, 'cron',
+            hour=settings.MAINTENANCE_SCHEDULE_HOUR, minute=getattr(settings, 'MAINTENANCE_SCHEDULE_MINUTE', 0),
+            id='maintenance', replace_existing=True,
+            max_instances=1, coalesce=True,
+        )
+    else:
+        DjangoJob.objects.filter(id='maintenance').delete()
+
+    from app.db_router import ReplicaMonitor
+    if ReplicaMonitor.is_configured():
+        scheduler.add_job(
+            replica_heartbeat_job, 'interval', seconds=getattr(settings, 'REPLICA_HEARTBEAT_INTERVAL', 10),
+            id='replica_heartbeat', replace_existing=True,
+            max_instances=1, coalesce=True,
+        )
+    else:
+        DjangoJob.objects.filter(id='replica_heartbeat').delete()
+
+    scheduler.add_job(cleanup_job_executions_job, 'interval', hours=24, id='cleanup_jobs', replace_existing=True)
+
+_leader_lock = None
+
+def acquire_leader_lock():
+    """获取调度进程锁（文件锁），保证同一台机器上只有一个进程执行定时任务
+
+    锁随进程退出自动释放，进程崩溃也不会留下死锁。
+
+    Returns:
+        bool: 是否获得锁
+    """
+    global _leader_lock
+    if _leader_lock is not None:
+        return True
+    if fcntl is None:
+        return True
+
+    # 默认放在项目目录而不是临时目录：服务使用独立的 /tmp（如 systemd PrivateTmp）时，
+    # Web 进程和调度进程看到的临时目录不同，锁会失效
+    lock_file = open(getattr(settings, 'SCHEDULER_LOCK_FILE', os.path.join(settings.BASE_DIR, 'scheduler.lock')), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    _leader_lock = lock_file
+    return True
+
 def start():
-    """启动调度器"""
-    if settings.DEBUG:
-        # 开发环境下，你可以选择不在启动时运行
+    """在当前进程中后台启动调度器（SCHEDULER_AUTOSTART 开启时由 AppConfig.ready 调用）
+
+    多个 Web 进程同时启动时，只有获得调度进程锁的一个会运行调度器。
+    """
+    if not acquire_leader_lock():
+        logger.info("调度器已在其他进程中运行，跳过启动")
         return
-    
+
     scheduler = BackgroundScheduler(timezone=settings.TIME_ZONE)
-    scheduler.add_jobstore(DjangoJobStore(), "default")
-    
-    # 添加你的两个任务
-    from app.management.commands import check_users_for_deletion, delete_marked_users
-    from django.core.management import call_command
-    
-    @scheduler.scheduled_job('cron', day='1', hour='0', minute='0', id='check_users')
-    def check_users_job():
-        """每月1日检查用户"""
-        logger.info("开始执行每月1日的账户检查...")
-        try:
-            call_command('check_users_for_deletion')
-        except Exception as e:
-            logger.error(f"检查用户任务失败: {e}")
-    
-    @scheduler.scheduledscheduled_job('cron', day='7', hour='0', minute='0', id='delete_users')
-    def delete_users_job():
-        """每月7日删除用户"""
-        logger.info("开始执行每月7日的账户删除...")
-        try:
-            call_command('delete_marked_users')
-        except Exception as e:
-            logger.error(f"删除用户任务失败: {e}")
-    
-    # 清理旧的任务执行记录（可选）
-    @scheduler.scheduled_job('interval', hours=24, id='cleanup_jobs')
-    def cleanup():
-        DjangoJobExecution.objects.delete_old_job_executions(604800)  # 删除7天前的记录
-    
+    add_jobs(scheduler)
+
     try:
         scheduler.start()
         logger.info("调度器已启动")
     except Exception as e:
         logger.error(f"调度器启动失败: {e}")
-        scheduler.shutdown()
\ No newline at end of file
+        scheduler.shutdown()
+
+def run():
+    """在前台运行调度器，直到进程退出（供 run_scheduler 命令使用）
+
+    Returns:
+        bool: 已有其他调度进程在运行时返回 False
+    """
+    if not acquire_leader_lock():
+        return False
+
+    scheduler = BlockingScheduler(timezone=settings.TIME_ZONE)
+    add_jobs(scheduler)
+    logger.info("调度器已启动")
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        scheduler.shutdown()
+        logger.info("调度器已停止")
+    return True
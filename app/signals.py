@@ -40,9 +40,7 @@ from .queue_manager import AppointmentQueueManager
 
 # 定义影响队列的关键字段
 QUEUE_RELATED_FIELDS = {
-    'is_responded',
-    'is_processed', 
-    'is_deleted',
+    'status',
     'priority'
 }
 
@@ -86,7 +84,5 @@ def handle_appointment_delete(sender, instance, **kwargs):
     只删除已回应未处理的预约才需要更新队列
     """
     # 检查被删除的预约是否在队列中
-    if (instance.is_responded and 
-        not instance.is_processed and 
-        not instance.is_deleted):
+    if instance.status in Appointment.QUEUE_STATUSES:
         AppointmentQueueManager.invalidate_queue()
\ No newline at end of file
@@ -1,3 +1,1413 @@
-from django.test import TestCase
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+import json
+import os
+import shutil
+import smtplib
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail, serializers
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, transaction
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django_apscheduler.models import DjangoJob
+
+from .account_index import AccountAutocompleteIndex
+from .announcement_fanout import AnnouncementFanout
+from .backup_jobs import BackupJobManager
+from .backup_utils import ZIP_ZSTANDARD, DataBackupManager
+from .db_router import REPLICA_ALIAS, ReplicaMonitor, ReplicaRouter, use_replica
+from .doctor_utils import DoctorQueueManager
+from .mail_outbox import EmailOutboxManager
+from .maintenance import MaintenanceManager
+from .models import (
+    Announcement, Appointment, CustomUser, DailyAppointmentCreation, DoctorProcessingPool, EmailOutbox,
+    ReplicationHeartbeat
+)
+from . import scheduler
+from .queue_manager import AppointmentQueueManager
+from .work_buffer import DoctorWorkBuffer
+
+
+def use_temp_backup_dir(test):
+    """备份写入临时目录（备份目录为 BASE_DIR/backups），测试结束后删除"""
+    backup_dir = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, backup_dir, True)
+    settings_override = override_settings(BASE_DIR=backup_dir)
+    settings_override.enable()
+    test.addCleanup(settings_override.disable)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN 输出格式按 SQLite 断言')
+class AppointmentHotQueryIndexTests(TestCase):
+    """医师端和访客端的热点预约查询应使用各自的索引（用 EXPLAIN 检查实际执行的SQL）"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_superuser(email='doctor@example.com', password='password')
+        cls.guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+        other = CustomUser.objects.create_user(email='other@example.com', password='password')
+
+        def appointment(name, guest, status):
+            appointment = Appointment(patient_name=name, demand='d', wechat_id='w', guest=guest)
+            appointment.set_status(status)
+            return appointment
+
+        # 与线上数据分布一致：大部分预约已处理或已删除，待办只占一小部分
+        appointments = []
+        for i in range(400):
+            if i % 7 == 0:
+                status = Appointment.STATUS_DELETED
+            elif i % 20:
+                status = Appointment.STATUS_PROCESSED
+            else:
+                status = Appointment.STATUS_RESPONDED
+            appointments.append(appointment(f'p{i}', other if i % 10 else cls.guest, status))
+        for i in range(10):
+            appointments.append(appointment(f'u{i}', cls.guest, Appointment.STATUS_PENDING))
+            appointments.append(appointment(
+                f'r{i}', other, Appointment.STATUS_URGED if i % 2 == 0 else Appointment.STATUS_RESPONDED
+            ))
+        Appointment.objects.bulk_create(appointments)
+
+        # 让查询规划器拿到真实的选择度
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def appointment_plans(self, func):
+        """执行 func，返回其中每条预约查询的 (SQL, 查询计划)"""
+        with CaptureQueriesContext(connection) as context:
+            func()
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                sql = query['sql']
+                if not sql.startswith('SELECT') or 'FROM "app_appointment"' not in sql:
+                    continue
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+                plans.append((sql, ' '.join(str(row[-1]) for row in cursor.fetchall())))
+        self.assertTrue(plans, '没有执行预约查询')
+        return plans
+
+    def assertPlansUseIndex(self, plans, index_name):
+        for sql, plan in plans:
+            self.assertIn(index_name, plan, f'{sql}\n{plan}')
+
+    def test_unresponded_appointment(self):
+        plans = self.appointment_plans(DoctorQueueManager.get_unresponded_appointment)
+        self.assertPlansUseIndex(plans, 'appt_status_priority_idx')
+
+    def test_urge_appointment(self):
+        plans = self.appointment_plans(DoctorQueueManager.get_urge_appointment)
+        self.assertPlansUseIndex(plans, 'appt_status_priority_idx')
+
+    def test_generate_queue(self):
+        plans = self.appointment_plans(AppointmentQueueManager._generate_queue)
+        self.assertPlansUseIndex(plans, 'appt_status_priority_idx')
+
+    def test_doctor_index_counts(self):
+        self.client.force_login(self.doctor)
+        plans = self.appointment_plans(lambda: self.client.get(reverse('doctor_index')))
+        # 视图中的三个统计查询和页面渲染时上下文处理器的五个统计查询
+        counts = [(sql, plan) for sql, plan in plans if 'COUNT(' in sql]
+        self.assertEqual(len(counts), 8)
+        self.assertPlansUseIndex(counts, 'appt_status_priority_idx')
+
+    def test_doctor_all(self):
+        self.client.force_login(self.doctor)
+        plans = self.appointment_plans(lambda: self.client.get(reverse('doctor_all')))
+        pages = [(sql, plan) for sql, plan in plans if 'ORDER BY "app_appointment"."created_at" DESC' in sql]
+        self.assertTrue(pages)
+        self.assertPlansUseIndex(pages, 'appt_live_created_idx')
+
+    def test_guest_appointments(self):
+        self.client.force_login(self.guest)
+        plans = self.appointment_plans(lambda: self.client.get(reverse('my_appointments')))
+        pages = [(sql, plan) for sql, plan in plans if 'ORDER BY "app_appointment"."created_at" DESC' in sql]
+        self.assertTrue(pages)
+        self.assertPlansUseIndex(pages, 'appt_guest_created_idx')
+
+
+class AppointmentStatusTransitionTests(TestCase):
+    """预约状态只能按 DoctorQueueManager 的状态转换表变更，布尔字段随状态同步"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+
+    def create_appointment(self):
+        return Appointment.objects.create(patient_name='p', demand='d', wechat_id='w', guest=self.guest)
+
+    def test_lifecycle(self):
+        appointment = self.create_appointment()
+        self.assertEqual(appointment.status, Appointment.STATUS_PENDING)
+
+        DoctorQueueManager.respond_appointment(appointment)
+        DoctorQueueManager.transition(appointment, 'urge')
+        appointment.save()
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, Appointment.STATUS_URGED)
+        self.assertTrue(appointment.is_responded and appointment.is_urged)
+
+        DoctorQueueManager.process_appointment(appointment)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, Appointment.STATUS_PROCESSED)
+        self.assertTrue(appointment.is_responded and appointment.is_processed)
+        self.assertFalse(appointment.is_urged)
+
+        DoctorQueueManager.delete_appointment(appointment)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, Appointment.STATUS_DELETED)
+        # 删除前已处理，访客页面仍按已处理显示
+        self.assertTrue(appointment.is_deleted and appointment.is_processed)
+
+    def test_invalid_transition(self):
+        appointment = self.create_appointment()
+        with self.assertRaises(ValueError):
+            DoctorQueueManager.transition(appointment, 'urge')
+        DoctorQueueManager.process_appointment(appointment)
+        with self.assertRaises(ValueError):
+            DoctorQueueManager.respond_appointment(appointment)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, Appointment.STATUS_PROCESSED)
+
+    def test_bulk_action_skips_other_statuses(self):
+        pending = self.create_appointment()
+        processed = self.create_appointment()
+        DoctorQueueManager.process_appointment(processed)
+
+        updated = DoctorQueueManager.bulk_action('respond', [pending.id, processed.id])
+        self.assertEqual([appointment.id for appointment in updated], [pending.id])
+        pending.refresh_from_db()
+        processed.refresh_from_db()
+        self.assertEqual(pending.status, Appointment.STATUS_RESPONDED)
+        self.assertEqual(processed.status, Appointment.STATUS_PROCESSED)
+
+
+class BackupRestoreSequenceTests(TestCase):
+    """恢复时按备份中的主键写入记录，之后新建的记录不能与其主键冲突（PostgreSQL 需要调整序列）"""
+
+    def test_reset_sequences_after_explicit_ids(self):
+        guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+        last_id = Appointment.objects.create(patient_name='p', demand='d', wechat_id='w', guest=guest).id
+        Appointment.objects.bulk_create([
+            Appointment(id=last_id + i, patient_name='r', demand='d', wechat_id='w', guest=guest)
+            for i in range(1, 4)
+        ])
+
+        DataBackupManager._reset_sequences()
+
+        appointment = Appointment.objects.create(patient_name='n', demand='d', wechat_id='w', guest=guest)
+        self.assertGreater(appointment.id, last_id + 3)
+
+
+class ReplicaRouterTests(TestCase):
+    """use_replica() 范围内的读取：副本可用时发往副本，未配置、没有心跳或延迟过大时回到主库；写入始终发往主库"""
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+        ReplicaMonitor.reset()
+        self.addCleanup(ReplicaMonitor.reset)
+
+    def route_read(self, heartbeat, configured=True):
+        """副本上的心跳为 heartbeat 时，use_replica() 范围内读取的路由结果"""
+        ReplicaMonitor.reset()
+        with mock.patch.object(ReplicaMonitor, 'is_configured', return_value=configured), \
+                mock.patch.object(ReplicaMonitor, '_read_heartbeat', return_value=heartbeat), \
+                use_replica():
+            return self.router.db_for_read(Appointment)
+
+    def test_reads_outside_use_replica_use_primary(self):
+        with mock.patch.object(ReplicaMonitor, 'is_configured', return_value=True), \
+                mock.patch.object(ReplicaMonitor, '_read_heartbeat', return_value=timezone.now()):
+            self.assertIsNone(self.router.db_for_read(Appointment))
+        self.assertEqual(self.router.db_for_write(Appointment), DEFAULT_DB_ALIAS)
+
+    def test_replica_used_only_while_heartbeat_is_fresh(self):
+        now = timezone.now()
+        self.assertEqual(self.route_read(now - timedelta(seconds=1)), REPLICA_ALIAS)
+        self.assertIsNone(self.route_read(now - timedelta(seconds=settings.REPLICA_MAX_LAG + 1)))
+        # 没有心跳（副本不可用）或没有配置副本
+        self.assertIsNone(self.route_read(None))
+        self.assertIsNone(self.route_read(now, configured=False))
+
+    def test_heartbeat_written_to_primary(self):
+        ReplicaMonitor.beat()
+        first = ReplicationHeartbeat.objects.get(pk=1).beat_at
+        ReplicaMonitor.beat()
+        self.assertEqual(ReplicationHeartbeat.objects.count(), 1)
+        self.assertGreaterEqual(ReplicationHeartbeat.objects.get(pk=1).beat_at, first)
+
+
+class AccountIndexInvalidationTests(TestCase):
+    """只有新增账号或邮箱/身份变化时才使账号自动完成索引失效"""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='guest@example.com', password='password')
+
+    def assert_invalidated(self, expected, change):
+        with mock.patch.object(AccountAutocompleteIndex, 'invalidate') as invalidate:
+            change()
+        self.assertEqual(invalidate.called, expected)
+
+    def test_unrelated_full_save_keeps_index(self):
+        def change():
+            self.user.is_active = False
+            self.user.save()
+        self.assert_invalidated(False, change)
+
+    def test_email_or_role_change_invalidates(self):
+        def change_email():
+            self.user.email = 'renamed@example.com'
+            self.user.save()
+        self.assert_invalidated(True, change_email)
+
+        def change_role():
+            self.user.is_superuser = True
+            self.user.save(update_fields=['is_superuser'])
+        self.assert_invalidated(True, change_role)
+
+    def test_create_and_delete_invalidate(self):
+        self.assert_invalidated(True, lambda: CustomUser.objects.create_user(email='new@example.com', password='x'))
+        self.assert_invalidated(True, self.user.delete)
+
+
+class DoctorBulkActionViewTests(TestCase):
+    """医师批量操作：状态变更、通知邮件与优先级校验"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_superuser(email='doctor@example.com', password='password')
+        cls.guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+
+    def setUp(self):
+        self.client.force_login(self.doctor)
+        self.appointments = [
+            Appointment.objects.create(patient_name='p', demand='d', wechat_id='w', guest=self.guest)
+            for _ in range(2)
+        ]
+        self.ids = [appointment.id for appointment in self.appointments]
+
+    def post(self, action, **data):
+        return self.client.post(reverse('doctor_bulk_action'), {
+            'action': action, 'appointment_ids': self.ids, **data
+        }, follow=True)
+
+    def statuses(self):
+        return list(Appointment.objects.filter(id__in=self.ids).order_by('id').values_list('status', 'priority'))
+
+    def test_respond_then_process(self):
+        self.post('respond', annotation='a', priority='3')
+        self.assertEqual(self.statuses(), [(Appointment.STATUS_RESPONDED, 3)] * 2)
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+        self.post('process', annotation='b')
+        self.assertEqual(self.statuses(), [(Appointment.STATUS_PROCESSED, 3)] * 2)
+        self.assertEqual(EmailOutbox.objects.count(), 4)
+        self.assertEqual(DoctorProcessingPool.objects.filter(appointment_id__in=self.ids).count(), 2)
+
+    def test_invalid_priority_rejected(self):
+        for priority in ('9', 'high', '-1'):
+            response = self.post('respond', priority=priority)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('无效的优先级', [str(message) for message in response.context['messages']])
+        self.assertEqual(self.statuses(), [(Appointment.STATUS_PENDING, 1)] * 2)
+        self.assertFalse(EmailOutbox.objects.exists())
+
+
+class DoctorWorkBufferConcurrencyTests(TestCase):
+    """缓冲区中的预约只用来确定ID，修改前按数据库中的状态重新校验，不覆盖其他医师的修改"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor1 = CustomUser.objects.create_superuser(email='doctor1@example.com', password='password')
+        cls.doctor2 = CustomUser.objects.create_superuser(email='doctor2@example.com', password='password')
+        cls.guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+
+    def setUp(self):
+        cache.clear()
+        self.first = Appointment.objects.create(patient_name='p1', demand='d', wechat_id='w', guest=self.guest)
+        self.second = Appointment.objects.create(patient_name='p2', demand='d', wechat_id='w', guest=self.guest)
+
+    def respond_as(self, doctor, annotation, **data):
+        self.client.force_login(doctor)
+        return self.client.post(
+            reverse('doctor_respond'), {'annotation': annotation, 'note': '', **data}, follow=True
+        )
+
+    def test_other_doctors_skip_handled_appointment(self):
+        # 两位医师的缓冲区中都是同一个待回应预约
+        self.assertEqual(DoctorWorkBuffer.peek('respond', self.doctor1).id, self.first.id)
+        self.assertEqual(DoctorWorkBuffer.peek('respond', self.doctor2).id, self.first.id)
+
+        self.respond_as(self.doctor1, 'from d1')
+        # 其他医师的缓冲区不重新查询，只跳过已处理的预约
+        with self.assertNumQueries(0):
+            self.assertEqual(DoctorWorkBuffer.peek('respond', self.doctor2).id, self.second.id)
+        self.respond_as(self.doctor2, 'from d2')
+
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(self.first.annotation, 'from d1')
+        self.assertEqual(self.second.annotation, 'from d2')
+        self.assertEqual(EmailOutbox.objects.count(), 2)
+
+    def test_invalid_priority_keeps_appointment_at_head(self):
+        DoctorWorkBuffer.peek('respond', self.doctor1)
+
+        response = self.respond_as(self.doctor1, 'from d1', priority='9')
+
+        self.assertIn('无效的优先级', [str(message) for message in response.context['messages']])
+        self.assertEqual(response.context['appointment'].id, self.first.id)
+        self.assertEqual(DoctorWorkBuffer.peek('respond', self.doctor1).id, self.first.id)
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.status, Appointment.STATUS_PENDING)
+
+    def test_stale_buffered_appointment_rejected(self):
+        stale = DoctorWorkBuffer.peek('respond', self.doctor2)
+        self.respond_as(self.doctor1, 'from d1')
+
+        with mock.patch.object(DoctorWorkBuffer, 'peek', return_value=stale):
+            response = self.respond_as(self.doctor2, 'from d2')
+
+        self.assertIn('不能执行', ' '.join(str(message) for message in response.context['messages']))
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.annotation, 'from d1')
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+    def test_stale_process_entry_keeps_urge_fields(self):
+        DoctorQueueManager.respond_appointment(self.first)
+        stale = Appointment.objects.get(pk=self.first.pk)
+
+        # 缓存之后访客催单
+        DoctorQueueManager.transition(self.first, 'urge')
+        self.first.urged_at = timezone.now()
+        self.first.save()
+
+        self.client.force_login(self.doctor1)
+        with mock.patch.object(DoctorWorkBuffer, 'peek', return_value=stale):
+            self.client.post(reverse('doctor_process'), {'annotation': 'done', 'note': ''})
+
+        processed = Appointment.objects.get(pk=self.first.pk)
+        self.assertEqual(processed.status, Appointment.STATUS_PROCESSED)
+        self.assertEqual(processed.urged_at, self.first.urged_at)
+
+
+class FailingEmailBackend(locmem.EmailBackend):
+    """发送时总是失败的邮件后端"""
+
+    def send_messages(self, messages):
+        raise smtplib.SMTPRecipientsRefused({'guest@example.com': (550, b'refused')})
+
+
+class EmailOutboxDeliveryTests(TestCase):
+    """发件箱：领取标记、中断后回收、失败重试的退避间隔和超过次数后放弃"""
+
+    def enqueue(self, count=1):
+        return EmailOutboxManager.enqueue_many([
+            ('subject', 'body', [f'guest{i}@example.com'], None) for i in range(count)
+        ], wake=False)
+
+    def test_claim_batch_marks_only_due_pending(self):
+        self.enqueue(3)
+        EmailOutbox.objects.filter(recipients=['guest2@example.com']).update(
+            next_attempt_at=timezone.now() + timedelta(minutes=5)
+        )
+
+        claimed = EmailOutboxManager._claim_batch(10)
+        self.assertEqual(len(claimed), 2)
+        self.assertEqual(len({outbox.claim_token for outbox in claimed}), 1)
+        self.assertTrue(all(outbox.status == 'sending' for outbox in claimed))
+        # 已领取的邮件不会被再次领取
+        self.assertEqual(EmailOutboxManager._claim_batch(10), [])
+
+    def test_stale_claim_recovered(self):
+        self.enqueue()
+        EmailOutboxManager._claim_batch(10)
+        EmailOutbox.objects.update(
+            claimed_at=timezone.now() - timedelta(seconds=EmailOutboxManager.CLAIM_TIMEOUT + 1)
+        )
+
+        claimed = EmailOutboxManager._claim_batch(10)
+        self.assertEqual(len(claimed), 1)
+
+    def test_successful_delivery(self):
+        self.enqueue(2)
+        stats = EmailOutboxManager.deliver_pending()
+        self.assertEqual(stats, {'sent': 2, 'retried': 0, 'dead': 0})
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertFalse(EmailOutbox.objects.exclude(status='sent').exists())
+
+    @override_settings(EMAIL_BACKEND='app.tests.FailingEmailBackend')
+    def test_backoff_then_dead_letter(self):
+        outbox = self.enqueue()[0]
+
+        for attempt in range(1, EmailOutboxManager.MAX_ATTEMPTS + 1):
+            before = timezone.now()
+            stats = EmailOutboxManager.deliver_pending()
+            outbox.refresh_from_db()
+            self.assertEqual(outbox.attempts, attempt)
+            self.assertIn('refused', outbox.last_error)
+            self.assertEqual(outbox.claim_token, '')
+            if attempt < EmailOutboxManager.MAX_ATTEMPTS:
+                self.assertEqual(stats['retried'], 1)
+                self.assertEqual(outbox.status, 'pending')
+                # 60秒、120秒、240秒……
+                delay = (outbox.next_attempt_at - before).total_seconds()
+                self.assertAlmostEqual(delay, 60 * 2 ** (attempt - 1), delta=5)
+                # 未到重试时间不会再次发送
+                self.assertEqual(EmailOutboxManager.deliver_pending()['retried'], 0)
+                EmailOutbox.objects.update(next_attempt_at=timezone.now())
+
+        self.assertEqual(stats['dead'], 1)
+        self.assertEqual(outbox.status, 'dead')
+        self.assertEqual(EmailOutboxManager.deliver_pending(), {'sent': 0, 'retried': 0, 'dead': 0})
+
+
+class NotificationOutboxTransactionTests(TestCase):
+    """通知邮件写入发件箱失败时，状态变更一并回滚"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_superuser(email='doctor@example.com', password='password')
+        cls.guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+
+    def test_outbox_failure_rolls_back_status(self):
+        cache.clear()
+        appointment = Appointment.objects.create(patient_name='p', demand='d', wechat_id='w', guest=self.guest)
+        self.client.force_login(self.doctor)
+        self.client.raise_request_exception = False
+
+        with mock.patch.object(EmailOutboxManager, 'enqueue', side_effect=DatabaseError('outbox unavailable')):
+            response = self.client.post(reverse('doctor_respond'), {'annotation': 'a', 'note': ''})
+
+        self.assertEqual(response.status_code, 500)
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.status, Appointment.STATUS_PENDING)
+        self.assertEqual(appointment.annotation, '')
+
+
+class AnnouncementFanoutTests(TestCase):
+    """公告分发：每人一封写入发件箱，失败的公告不影响其他公告"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_superuser(email='doctor@example.com', password='password')
+        for i in range(5):
+            CustomUser.objects.create_user(email=f'guest{i}@example.com', password='password')
+
+    def create_announcement(self, title):
+        return Announcement.objects.create(title=title, content='c', created_by=self.doctor)
+
+    @mock.patch.object(AnnouncementFanout, 'CHUNK_SIZE', 2)
+    def test_deliver_enqueues_one_message_per_recipient(self):
+        announcement = self.create_announcement('a')
+
+        self.assertEqual(AnnouncementFanout.deliver(announcement.id), 5)
+
+        announcement.refresh_from_db()
+        self.assertEqual(announcement.notify_status, 'done')
+        self.assertEqual(announcement.notified_count, 5)
+        self.assertEqual(
+            announcement.notify_cursor,
+            CustomUser.objects.filter(is_superuser=False).order_by('id').last().id
+        )
+        self.assertEqual(
+            sorted(recipient for outbox in EmailOutbox.objects.all() for recipient in outbox.recipients),
+            [f'guest{i}@example.com' for i in range(5)]
+        )
+        # 已完成的公告不会再次分发
+        self.assertEqual(AnnouncementFanout.resume_pending(), 0)
+
+    def test_failed_announcement_does_not_block_others(self):
+        failing = self.create_announcement('failing')
+        other = self.create_announcement('other')
+        enqueue_many = EmailOutboxManager.enqueue_many
+
+        def fail_for_first(email_messages, wake=True):
+            if email_messages[0][0].endswith('failing'):
+                raise DatabaseError('outbox unavailable')
+            return enqueue_many(email_messages, wake=wake)
+
+        with mock.patch.object(EmailOutboxManager, 'enqueue_many', side_effect=fail_for_first):
+            self.assertEqual(AnnouncementFanout.resume_pending(), 5)
+
+        failing.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((failing.notify_status, failing.notify_cursor), ('pending', 0))
+        self.assertEqual(other.notify_status, 'done')
+        self.assertEqual(EmailOutbox.objects.count(), 5)
+
+
+class BackupRestoreRoundTripTests(TransactionTestCase):
+    """备份后恢复：记录和时间字段与备份时一致，整批写入失败时逐条重试并记录错误"""
+
+    def setUp(self):
+        use_temp_backup_dir(self)
+        # 配置了只读副本时也从主库导出（副本路由见 ReplicaRouterTests）
+        replica_patch = mock.patch.object(ReplicaMonitor, 'get_replica', return_value=None)
+        replica_patch.start()
+        self.addCleanup(replica_patch.stop)
+
+        self.guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+        self.appointments = [
+            Appointment.objects.create(patient_name=f'p{i}', demand='d', wechat_id='w', guest=self.guest)
+            for i in range(3)
+        ]
+        # 备份中的时间应原样恢复，而不是恢复时的当前时间（备份中的时间精确到毫秒）
+        self.created_at = (timezone.now() - timedelta(days=30)).replace(microsecond=0)
+        Appointment.objects.update(created_at=self.created_at, updated_at=self.created_at)
+
+    def test_round_trip(self):
+        backup_path = DataBackupManager.create_backup()
+
+        Appointment.objects.filter(id=self.appointments[0].id).update(patient_name='changed')
+        Appointment.objects.filter(id=self.appointments[1].id).delete()
+
+        with transaction.atomic():
+            stats = DataBackupManager.restore_backup(backup_path)
+
+        self.assertEqual(stats['errors'], [])
+        self.assertEqual(stats['appointments'], 3)
+        restored = list(Appointment.objects.order_by('id').values_list('patient_name', 'created_at', 'updated_at'))
+        self.assertEqual(restored, [(f'p{i}', self.created_at, self.created_at) for i in range(3)])
+
+    def test_failed_batch_retried_row_by_row(self):
+        records = serializers.serialize('python', Appointment.objects.order_by('id'))
+        records[1]['fields']['patient_name'] = None
+        Appointment.objects.all().delete()
+        stats = {'appointments': 0, 'errors': []}
+
+        DataBackupManager._restore_objects(
+            Appointment, serializers.deserialize('python', records), lambda obj: True,
+            stats, 'appointments', '预约恢复错误'
+        )
+
+        self.assertEqual(stats['appointments'], 2)
+        self.assertEqual(len(stats['errors']), 1)
+        self.assertTrue(stats['errors'][0].startswith(f"预约恢复错误 (ID: {self.appointments[1].id})"))
+        self.assertEqual(
+            list(Appointment.objects.order_by('id').values_list('id', 'created_at')),
+            [(self.appointments[0].id, self.created_at), (self.appointments[2].id, self.created_at)]
+        )
+
+
+class BackupDownloadRangeTests(TestCase):
+    """备份下载：Range / If-Range 断点续传和无法满足的范围"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_superuser(email='doctor@example.com', password='password')
+
+    def setUp(self):
+        use_temp_backup_dir(self)
+
+        self.filename = 'backup_test.zip'
+        path = os.path.join(DataBackupManager.get_backup_directory(), self.filename)
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED) as zipf:
+            zipf.writestr('backup_info.json', json.dumps({'backup_type': 'full'}))
+            zipf.writestr('payload.bin', os.urandom(4096))
+        with open(path, 'rb') as f:
+            self.content = f.read()
+        self.size = len(self.content)
+        self.etag = f'"{DataBackupManager._register_backup(path)["sha256"]}"'
+
+        self.client.force_login(self.doctor)
+        self.url = reverse('download_backup', args=[self.filename])
+
+    def download(self, **headers):
+        response = self.client.get(self.url, headers=headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_download(self):
+        response, body = self.download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_range(self):
+        response, body = self.download(Range='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{self.size}')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(body, self.content[100:200])
+
+        # 续传：从某个位置到文件末尾
+        response, body = self.download(Range=f'bytes={self.size - 10}-')
+        self.assertEqual(response['Content-Range'], f'bytes {self.size - 10}-{self.size - 1}/{self.size}')
+        self.assertEqual(body, self.content[-10:])
+
+    def test_suffix_range(self):
+        response, body = self.download(Range='bytes=-500')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes {self.size - 500}-{self.size - 1}/{self.size}')
+        self.assertEqual(body, self.content[-500:])
+
+    def test_unsatisfiable_range(self):
+        for range_header in (f'bytes={self.size}-', 'bytes=-0'):
+            response, _ = self.download(Range=range_header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response['Content-Range'], f'bytes */{self.size}')
+
+    def test_if_range(self):
+        response, body = self.download(Range='bytes=0-9', If_Range=self.etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[:10])
+
+        # 文件已变化：忽略 Range，返回完整文件
+        response, body = self.download(Range='bytes=0-9', If_Range='"0000"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    def test_multi_range_returns_full_file(self):
+        response, body = self.download(Range='bytes=0-9,20-29')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Range', response)
+        self.assertEqual(body, self.content)
+
+    def test_conditional_request(self):
+        response, _ = self.download(If_None_Match=self.etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class AccountIndexSearchTests(TestCase):
+    """其他进程的修改不会更新本进程的版本号，本地索引超过 INDEX_MAX_AGE 后重建"""
+
+    def setUp(self):
+        cache.clear()
+        AccountAutocompleteIndex._index = None
+        self.user = CustomUser.objects.create_user(email='Alice@example.com', password='password')
+        CustomUser.objects.create_user(email='bob@example.com', password='password')
+
+    def test_prefix_search(self):
+        self.assertEqual(AccountAutocompleteIndex.search(' ali'), [{'id': self.user.id, 'email': 'Alice@example.com'}])
+        self.assertEqual(AccountAutocompleteIndex.search(''), [])
+
+    def test_rebuilt_after_max_age(self):
+        self.assertEqual(len(AccountAutocompleteIndex.search('a')), 1)
+
+        # 模拟其他进程修改账号：不触发本进程的信号，版本号不变
+        CustomUser.objects.filter(pk=self.user.pk).update(email='zed@example.com')
+        self.assertEqual(len(AccountAutocompleteIndex.search('a')), 1)
+
+        with mock.patch.object(AccountAutocompleteIndex, 'INDEX_MAX_AGE', 0):
+            self.assertEqual(AccountAutocompleteIndex.search('a'), [])
+
+
+class BackupIncrementalChainTests(TransactionTestCase):
+    """增量备份：按备份链重放完整备份和增量备份，已删除的记录保持删除；链中的备份缺失或损坏时拒绝恢复"""
+
+    def setUp(self):
+        use_temp_backup_dir(self)
+        replica_patch = mock.patch.object(ReplicaMonitor, 'get_replica', return_value=None)
+        replica_patch.start()
+        self.addCleanup(replica_patch.stop)
+
+        guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+        self.appointments = [
+            Appointment.objects.create(patient_name=f'p{i}', demand='d', wechat_id='w', guest=guest)
+            for i in range(3)
+        ]
+        # 早于增量备份的水位，未修改的记录不进入增量备份
+        Appointment.objects.update(updated_at=timezone.now() - timedelta(days=30))
+        self.full_path = DataBackupManager.create_backup()
+
+        changed = Appointment.objects.get(id=self.appointments[0].id)
+        changed.patient_name = 'changed'
+        changed.save()
+        Appointment.objects.filter(id=self.appointments[1].id).delete()
+        self.added = Appointment.objects.create(patient_name='added', demand='d', wechat_id='w', guest=guest)
+        self.incr_path = DataBackupManager.create_backup(incremental=True)
+        self.incr_filename = os.path.basename(self.incr_path)
+
+    def current_state(self):
+        return list(Appointment.objects.order_by('id').values_list('id', 'patient_name'))
+
+    def test_incremental_contains_changes_and_tombstones(self):
+        backup_info = DataBackupManager.read_backup_info(self.incr_path)
+        self.assertEqual(backup_info['backup_type'], 'incremental')
+        self.assertEqual(backup_info['chain'], [os.path.basename(self.full_path), self.incr_filename])
+        self.assertEqual(backup_info['record_counts']['appointments'], 2)
+        self.assertEqual(backup_info['deleted_counts']['appointments'], 1)
+
+    def test_restore_chain(self):
+        expected = [(self.appointments[0].id, 'changed'), (self.appointments[2].id, 'p2'), (self.added.id, 'added')]
+        self.assertEqual(self.current_state(), expected)
+
+        # 回到完整备份时的数据：删除的记录回来了，修改被撤销
+        DataBackupManager.restore_backup(self.full_path)
+        self.assertEqual(len(self.current_state()), 4)
+
+        stats = DataBackupManager.restore_chain(self.incr_filename)
+
+        self.assertEqual(stats['errors'], [])
+        self.assertEqual(stats['deleted'], 1)
+        self.assertEqual(self.current_state(), expected)
+
+    def test_missing_parent_rejected(self):
+        os.remove(self.full_path)
+        self.added.delete()
+
+        with self.assertRaisesMessage(ValueError, '备份链不完整'):
+            DataBackupManager.restore_chain(self.incr_filename)
+        self.assertFalse(Appointment.objects.filter(id=self.added.id).exists())
+
+    def test_corrupted_parent_rejected(self):
+        with open(self.full_path, 'r+b') as f:
+            f.seek(os.path.getsize(self.full_path) // 2)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+        self.added.delete()
+
+        with self.assertRaisesMessage(ValueError, '校验失败'):
+            DataBackupManager.restore_chain(self.incr_filename)
+        self.assertFalse(Appointment.objects.filter(id=self.added.id).exists())
+
+
+class BackupVerifyTests(TransactionTestCase):
+    """备份校验：按目录索引中的校验和发现损坏或截断的备份文件"""
+
+    def setUp(self):
+        use_temp_backup_dir(self)
+        replica_patch = mock.patch.object(ReplicaMonitor, 'get_replica', return_value=None)
+        replica_patch.start()
+        self.addCleanup(replica_patch.stop)
+
+        guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+        for i in range(50):
+            Appointment.objects.create(patient_name=f'p{i}', demand='d' * 100, wechat_id='w', guest=guest)
+        self.path = DataBackupManager.create_backup(codec='deflate')
+        self.filename = os.path.basename(self.path)
+
+    def test_intact_backup(self):
+        self.assertTrue(DataBackupManager.verify_backup(self.filename)['ok'])
+        self.assertTrue(DataBackupManager.verify_backup(self.filename, deep=True)['ok'])
+
+    def test_corrupted_member(self):
+        member = zipfile.ZipFile(self.path).getinfo('appointments.jsonl')
+        with open(self.path, 'r+b') as f:
+            # 损坏成员数据的中间部分，文件大小不变
+            f.seek(member.header_offset + 30 + len(member.filename) + member.compress_size // 2)
+            byte = f.read(1)
+            f.seek(-1, os.SEEK_CUR)
+            f.write(bytes([byte[0] ^ 0xFF]))
+
+        result = DataBackupManager.verify_backup(self.filename)
+
+        self.assertFalse(result['ok'])
+        self.assertIn("文件校验和与目录记录不一致", result['errors'])
+        self.assertTrue(any('appointments.jsonl' in error for error in result['errors']))
+
+    def test_truncated_file(self):
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) // 2)
+
+        result = DataBackupManager.verify_backup(self.filename)
+
+        self.assertFalse(result['ok'])
+        self.assertIn("文件大小与目录记录不一致", result['errors'])
+        self.assertTrue(any(error.startswith("不是有效的ZIP文件") for error in result['errors']))
+
+
+class SnapshotBackupTests(TransactionTestCase):
+    """数据库快照：快照后修改的数据在恢复后还原；结构不一致或不是SQLite时拒绝恢复"""
+
+    def setUp(self):
+        use_temp_backup_dir(self)
+        guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+        self.appointment = Appointment.objects.create(patient_name='before', demand='d', wechat_id='w', guest=guest)
+        self.other = Appointment.objects.create(patient_name='other', demand='d', wechat_id='w', guest=guest)
+
+    def use_database_file(self):
+        """把测试库复制到文件，作为快照和恢复的数据库（测试库在内存中，不能被其他连接打开；
+        复制要求没有未提交的事务，所以使用 TransactionTestCase）
+        """
+        db_path = os.path.join(settings.BASE_DIR, 'db.sqlite3')
+        connection.ensure_connection()
+        target = sqlite3.connect(db_path)
+        try:
+            connection.connection.backup(target)
+        finally:
+            target.close()
+        path_patch = mock.patch.object(DataBackupManager, '_get_sqlite_path', return_value=db_path)
+        path_patch.start()
+        self.addCleanup(path_patch.stop)
+        return db_path
+
+    def execute(self, db_path, sql, params=()):
+        database = sqlite3.connect(db_path)
+        try:
+            with database:
+                return database.execute(sql, params).fetchall()
+        finally:
+            database.close()
+
+    @skipUnless(connection.vendor == 'sqlite', '数据库快照仅支持SQLite')
+    def test_snapshot_round_trip(self):
+        db_path = self.use_database_file()
+        table = Appointment._meta.db_table
+        for vacuum in (True, False):
+            with self.subTest(vacuum=vacuum):
+                snapshot_path = DataBackupManager.create_snapshot(vacuum=vacuum, codec='stored')
+                self.assertEqual(DataBackupManager.read_backup_info(snapshot_path)['vacuumed'], vacuum)
+
+                self.execute(db_path, f'UPDATE {table} SET patient_name = ? WHERE id = ?', ('after', self.appointment.id))
+                self.execute(db_path, f'DELETE FROM {table} WHERE id = ?', (self.other.id,))
+
+                DataBackupManager.restore_snapshot(snapshot_path)
+
+                self.assertEqual(
+                    self.execute(db_path, f'SELECT id, patient_name FROM {table} ORDER BY id'),
+                    [(self.appointment.id, 'before'), (self.other.id, 'other')]
+                )
+                os.remove(snapshot_path)
+
+    @skipUnless(connection.vendor == 'sqlite', '数据库快照仅支持SQLite')
+    def test_schema_mismatch_rejected(self):
+        db_path = self.use_database_file()
+        self.execute(db_path, "DELETE FROM django_migrations WHERE app = 'app'")
+        snapshot_path = DataBackupManager.create_snapshot()
+        self.execute(db_path, f'DELETE FROM {Appointment._meta.db_table}')
+
+        with self.assertRaisesMessage(ValueError, '数据库结构与当前版本不一致'):
+            DataBackupManager.restore_snapshot(snapshot_path)
+        self.assertEqual(self.execute(db_path, f'SELECT COUNT(*) FROM {Appointment._meta.db_table}'), [(0,)])
+
+    def test_snapshot_refused_on_other_engines(self):
+        # 上传的快照在非SQLite数据库上直接拒绝，不会解压或修改数据库
+        snapshot_path = os.path.join(DataBackupManager.get_backup_directory(), 'snapshot_upload.zip')
+        with zipfile.ZipFile(snapshot_path, 'w') as zipf:
+            zipf.writestr('backup_info.json', json.dumps({'backup_type': 'snapshot'}))
+            zipf.writestr('db.sqlite3', b'')
+
+        with mock.patch.dict(settings.DATABASES['default'], ENGINE='django.db.backends.postgresql'):
+            with self.assertRaisesMessage(ValueError, '数据库快照仅支持SQLite数据库'):
+                DataBackupManager.restore_snapshot(snapshot_path)
+        self.assertEqual(Appointment.objects.count(), 2)
+
+
+class BackupJobLifecycleTests(TestCase):
+    """备份/恢复后台任务：状态流转、长时间没有进度视为中断、心跳、清理旧任务和上传文件"""
+
+    def setUp(self):
+        use_temp_backup_dir(self)
+
+    def wait_for(self, job_id, statuses=('done', 'failed')):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            job = BackupJobManager.get_job(job_id)
+            if job['status'] in statuses:
+                return job
+            time.sleep(0.01)
+        self.fail(f"任务没有进入 {statuses} 状态")
+
+    def test_pending_running_done(self):
+        job = BackupJobManager._create('backup', {'mode': 'full'})
+        self.assertEqual(BackupJobManager.get_job(job['id'])['status'], 'pending')
+
+        release = threading.Event()
+
+        def target(job, progress):
+            progress('appointments', 10, done=True)
+            release.wait(5)
+            job['filename'] = 'backup_test.zip'
+
+        BackupJobManager._start(job, target)
+        running = self.wait_for(job['id'], ('running',))
+        self.assertIsNotNone(running['started_at'])
+        release.set()
+
+        job = self.wait_for(job['id'])
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['filename'], 'backup_test.zip')
+        self.assertEqual(job['progress']['tables'], {'appointments': 10})
+        self.assertIsNotNone(job['finished_at'])
+
+    def test_failed(self):
+        def target(job, progress):
+            raise ValueError('导出失败')
+
+        with self.assertLogs('app.backup_jobs', 'ERROR'):
+            job = BackupJobManager._start(BackupJobManager._create('backup', {'mode': 'full'}), target)
+            job = self.wait_for(job['id'])
+        self.assertEqual((job['status'], job['error']), ('failed', '导出失败'))
+
+    def test_stale_job_reported_failed(self):
+        job = BackupJobManager._create('restore', {'filename': None})
+        job['status'] = 'running'
+        BackupJobManager._save(job)
+        self.assertEqual(BackupJobManager.get_job(job['id'])['status'], 'running')
+
+        later = timezone.now() + timedelta(seconds=BackupJobManager.STALE_TIMEOUT + 1)
+        with mock.patch('app.backup_jobs.timezone.now', return_value=later):
+            job = BackupJobManager.get_job(job['id'])
+        self.assertEqual(job['status'], 'failed')
+        self.assertIn('执行进程可能已中断', job['error'])
+
+    def test_heartbeat_without_progress(self):
+        release = threading.Event()
+        job = BackupJobManager._create('backup', {'mode': 'snapshot'})
+
+        with mock.patch.object(BackupJobManager, 'HEARTBEAT_INTERVAL', 0.01):
+            BackupJobManager._start(job, lambda job, progress: release.wait(5))
+            started_at = self.wait_for(job['id'], ('running',))['updated_at']
+            deadline = time.monotonic() + 5
+            while BackupJobManager.get_job(job['id'])['updated_at'] == started_at and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertNotEqual(BackupJobManager.get_job(job['id'])['updated_at'], started_at)
+            release.set()
+            self.wait_for(job['id'])
+
+    def test_prune_keeps_active_jobs(self):
+        jobs_dir = BackupJobManager.get_jobs_directory()
+        running = BackupJobManager._create('restore', {'filename': None})
+        running['status'] = 'running'
+        BackupJobManager._save(running)
+        finished = BackupJobManager._create('restore', {'filename': None})
+        finished['status'] = 'done'
+        BackupJobManager._save(finished)
+        for job in (running, finished):
+            with open(os.path.join(jobs_dir, f"{job['id']}.zip"), 'wb') as f:
+                f.write(b'upload')
+        latest = BackupJobManager._create('backup', {'mode': 'full'})
+        # 按修改时间排序：running 最早，latest 最新
+        now = time.time()
+        for offset, job in enumerate((running, finished, latest)):
+            os.utime(BackupJobManager._job_path(job['id']), (now + offset, now + offset))
+
+        with mock.patch.object(BackupJobManager, 'KEEP_JOBS', 1):
+            BackupJobManager._prune()
+
+        self.assertEqual(
+            sorted(os.listdir(jobs_dir)),
+            sorted([f"{running['id']}.json", f"{running['id']}.zip", f"{latest['id']}.json"])
+        )
+
+    def test_restore_upload_moved_into_jobs_directory(self):
+        upload = TemporaryUploadedFile('backup.zip', 'application/zip', 6, None)
+        upload.write(b'upload')
+        upload.flush()
+        temporary_path = upload.temporary_file_path()
+        seen = {}
+
+        def restore_backup(path, progress=None):
+            with open(path, 'rb') as f:
+                seen[os.path.dirname(path)] = f.read()
+            return {'appointments': 0}
+
+        with mock.patch.object(DataBackupManager, 'read_backup_info', return_value={'backup_type': 'full'}), \
+                mock.patch.object(DataBackupManager, 'restore_backup', side_effect=restore_backup):
+            job = BackupJobManager.start_restore(upload=upload)
+            self.assertFalse(os.path.exists(temporary_path))
+            upload.close()  # 请求结束时 Django 关闭上传文件，文件已被移走也不报错
+            job = self.wait_for(job['id'])
+
+        self.assertEqual((job['status'], job['filename'], job['result']), ('done', 'backup.zip', {'appointments': 0}))
+        self.assertEqual(seen, {BackupJobManager.get_jobs_directory(): b'upload'})
+        # 恢复结束后删除上传文件
+        self.assertEqual(os.listdir(BackupJobManager.get_jobs_directory()), [f"{job['id']}.json"])
+
+    def test_restore_in_memory_upload(self):
+        upload = SimpleUploadedFile('backup.zip', b'upload')
+
+        with mock.patch.object(DataBackupManager, 'read_backup_info', return_value={'backup_type': 'full'}), \
+                mock.patch.object(DataBackupManager, 'restore_backup', return_value={'appointments': 0}) as restore:
+            job = self.wait_for(BackupJobManager.start_restore(upload=upload)['id'])
+
+        self.assertEqual(job['status'], 'done')
+        restore.assert_called_once()
+        self.assertEqual(os.listdir(BackupJobManager.get_jobs_directory()), [f"{job['id']}.json"])
+
+
+class BackupCodecTests(TransactionTestCase):
+    """各压缩方式的备份都能恢复，压缩方式和级别记录在备份信息中"""
+
+    def setUp(self):
+        use_temp_backup_dir(self)
+        replica_patch = mock.patch.object(ReplicaMonitor, 'get_replica', return_value=None)
+        replica_patch.start()
+        self.addCleanup(replica_patch.stop)
+
+        guest = CustomUser.objects.create_user(email='guest@example.com', password='password')
+        for i in range(20):
+            Appointment.objects.create(patient_name=f'p{i}', demand='d' * 200, wechat_id='w', guest=guest)
+        self.expected = list(Appointment.objects.order_by('id').values_list('id', 'patient_name', 'demand'))
+
+    def test_round_trip(self):
+        codecs = {'stored': None, 'deflate': 6, 'lzma': None}
+        if ZIP_ZSTANDARD is not None:
+            codecs['zstd'] = 3
+        for codec, level in codecs.items():
+            with self.subTest(codec=codec):
+                path = DataBackupManager.create_backup(codec=codec)
+                compress_type = DataBackupManager.BACKUP_CODECS[codec][0]
+
+                compression = DataBackupManager.read_backup_info(path)['compression']
+                self.assertEqual((compression['codec'], compression['level']), (codec, level))
+                self.assertEqual(DataBackupManager.get_backup_entry(os.path.basename(path))['codec'], codec)
+                with zipfile.ZipFile(path) as zipf:
+                    self.assertEqual({info.compress_type for info in zipf.infolist()}, {compress_type})
+                if codec != 'stored':
+                    self.assertLess(compression['compressed_size'], compression['original_size'])
+
+                Appointment.objects.all().delete()
+                stats = DataBackupManager.restore_backup(path)
+
+                self.assertEqual((stats['appointments'], stats['errors']), (20, []))
+                self.assertEqual(
+                    list(Appointment.objects.order_by('id').values_list('id', 'patient_name', 'demand')), self.expected
+                )
+                # 同一秒内创建的备份文件名相同
+                DataBackupManager.delete_backup(os.path.basename(path))
+
+    def test_explicit_level(self):
+        path = DataBackupManager.create_backup(codec='deflate', level=1)
+        self.assertEqual(DataBackupManager.read_backup_info(path)['compression']['level'], 1)
+
+    def test_unknown_codec_rejected(self):
+        with self.assertRaisesMessage(ValueError, '不支持的压缩方式'):
+            DataBackupManager.create_backup(codec='brotli')
+        self.assertEqual(os.listdir(DataBackupManager.get_backup_directory()), [])
+
+
+class BackupRetentionTests(TestCase):
+    """保留策略：每天/每周保留最新的定时备份及其备份链，手动备份和快照不参与清理"""
+
+    def setUp(self):
+        use_temp_backup_dir(self)
+
+    def add_backup(self, filename, modified, backup_type='full', scheduled=True, chain=None):
+        path = os.path.join(DataBackupManager.get_backup_directory(), filename)
+        with zipfile.ZipFile(path, 'w') as zipf:
+            zipf.writestr('backup_info.json', json.dumps({
+                'backup_type': backup_type,
+                'scheduled': scheduled,
+                'chain': chain or ([] if backup_type == 'snapshot' else [filename]),
+            }))
+        timestamp = datetime.fromisoformat(f'{modified}+08:00').timestamp()
+        os.utime(path, (timestamp, timestamp))
+        DataBackupManager._register_backup(path)
+
+    def test_apply_retention(self):
+        self.add_backup('full_6.zip', '2026-09-15T03:00')
+        self.add_backup('full_0.zip', '2026-09-16T03:00')
+        self.add_backup('full_2.zip', '2026-09-29T03:00')
+        self.add_backup('full_1.zip', '2026-09-30T03:00')
+        self.add_backup('full_4.zip', '2026-10-13T01:00')
+        self.add_backup('incr_3.zip', '2026-10-13T03:00', 'incremental', chain=['full_0.zip', 'incr_3.zip'])
+        self.add_backup('full_5.zip', '2026-10-14T03:00')
+        # 手动备份：不删除，依赖的定时备份也保留；同一天更新的手动快照不顶替当天的定时备份
+        self.add_backup('manual_full.zip', '2026-09-01T10:00', scheduled=False)
+        self.add_backup('manual_incr.zip', '2026-10-10T10:00', 'incremental', scheduled=False,
+                        chain=['full_2.zip', 'manual_incr.zip'])
+        self.add_backup('manual_snapshot.zip', '2026-10-14T10:00', 'snapshot', scheduled=False)
+        # 无法读取的文件（可能正在写入）
+        with open(os.path.join(DataBackupManager.get_backup_directory(), 'partial.zip'), 'wb') as f:
+            f.write(b'PK')
+
+        removed = DataBackupManager.apply_retention(keep_daily=2, keep_weekly=2)
+
+        # 按天：10-14 full_5、10-13 incr_3；按周：第42周 full_5、第40周 full_1；incr_3 的链保留 full_0
+        self.assertEqual(sorted(removed), ['full_4.zip', 'full_6.zip'])
+        self.assertEqual(
+            sorted(name for name in os.listdir(DataBackupManager.get_backup_directory()) if name.endswith('.zip')),
+            ['full_0.zip', 'full_1.zip', 'full_2.zip', 'full_5.zip', 'incr_3.zip',
+             'manual_full.zip', 'manual_incr.zip', 'manual_snapshot.zip', 'partial.zip']
+        )
+        self.assertEqual(DataBackupManager.apply_retention(keep_daily=2, keep_weekly=2), [])
+
+
+class DeleteMarkedUsersCommandTests(TestCase):
+    """删除标记账户：按 --batch-size 分批删除，失败的批次保留标记，重新执行时继续删除"""
+
+    def setUp(self):
+        self.marked = [
+            CustomUser.objects.create_user(email=f'marked{i}@example.com', password=None, to_be_deleted=True)
+            for i in range(5)
+        ]
+        self.kept = CustomUser.objects.create_user(email='kept@example.com', password=None)
+        self.staff = CustomUser.objects.create_user(
+            email='staff@example.com', password=None, is_staff=True, to_be_deleted=True
+        )
+        Appointment.objects.create(patient_name='p', demand='d', wechat_id='w', guest=self.marked[0])
+
+    def delete_marked(self, **options):
+        out = StringIO()
+        call_command('delete_marked_users', force=True, pause=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_not_the_seventh(self):
+        with mock.patch('app.management.commands.delete_marked_users.timezone.now',
+                        return_value=timezone.now().replace(day=8)):
+            out = StringIO()
+            call_command('delete_marked_users', stdout=out)
+        self.assertIn('跳过删除', out.getvalue())
+        self.assertEqual(CustomUser.objects.filter(to_be_deleted=True).count(), 6)
+
+    def test_deleted_in_batches(self):
+        out = self.delete_marked(batch_size=2)
+
+        self.assertEqual(out.count('已删除 2 个账户'), 2)
+        self.assertEqual(out.count('已删除 1 个账户'), 1)
+        self.assertIn('共删除了 5 个账户', out)
+        self.assertEqual(
+            sorted(CustomUser.objects.values_list('email', flat=True)), ['kept@example.com', 'staff@example.com']
+        )
+        self.assertFalse(Appointment.objects.exists())
+
+    def test_failed_batch_stays_marked(self):
+        failing_id = self.marked[2].id
+        delete = QuerySet.delete
+
+        def failing_delete(queryset):
+            if queryset.model is CustomUser and queryset.filter(id=failing_id).exists():
+                raise DatabaseError('locked')
+            return delete(queryset)
+
+        with mock.patch.object(QuerySet, 'delete', autospec=True, side_effect=failing_delete), \
+                self.assertLogs('app.management.commands.delete_marked_users', 'ERROR'):
+            out = self.delete_marked(batch_size=2)
+
+        self.assertIn('1 个批次删除失败', out)
+        self.assertIn('共删除了 3 个账户', out)
+        remaining = set(CustomUser.objects.filter(to_be_deleted=True, is_staff=False).values_list('id', flat=True))
+        self.assertEqual(remaining, {self.marked[2].id, self.marked[3].id})
+
+        # 重新执行时删除剩余的标记账户
+        out = self.delete_marked()
+        self.assertIn('共删除了 2 个账户', out)
+        self.assertFalse(CustomUser.objects.filter(to_be_deleted=True, is_staff=False).exists())
+
+
+class SchedulerTests(TestCase):
+    """调度进程：同一台机器上只有一个进程获得调度进程锁；按配置注册定时任务"""
+
+    @skipUnless(scheduler.fcntl is not None, '没有 fcntl 时不加锁')
+    def test_second_leader_lock_fails(self):
+        lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, lock_dir, True)
+
+        with override_settings(SCHEDULER_LOCK_FILE=os.path.join(lock_dir, 'scheduler.lock')), \
+                mock.patch.object(scheduler, '_leader_lock', None):
+            self.assertTrue(scheduler.acquire_leader_lock())
+            leader_lock = scheduler._leader_lock
+            self.addCleanup(leader_lock.close)
+            # 同一进程内再次获取直接返回 True
+            self.assertTrue(scheduler.acquire_leader_lock())
+
+            # 模拟另一个进程：没有持有锁文件，flock 失败
+            scheduler._leader_lock = None
+            self.assertFalse(scheduler.acquire_leader_lock())
+            self.assertIsNone(scheduler._leader_lock)
+
+            # 持有锁的进程退出后可以获得锁
+            leader_lock.close()
+            self.assertTrue(scheduler.acquire_leader_lock())
+            scheduler._leader_lock.close()
+
+    def registered_job_ids(self):
+        background = scheduler.BackgroundScheduler(timezone=settings.TIME_ZONE)
+        scheduler.add_jobs(background)
+        return {job.id for job in background.get_jobs()}
+
+    @override_settings(BACKUP_SCHEDULE_HOUR=3, MAINTENANCE_SCHEDULE_HOUR=4)
+    def test_add_jobs(self):
+        with mock.patch.object(ReplicaMonitor, 'is_configured', return_value=True):
+            job_ids = self.registered_job_ids()
+        self.assertEqual(job_ids, {
+            'check_users', 'delete_users', 'send_outbox_emails', 'resume_announcement_fanout',
+            'scheduled_backup', 'maintenance', 'replica_heartbeat', 'cleanup_jobs',
+        })
+
+    @override_settings(BACKUP_SCHEDULE_HOUR=None, MAINTENANCE_SCHEDULE_HOUR=None)
+    def test_disabled_jobs_removed_from_job_store(self):
+        for job_id in ('scheduled_backup', 'maintenance', 'replica_heartbeat'):
+            DjangoJob.objects.create(id=job_id, job_state=b'')
+
+        with mock.patch.object(ReplicaMonitor, 'is_configured', return_value=False):
+            job_ids = self.registered_job_ids()
+
+        self.assertEqual(job_ids, {
+            'check_users', 'delete_users', 'send_outbox_emails', 'resume_announcement_fanout', 'cleanup_jobs',
+        })
+        self.assertFalse(DjangoJob.objects.exists())
+
+
+class MaintenanceTests(TestCase):
+    """低峰期维护：分块处理，超出时间预算后停止、下次继续，按本地日期重置修改次数"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.guest = CustomUser.objects.create_user(email='guest@example.com', password=None)
+
+    def create_appointments(self, count, **fields):
+        appointments = [
+            Appointment.objects.create(patient_name=f'p{i}', demand='d', wechat_id='w', guest=self.guest)
+            for i in range(count)
+        ]
+        Appointment.objects.filter(id__in=[a.id for a in appointments]).update(**fields)
+        return appointments
+
+    def test_reset_modification_counts_uses_local_date(self):
+        # 北京时间 10月19日 04:30 执行，UTC 还是 10月18日
+        now = datetime.fromisoformat('2026-10-18T20:30:00+00:00')
+        yesterday, = self.create_appointments(
+            1, today_modified_count=1, last_modified_at=datetime.fromisoformat('2026-10-18T10:00:00+08:00')
+        )
+        today, = self.create_appointments(
+            1, today_modified_count=1, last_modified_at=datetime.fromisoformat('2026-10-19T04:00:00+08:00')
+        )
+
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            metrics = MaintenanceManager.reset_modification_counts()
+
+        self.assertEqual((metrics['processed'], metrics['complete']), (1, True))
+        yesterday.refresh_from_db()
+        today.refresh_from_db()
+        self.assertEqual((yesterday.today_modified_count, yesterday.updated_at), (0, now))
+        self.assertEqual(today.today_modified_count, 1)
+
+    @mock.patch.object(MaintenanceManager, 'CHUNK_SIZE', 2)
+    def test_chunked(self):
+        self.create_appointments(5, today_modified_count=1, last_modified_at=timezone.now() - timedelta(days=2))
+
+        metrics = MaintenanceManager.reset_modification_counts()
+
+        self.assertEqual((metrics['processed'], metrics['chunks'], metrics['complete']), (5, 3, True))
+        self.assertFalse(Appointment.objects.filter(today_modified_count__gt=0).exists())
+
+    @mock.patch.object(MaintenanceManager, 'CHUNK_SIZE', 2)
+    def test_resumes_after_time_budget(self):
+        self.create_appointments(5, today_modified_count=1, last_modified_at=timezone.now() - timedelta(days=2))
+
+        # 第一块处理完后时间预算用完
+        clock = iter([0, 0, 100, 100])
+        with mock.patch('app.maintenance.time.monotonic', side_effect=lambda: next(clock)):
+            metrics = MaintenanceManager.reset_modification_counts(deadline=10)
+        self.assertEqual((metrics['processed'], metrics['chunks'], metrics['complete']), (2, 1, False))
+        self.assertEqual(Appointment.objects.filter(today_modified_count__gt=0).count(), 3)
+
+        metrics = MaintenanceManager.reset_modification_counts()
+        self.assertEqual((metrics['processed'], metrics['complete']), (3, True))
+
+    def test_run_all(self):
+        old, recent = self.create_appointments(2, status=Appointment.STATUS_DELETED)
+        Appointment.objects.filter(id=old.id).update(deleted_at=timezone.now() - timedelta(days=2))
+        Appointment.objects.filter(id=recent.id).update(deleted_at=timezone.now())
+        kept, = self.create_appointments(1)
+        DoctorProcessingPool.objects.create(appointment=kept, is_removed=True)
+        DoctorProcessingPool.objects.create(appointment=kept)
+        today = timezone.localdate()
+        DailyAppointmentCreation.objects.create(user=self.guest, creation_date=today)
+        DailyAppointmentCreation.objects.create(
+            user=self.guest, creation_date=today - timedelta(days=MaintenanceManager.DAILY_CREATION_KEEP_DAYS + 1)
+        )
+
+        # PRAGMA optimize / wal_checkpoint 不能在测试用例的事务中执行
+        optimized = {'task': 'optimize_database', 'processed': 0, 'chunks': 1, 'seconds': 0, 'complete': True}
+        with mock.patch.object(MaintenanceManager, 'optimize_database', return_value=optimized) as optimize:
+            results = MaintenanceManager.run_all(time_budget=60)
+
+        optimize.assert_called_once()
+        self.assertEqual(
+            [(result['task'], result['processed']) for result in results],
+            [('reset_modification_counts', 0), ('purge_deleted_appointments', 1),
+             ('compact_processing_pool', 1), ('prune_daily_creations', 1), ('optimize_database', 0)]
+        )
+        self.assertTrue(all(result['complete'] for result in results))
+        self.assertEqual(set(Appointment.objects.values_list('id', flat=True)), {recent.id, kept.id})
+        self.assertEqual(list(DoctorProcessingPool.objects.values_list('is_removed', flat=True)), [False])
+        self.assertEqual(list(DailyAppointmentCreation.objects.values_list('creation_date', flat=True)), [today])
+
+
+class CheckUsersForDeletionCommandTests(TestCase):
+    """每月检查：只标记没有未处理预约的普通用户，本月已通知的不重复通知，试运行不写入"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        month_start = timezone.localtime(now).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+        def user(email, **fields):
+            return CustomUser.objects.create_user(email=f'{email}@example.com', password=None, **fields)
+
+        def appointment(guest, **fields):
+            return Appointment.objects.create(patient_name='p', demand='d', wechat_id='w', guest=guest, **fields)
+
+        cls.idle = user('idle')
+        cls.busy = user('busy')
+        appointment(cls.busy)
+        cls.processed = user('processed')
+        appointment(cls.processed, is_processed=True)
+        cls.deleted = user('deleted')
+        appointment(cls.deleted, is_deleted=True)
+        cls.notified = user('notified', to_be_deleted=True, to_be_deleted_notified_at=now)
+        cls.notified_last_month = user(
+            'notified_last_month', to_be_deleted=True, to_be_deleted_notified_at=month_start - timedelta(days=1)
+        )
+        cls.staff = user('staff', is_staff=True)
+        cls.doctor = CustomUser.objects.create_superuser(email='doctor@example.com', password=None)
+
+    def setUp(self):
+        # 配置了只读副本时也从主库查询（副本路由见 ReplicaRouterTests）
+        replica_patch = mock.patch.object(ReplicaMonitor, 'get_replica', return_value=None)
+        replica_patch.start()
+        self.addCleanup(replica_patch.stop)
+
+    def check_users(self, **options):
+        out = StringIO()
+        call_command('check_users_for_deletion', force=True, stdout=out, **options)
+        return out.getvalue()
+
+    def marked_emails(self):
+        return set(CustomUser.objects.filter(to_be_deleted=True).values_list('email', flat=True))
+
+    def test_dry_run_writes_nothing(self):
+        notified_at = dict(CustomUser.objects.values_list('id', 'to_be_deleted_notified_at'))
+
+        out = self.check_users(dry_run=True)
+
+        self.assertIn('将标记 3 个待删除账户，将通知 4 个账户', out)
+        self.assertIn('将通知: notified_last_month@example.com', out)
+        self.assertNotIn('将通知: notified@example.com', out)
+        self.assertEqual(self.marked_emails(), {'notified@example.com', 'notified_last_month@example.com'})
+        self.assertEqual(dict(CustomUser.objects.values_list('id', 'to_be_deleted_notified_at')), notified_at)
+        self.assertFalse(EmailOutbox.objects.exists())
+
+    def test_marks_and_notifies(self):
+        previous_notice = CustomUser.objects.get(pk=self.notified.pk).to_be_deleted_notified_at
+
+        out = self.check_users()
+
+        self.assertIn('标记了 3 个待删除账户，4 封通知邮件已加入发送队列', out)
+        self.assertEqual(self.marked_emails(), {
+            'idle@example.com', 'processed@example.com', 'deleted@example.com',
+            'notified@example.com', 'notified_last_month@example.com',
+        })
+        self.assertEqual(
+            sorted(recipient for outbox in EmailOutbox.objects.all() for recipient in outbox.recipients),
+            ['deleted@example.com', 'idle@example.com', 'notified_last_month@example.com', 'processed@example.com']
+        )
+        self.notified.refresh_from_db()
+        self.assertEqual(self.notified.to_be_deleted_notified_at, previous_notice)
+
+        # 同一个月再次执行：不重复标记和通知
+        self.assertIn('标记了 0 个待删除账户，0 封通知邮件已加入发送队列', self.check_users())
+        self.assertEqual(EmailOutbox.objects.count(), 4)
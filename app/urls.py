@@ -20,6 +20,7 @@ urlpatterns = [
     path('doctor/process/', views.doctor_process, name='doctor_process'),
 
     path('doctor/all/', views.doctor_all, name='doctor_all'),
+    path('doctor/bulk/', views.doctor_bulk_action, name='doctor_bulk_action'),
     path('doctor/remove_from_pool/<int:appointment_id>/', 
          views.doctor_remove_from_pool, 
          name='doctor_remove_from_pool'),
@@ -46,6 +47,9 @@ urlpatterns = [
     path('doctor/backup/create/', views.create_backup, name='create_backup'),
     path('doctor/backup/download/<str:filename>/', views.download_backup, name='download_backup'),
     path('doctor/backup/restore/', views.restore_backup, name='restore_backup'),
+    path('doctor/backup/restore/<str:filename>/', views.restore_backup_chain, name='restore_backup_chain'),
     path('doctor/backup/delete/<str:filename>/', views.delete_backup, name='delete_backup'),
     path('doctor/backup/info/<str:filename>/', views.backup_info, name='backup_info'),
+    path('doctor/backup/verify/<str:filename>/', views.verify_backup, name='verify_backup'),
+    path('doctor/backup/jobs/<str:job_id>/', views.backup_job_status, name='backup_job_status'),
 ]
\ No newline at end of file
@@ -1,8 +1,7 @@
 import random
 import string
 from django.core.cache import cache
-from django.core.mail import send_mail
-from django.conf import settings
+from .mail_outbox import EmailOutboxManager
 from datetime import datetime, timedelta
 from django.utils import timezone
 
@@ -43,16 +42,14 @@ def send_verification_code(email):
     '''
     
     try:
-        send_mail(
-            subject,
-            message,
-            settings.DEFAULT_FROM_EMAIL,
-            [email],
-            fail_silently=False,
-        )
+        # 写入发件箱，由后台任务发送
+        EmailOutboxManager.enqueue(subject, message, [email])
         return True, "验证码已发送到您的邮箱"
     except Exception as e:
         print(f"邮件发送失败: {e}")
+        # 验证码没有写入发件箱，允许立即重试
+        cache.delete(cache_key)
+        cache.delete(rate_limit_key)
         return False, "验证码发送失败，请检查邮箱地址"
 
 def verify_code(email, code):
@@ -1,4 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, get_user_model
 from django.contrib import messages
@@ -12,11 +13,18 @@ from django.utils import timezone
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.db.models import Q
 from .doctor_utils import DoctorQueueManager
+from .work_buffer import DoctorWorkBuffer
 
-from django.core.mail import send_mail
 from django.conf import settings
+from django.db import transaction
+from .mail_outbox import EmailOutboxManager
+from .db_router import use_replica
+from django.template import TemplateDoesNotExist, TemplateSyntaxError
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
+import logging
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
@@ -32,18 +40,66 @@ def send_appointment_notification(appointment, action_type, annotation='', note=
         annotation: 批注内容
         note: 备注内容（可选）
     """
+    # 邮件主题
+    if action_type == 'responded':
+        subject = f'【缥缈旅】您的预约已得到回应'
+    elif action_type == 'processed':
+        subject = f'【缥缈旅】您的预约即将处理'
+    elif action_type == 'urge_processed':
+        subject = f'【缥缈旅】您的催单已处理'
+    else:
+        subject = f'【缥缈旅】您的预约状态已更新'
+    
+    # 构建邮件内容
+    context = {
+        'appointment': appointment,
+        'action_type': action_type,
+        'annotation': annotation,
+        'note': note,
+        'site_name': '伯里欧斯的小助手',
+    }
+    
+    # 渲染HTML邮件模板（模板错误只记录日志，不中断流程）
     try:
-        # 邮件主题
-        if action_type == 'responded':
-            subject = f'【缥缈旅】您的预约已得到回应'
-        elif action_type == 'processed':
-            subject = f'【缥缈旅】您的预约即将处理'
-        elif action_type == 'urge_processed':
-            subject = f'【缥缈旅】您的催单已处理'
-        else:
-            subject = f'【缥缈旅】您的预约状态已更新'
-        
-        # 构建邮件内容
+        html_message = render_to_string('emails/appointment_notification.html', context)
+    except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+        logger.error(f"渲染预约通知邮件失败: {str(e)}")
+        return
+    plain_message = strip_tags(html_message)
+    
+    # 写入发件箱，由后台任务发送。写入失败时向上抛出，由调用方的事务回滚状态变更
+    recipient_list = [appointment.guest.email]
+    
+    EmailOutboxManager.enqueue(
+        subject=subject,
+        message=plain_message,
+        recipient_list=recipient_list,
+        html_message=html_message,
+    )
+    
+    logger.info(f"邮件已加入发送队列 {appointment.guest.email}，预约ID: {appointment.id}，操作: {action_type}")
+
+
+APPOINTMENT_NOTIFICATION_SUBJECTS = {
+    'responded': '【缥缈旅】您的预约已得到回应',
+    'processed': '【缥缈旅】您的预约即将处理',
+    'urge_processed': '【缥缈旅】您的催单已处理',
+}
+
+def send_appointment_notifications(appointments, action_type, annotation='', note=''):
+    """
+    批量写入预约通知邮件（一次写入发件箱，由后台任务复用SMTP连接发送）
+    
+    Args:
+        appointments: 预约对象列表（需已 select_related('guest')）
+        action_type: 操作类型 ('responded', 'processed', 'urge_processed')
+        annotation: 批注内容
+        note: 备注内容（可选）
+    """
+    subject = APPOINTMENT_NOTIFICATION_SUBJECTS.get(action_type, '【缥缈旅】您的预约状态已更新')
+    
+    email_messages = []
+    for appointment in appointments:
         context = {
             'appointment': appointment,
             'action_type': action_type,
@@ -51,31 +107,14 @@ def send_appointment_notification(appointment, action_type, annotation='', note=
             'note': note,
             'site_name': '伯里欧斯的小助手',
         }
-        
-        # 渲染HTML邮件模板
         html_message = render_to_string('emails/appointment_notification.html', context)
-        plain_message = strip_tags(html_message)
-        
-        # 发送邮件
-        recipient_list = [appointment.guest.email]
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            html_message=html_message,
-            fail_silently=True,  # 邮件发送失败不影响主要功能
+        email_messages.append(
+            (subject, strip_tags(html_message), [appointment.guest.email], html_message)
         )
-        
-        print(f"邮件已发送至 {appointment.guest.email}，预约ID: {appointment.id}，操作: {action_type}")
-        
-    except Exception as e:
-        print(f"邮件发送失败: {str(e)}")
-        # 记录日志但不中断流程
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"发送预约通知邮件失败: {str(e)}")
+    
+    outboxes = EmailOutboxManager.enqueue_many(email_messages)
+    logger.info(f"批量通知邮件已加入发送队列 {len(outboxes)} 封，操作: {action_type}")
+    return len(outboxes)
 
 
 def send_profile_record_notification(profile, record, action_type):
@@ -87,48 +126,42 @@ def send_profile_record_notification(profile, record, action_type):
         record: 记录对象
         action_type: 操作类型 ('record_added')
     """
+    # 检查是否有关联账号且用户有邮箱
+    if not profile.account or not profile.account.email:
+        logger.info(f"档案 {profile.name} 无关联账号或邮箱，跳过邮件发送")
+        return
+    
+    # 邮件主题
+    subject = f'【缥缈旅】您的档案 {profile.name} 有更新'
+    
+    # 构建邮件内容
+    context = {
+        'profile': profile,
+        'record': record,
+        'action_type': action_type,
+        'site_name': '伯里欧斯的小助手',
+        'record_type_display': record.get_record_type_display(),
+    }
+    
+    # 渲染HTML邮件模板（模板错误只记录日志，不中断流程）
     try:
-        # 检查是否有关联账号且用户有邮箱
-        if not profile.account or not profile.account.email:
-            print(f"档案 {profile.name} 无关联账号或邮箱，跳过邮件发送")
-            return
-        
-        # 邮件主题
-        subject = f'【缥缈旅】您的档案 {profile.name} 有更新'
-        
-        # 构建邮件内容
-        context = {
-            'profile': profile,
-            'record': record,
-            'action_type': action_type,
-            'site_name': '伯里欧斯的小助手',
-            'record_type_display': record.get_record_type_display(),
-        }
-        
-        # 渲染HTML邮件模板
         html_message = render_to_string('emails/profile_record_notification.html', context)
-        plain_message = strip_tags(html_message)
-        
-        # 发送邮件
-        recipient_list = [profile.account.email]
-        
-        send_mail(
-            subject=subject,
-            message=plain_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_list,
-            html_message=html_message,
-            fail_silently=True,  # 邮件发送失败不影响主要功能
-        )
-        
-        print(f"档案记录邮件已发送至 {profile.account.email}，档案: {profile.name}，记录ID: {record.id}")
-        
-    except Exception as e:
-        print(f"档案记录邮件发送失败: {str(e)}")
-        # 记录日志但不中断流程
-        import logging
-        logger = logging.getLogger(__name__)
-        logger.error(f"发送档案记录通知邮件失败: {str(e)}")
+    except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+        logger.error(f"渲染档案记录通知邮件失败: {str(e)}")
+        return
+    plain_message = strip_tags(html_message)
+    
+    # 写入发件箱，由后台任务发送。写入失败时向上抛出，由调用方的事务回滚记录
+    recipient_list = [profile.account.email]
+    
+    EmailOutboxManager.enqueue(
+        subject=subject,
+        message=plain_message,
+        recipient_list=recipient_list,
+        html_message=html_message,
+    )
+    
+    logger.info(f"档案记录邮件已加入发送队列 {profile.account.email}，档案: {profile.name}，记录ID: {record.id}")
 
 def login_redirect(request):
     """登录后重定向 - 根据用户类型跳转到不同页面"""
@@ -169,14 +202,8 @@ def login_redirect(request):
 def clear_deletion_mark_on_login(request, user):
     """用户登录时清除待删除标记"""
     if user.to_be_deleted:
-        user.to_be_deleted = False
-        user.last_login_before_deletion = timezone.now()
-        user.save()
-        
-        # 可选：发送确认邮件
-        try:
-            subject = '账户保留确认'
-            message = f'''
+        subject = '账户保留确认'
+        message = f'''
 亲爱的用户 {user.email}：
 
 您已成功登录缥缈旅，您的账户已从待删除列表中移除。
@@ -184,61 +211,14 @@ def clear_deletion_mark_on_login(request, user):
 感谢您继续使用我们的服务！
 
 伯里欧斯的小助理
-            '''
-            
-            from django.core.mail import send_mail
-            from django.conf import settings
-            
-            send_mail(
-                subject,
-                message,
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
-        except Exception as e:
-            # 邮件发送失败不影响主要功能
-            pass
-
-def cleanup_expired_deleted_appointments():
-    """清理昨天及更早删除的预约（处理时区）"""
-    from django.utils import timezone
-    from datetime import datetime, timedelta, date
-    
-    # 获取当前时区的今天日期
-    now = timezone.now()
-    today = now.date()
-    
-    # 获取昨天的日期
-    yesterday = today - timedelta(days=1)
-    
-    # 创建昨天的开始和结束时间（用于调试）
-    yesterday_start = timezone.make_aware(datetime.combine(yesterday, datetime.min.time()))
-    yesterday_end = timezone.make_aware(datetime.combine(today, datetime.min.time()))
-    
-    print(f"清理条件：删除日期 <= {yesterday}")
-    print(f"时间范围：{yesterday_start} 到 {yesterday_end}")
-    
-    # 查找所有在昨天或之前被删除的预约
-    expired_appointments = Appointment.objects.filter(
-        is_deleted=True,
-        deleted_at__date__lte=yesterday  # 删除日期小于等于昨天
-    )
-    
-    expired_count = expired_appointments.count()
-    
-    if expired_count > 0:
-        # 显示将要删除的预约信息（用于调试）
-        for app in expired_appointments[:5]:  # 只显示前5个
-            print(f"  将要删除：ID={app.id}, 删除时间={app.deleted_at}")
+        '''
         
-        # 真正删除这些预约
-        deleted_count, _ = expired_appointments.delete()
-        print(f"已自动清理 {deleted_count} 个昨天及更早删除的预约")
-        return deleted_count
-    
-    print("没有需要清理的过期预约")
-    return 0
+        # 清除标记与确认邮件（写入发件箱，由后台任务发送）在同一事务中写入
+        with transaction.atomic():
+            user.to_be_deleted = False
+            user.last_login_before_deletion = timezone.now()
+            user.save(update_fields=['to_be_deleted', 'last_login_before_deletion'])
+            EmailOutboxManager.enqueue(subject, message, [user.email])
 
 # 用户注册视图
 from .utils import send_verification_code, verify_code
@@ -296,20 +276,21 @@ def register(request):
         
         register_form = CustomUserCreationForm(request.POST, email=email)
         if register_form.is_valid():
-            # 再次检查每日注册限制
+            # 再次检查每日注册限制，与保存用户在同一事务中完成
             from datetime import date
             from django.utils import timezone
             today = timezone.now().date()
-            today_registrations = CustomUser.objects.filter(date_joined__date=today)
-            if today_registrations.count() >= 10:
-                messages.error(request, '今日注册名额已满，请明天再试。')
-                return redirect('register')
-            
-            # 保存用户
-            user = register_form.save(commit=False)
-            user.email = email
-            user.username = email  # 确保username字段有值
-            user.save()
+            with transaction.atomic():
+                today_registrations = CustomUser.objects.filter(date_joined__date=today)
+                if today_registrations.count() >= 10:
+                    messages.error(request, '今日注册名额已满，请明天再试。')
+                    return redirect('register')
+                
+                # 保存用户
+                user = register_form.save(commit=False)
+                user.email = email
+                user.username = email  # 确保username字段有值
+                user.save()
             
             # 清除session
             request.session.pop('register_email', None)
@@ -572,15 +553,6 @@ def view_my_profile(request):
 @login_required
 def index(request):
     """访客首页：显示预约表单和预约列表"""
-    # 触发清理过期的已删除预约（使用缓存避免频繁清理）
-    from django.core.cache import cache
-    last_cleanup = cache.get(f'last_cleanup_{request.user.id}')
-    
-    if not last_cleanup:
-        cleanup_expired_deleted_appointments()
-        # 记录清理时间，缓存1小时（3600秒）
-        cache.set(f'last_cleanup_{request.user.id}', timezone.now(), 3600)
-    
     # 处理预约创建（POST请求）
     if request.method == 'POST':
         form = AppointmentForm(request.POST)
@@ -755,8 +727,7 @@ def delete_appointment(request, appointment_id):
         return redirect('index')
     
     DoctorQueueManager.delete_appointment(appointment)
-    # 触发一次清理已过期的已删除预约
-    cleanup_expired_deleted_appointments()
+    DoctorWorkBuffer.invalidate()
     
     messages.success(request, '预约已标记为删除，将于明天自动清理。')
     return redirect('index')
@@ -788,10 +759,12 @@ def urge_appointment(request, appointment_id):
         return redirect('index')
     
     # 检查预约是否符合催单条件：已回应、未处理、未催单
-    if appointment.is_responded and not appointment.is_processed and not appointment.is_urged:
-        appointment.is_urged = True
+    if DoctorQueueManager.can_transition(appointment, 'urge'):
+        DoctorQueueManager.transition(appointment, 'urge')
         appointment.urged_at = timezone.now()  # 使用本地时间
         appointment.save()
+        # 催单改变了处理缓冲区中该预约的状态
+        DoctorWorkBuffer.invalidate('urge', 'process')
         messages.success(request, '催单成功！')
         
         # 记录日志
@@ -851,6 +824,7 @@ def update_appointment(request, appointment_id):
             # 保存修改
             form.save()
             appointment.save()
+            DoctorWorkBuffer.invalidate()
             
             messages.success(request, '预约修改成功！')
             return redirect('index')
@@ -884,24 +858,11 @@ def doctor_required(view_func):
 def doctor_index(request):
     """医师首页"""
     # 统计数量
-    urge_count = Appointment.objects.filter(
-        is_urged=True,
-        is_processed=False,
-        is_deleted=False
-    ).count()
+    urge_count = Appointment.objects.filter(status=Appointment.STATUS_URGED).count()
     
-    unresponded_count = Appointment.objects.filter(
-        is_responded=False,
-        is_processed=False,
-        is_deleted=False
-    ).count()
+    unresponded_count = Appointment.objects.filter(status=Appointment.STATUS_PENDING).count()
     
-    unprocessed_count = Appointment.objects.filter(
-        is_urged=False,
-        is_responded=True,
-        is_processed=False,
-        is_deleted=False
-    ).count()
+    unprocessed_count = Appointment.objects.filter(status=Appointment.STATUS_RESPONDED).count()
     
     # 获取最近的公告（最多5条）
     announcements = Announcement.objects.all().order_by('-created_at')[:5]
@@ -915,37 +876,62 @@ def doctor_index(request):
     }
     return render(request, 'app/doctor_index.html', context)
 
+def parse_priority(value):
+    """解析表单中的优先级，只接受处理队列能够分组的值
+
+    Returns:
+        int | None: 未填写时返回 None
+
+    Raises:
+        ValueError: 不是有效的优先级
+    """
+    if value in (None, ''):
+        return None
+    if str(value) not in {str(priority) for priority, _ in Appointment.PRIORITY_CHOICES}:
+        raise ValueError('无效的优先级')
+    return int(value)
+
 @doctor_required
 def doctor_respond(request):
     """回应预约"""
-    appointment = DoctorQueueManager.get_unresponded_appointment()
+    appointment = DoctorWorkBuffer.peek('respond', request.user)
     
     if request.method == 'POST':
         if appointment:
-            # 更新预约信息
-            appointment.annotation = request.POST.get('annotation', '')
-            appointment.note = request.POST.get('note', '')
-            
-            # 可以修改优先级
-            if 'priority' in request.POST:
-                appointment.priority = int(request.POST['priority'])
-            
-            # 标记为已回应
-            appointment.is_responded = True
-            appointment.is_processed = False
-            appointment.save()
-
-            send_appointment_notification(
-                appointment=appointment,
-                action_type='responded',
-                annotation=appointment.annotation,
-                note=appointment.note
-            )
-            
-            messages.success(request, '预约已回应')
+            try:
+                priority = parse_priority(request.POST.get('priority'))
+            except ValueError as e:
+                # 表单错误：预约没有被处理，留在缓冲区中
+                messages.error(request, str(e))
+            else:
+                # 缓冲区中的预约可能已过期，只用来确定ID：在事务中重新读取并锁定，按数据库中的状态回应
+                try:
+                    # 状态变更与通知邮件在同一事务中写入
+                    with transaction.atomic():
+                        appointment = DoctorQueueManager.lock_appointment(appointment.id)
+                        DoctorQueueManager.respond_appointment(
+                            appointment,
+                            request.POST.get('annotation', ''),
+                            request.POST.get('note', ''),
+                            priority
+                        )
+                        send_appointment_notification(
+                            appointment=appointment,
+                            action_type='responded',
+                            annotation=appointment.annotation,
+                            note=appointment.note
+                        )
+                    messages.success(request, '预约已回应')
+                except Appointment.DoesNotExist:
+                    messages.error(request, '预约不存在')
+                except ValueError as e:
+                    # 当前状态不允许该操作（如已被其他医师回应）
+                    messages.error(request, str(e))
+                
+                DoctorWorkBuffer.pop('respond', request.user, appointment.id)
     
-    # 获取下一个未回应的预约
-    appointment = DoctorQueueManager.get_unresponded_appointment()
+    # 获取下一个未回应的预约（从预取缓冲区读取）
+    appointment = DoctorWorkBuffer.peek('respond', request.user)
     
     context = {
         'appointment': appointment,
@@ -955,27 +941,41 @@ def doctor_respond(request):
 @doctor_required
 def doctor_urge(request):
     """处理催单"""
-    appointment = DoctorQueueManager.get_urge_appointment()
+    appointment = DoctorWorkBuffer.peek('urge', request.user)
     
     if request.method == 'POST':
         if appointment:
             annotation = request.POST.get('annotation', '')
             note = request.POST.get('note', '')
-            priority = request.POST.get('priority', appointment.priority)
-            
-            DoctorQueueManager.urge_appointment(appointment, annotation, note, priority)
-
-            send_appointment_notification(
-                appointment=appointment,
-                action_type='urge_processed',
-                annotation=annotation,
-                note=note
-            )
             
-            messages.success(request, '催单已处理')
+            try:
+                priority = parse_priority(request.POST.get('priority'))
+            except ValueError as e:
+                # 表单错误：催单没有被处理，留在缓冲区中
+                messages.error(request, str(e))
+            else:
+                try:
+                    with transaction.atomic():
+                        appointment = DoctorQueueManager.lock_appointment(appointment.id)
+                        DoctorQueueManager.urge_appointment(appointment, annotation, note, priority)
+                        send_appointment_notification(
+                            appointment=appointment,
+                            action_type='urge_processed',
+                            annotation=annotation,
+                            note=note
+                        )
+                    messages.success(request, '催单已处理')
+                except Appointment.DoesNotExist:
+                    messages.error(request, '预约不存在')
+                except ValueError as e:
+                    messages.error(request, str(e))
+                
+                DoctorWorkBuffer.pop('urge', request.user, appointment.id)
+                # 优先级可能已修改，处理缓冲区中的数据需要更新
+                DoctorWorkBuffer.invalidate('process')
     
-    # 获取下一个催单（处理完成后）
-    appointment = DoctorQueueManager.get_urge_appointment()
+    # 获取下一个催单（从预取缓冲区读取）
+    appointment = DoctorWorkBuffer.peek('urge', request.user)
     
     context = {
         'appointment': appointment,
@@ -994,7 +994,7 @@ def doctor_process(request):
         messages.success(request, '队列已刷新！')
         return redirect('doctor_process')
 
-    appointment = DoctorQueueManager.get_next_processing_appointment()
+    appointment = DoctorWorkBuffer.peek('process', request.user)
     
     if request.method == 'POST':
         if appointment:
@@ -1002,23 +1002,32 @@ def doctor_process(request):
             annotation = request.POST.get('annotation', '')
             note = request.POST.get('note', '')
             
-            # 处理预约
-            DoctorQueueManager.process_appointment(appointment, annotation, note)
-
-            send_appointment_notification(
-                appointment=appointment,
-                action_type='processed',
-                annotation=annotation,
-                note=note
-            )
+            # 处理预约（状态变更与通知邮件在同一事务中写入）
+            try:
+                with transaction.atomic():
+                    appointment = DoctorQueueManager.lock_appointment(appointment.id)
+                    DoctorQueueManager.process_appointment(appointment, annotation, note)
+                    send_appointment_notification(
+                        appointment=appointment,
+                        action_type='processed',
+                        annotation=annotation,
+                        note=note
+                    )
+                messages.success(request, f'预约 #{appointment.id} 已处理，已发送邮件通知访客')
+            except Appointment.DoesNotExist:
+                messages.error(request, '预约不存在')
+            except ValueError as e:
+                messages.error(request, str(e))
             
-            messages.success(request, f'预约 #{appointment.id} 已处理，已发送邮件通知访客')
+            DoctorWorkBuffer.pop('process', request.user, appointment.id)
+            # 已处理的预约不再属于催单列表
+            DoctorWorkBuffer.invalidate('urge')
             
             # 重定向回处理页面，获取下一个预约
             return redirect('doctor_process')
     
-    # 获取下一个待处理的预约
-    appointment = DoctorQueueManager.get_next_processing_appointment()
+    # 获取下一个待处理的预约（从预取缓冲区读取）
+    appointment = DoctorWorkBuffer.peek('process', request.user)
     
     context = {
         'appointment': appointment,
@@ -1036,27 +1045,17 @@ def doctor_all(request):
     page = request.GET.get('page', 1)
     
     # 基础查询集（排除已删除的）
-    appointments = Appointment.objects.filter(is_deleted=False)
+    appointments = Appointment.objects.filter(status__lt=Appointment.STATUS_DELETED)
     
     # 应用筛选
     if filter_type == 'urge':
-        appointments = appointments.filter(
-            is_urged=True,
-            is_responded=False,
-            is_processed=False
-        )
+        appointments = appointments.filter(status=Appointment.STATUS_URGED)
     elif filter_type == 'unresponded':
-        appointments = appointments.filter(
-            is_responded=False,
-            is_processed=False
-        ).exclude(is_urged=True)  # 排除催单，因为催单有单独筛选
+        appointments = appointments.filter(status=Appointment.STATUS_PENDING)
     elif filter_type == 'processed':
-        appointments = appointments.filter(is_processed=True)
+        appointments = appointments.filter(status=Appointment.STATUS_PROCESSED)
     elif filter_type == 'responded_unprocessed':
-        appointments = appointments.filter(
-            is_responded=True,
-            is_processed=False
-        )
+        appointments = appointments.filter(status__in=Appointment.QUEUE_STATUSES)
     
     # 应用搜索
     if search_query:
@@ -1085,32 +1084,23 @@ def doctor_all(request):
     if request.method == 'POST' and 'respond' in request.POST:
         appointment_id = request.POST.get('appointment_id')
         try:
-            appointment = Appointment.objects.get(id=appointment_id, is_deleted=False)
-            
             # 使用新的回应函数
             annotation = request.POST.get('annotation', '')
             note = request.POST.get('note', '')
-            priority = request.POST.get('priority', appointment.priority)
-            
-            DoctorQueueManager.respond_appointment(
-                appointment, 
-                annotation, 
-                note, 
-                int(priority) if priority else None
-            )
+            priority = parse_priority(request.POST.get('priority'))
             
-            # 如果是催单，处理完成后重置催单状态
-            if appointment.is_urged:
-                appointment.is_urged = False
-                appointment.save()
-            
-            send_appointment_notification(
-                appointment=appointment,
-                action_type='responded',
-                annotation=annotation,
-                note=note
-            )
+            with transaction.atomic():
+                appointment = DoctorQueueManager.lock_appointment(appointment_id)
+                DoctorQueueManager.respond_appointment(appointment, annotation, note, priority)
+                
+                send_appointment_notification(
+                    appointment=appointment,
+                    action_type='responded',
+                    annotation=annotation,
+                    note=note
+                )
             
+            DoctorWorkBuffer.invalidate()
             messages.success(request, f'预约 #{appointment.id} 已回应')
             
             # 重定向回当前页面，保持筛选条件
@@ -1119,26 +1109,29 @@ def doctor_all(request):
             
         except Appointment.DoesNotExist:
             messages.error(request, '预约不存在')
+        except ValueError as e:
+            # 当前状态不允许该操作（如已被其他医师处理）
+            messages.error(request, str(e))
     
     # 处理处理预约的POST请求
     elif request.method == 'POST' and 'process' in request.POST:
         appointment_id = request.POST.get('appointment_id')
         try:
-            appointment = Appointment.objects.get(id=appointment_id, is_deleted=False)
-            
             # 使用新的处理函数
             annotation = request.POST.get('annotation', '')
             note = request.POST.get('note', '')
             
-            DoctorQueueManager.process_appointment(appointment, annotation, note)
-
-            send_appointment_notification(
-                appointment=appointment,
-                action_type='processed',
-                annotation=annotation,
-                note=note
-            )
+            with transaction.atomic():
+                appointment = DoctorQueueManager.lock_appointment(appointment_id)
+                DoctorQueueManager.process_appointment(appointment, annotation, note)
+                send_appointment_notification(
+                    appointment=appointment,
+                    action_type='processed',
+                    annotation=annotation,
+                    note=note
+                )
             
+            DoctorWorkBuffer.invalidate()
             messages.success(request, f'预约 #{appointment.id} 已处理')
             
             # 重定向回当前页面，保持筛选条件
@@ -1147,6 +1140,9 @@ def doctor_all(request):
             
         except Appointment.DoesNotExist:
             messages.error(request, '预约不存在')
+        except ValueError as e:
+            # 当前状态不允许该操作（如已被其他医师处理）
+            messages.error(request, str(e))
     
     context = {
         'appointments': appointments_page,
@@ -1157,6 +1153,66 @@ def doctor_all(request):
     }
     return render(request, 'app/doctor_all.html', context)
 
+# 批量操作：操作类型 -> (通知类型, 提示文字)
+BULK_ACTIONS = {
+    'respond': ('responded', '回应'),
+    'process': ('processed', '处理'),
+    'urge': ('urge_processed', '处理催单'),
+}
+
+@doctor_required
+def doctor_bulk_action(request):
+    """批量回应/处理/催单：一次请求处理多个预约"""
+    # 处理完成后回到原来的筛选页面
+    redirect_url = reverse('doctor_all')
+    params = request.GET.urlencode()
+    if params:
+        redirect_url = f"{redirect_url}?{params}"
+    
+    if request.method != 'POST':
+        return redirect(redirect_url)
+    
+    action = request.POST.get('action', '')
+    if action not in BULK_ACTIONS:
+        messages.error(request, '不支持的批量操作')
+        return redirect(redirect_url)
+    
+    appointment_ids = [
+        int(appointment_id) for appointment_id in request.POST.getlist('appointment_ids')
+        if appointment_id.isdigit()
+    ]
+    if not appointment_ids:
+        messages.error(request, '请至少选择一个预约')
+        return redirect(redirect_url)
+    
+    annotation = request.POST.get('annotation')
+    note = request.POST.get('note')
+    try:
+        # 只接受队列能够分组的优先级，其他值会使预约从处理队列中消失
+        priority = parse_priority(request.POST.get('priority'))
+    except ValueError as e:
+        messages.error(request, str(e))
+        return redirect(redirect_url)
+    
+    # 状态变更与全部通知邮件在同一事务中写入
+    action_type, action_label = BULK_ACTIONS[action]
+    with transaction.atomic():
+        appointments = DoctorQueueManager.bulk_action(
+            action, appointment_ids, annotation, note, priority
+        )
+        send_appointment_notifications(
+            appointments, action_type, annotation=annotation or '', note=note or ''
+        )
+    DoctorWorkBuffer.invalidate()
+    
+    skipped_count = len(appointment_ids) - len(appointments)
+    if skipped_count:
+        messages.warning(request, f'已批量{action_label} {len(appointments)} 个预约，{skipped_count} 个预约状态不符已跳过')
+    else:
+        messages.success(request, f'已批量{action_label} {len(appointments)} 个预约')
+    
+    return redirect(redirect_url)
+
 # 从处理池中移除预约
 @doctor_required
 def doctor_remove_from_pool(request, appointment_id):
@@ -1166,6 +1222,7 @@ def doctor_remove_from_pool(request, appointment_id):
     return redirect('doctor_all')
 
 @doctor_required
+@use_replica()
 def user_accounts(request):
     """用户档案管理"""
     search_query = request.GET.get('search', '')
@@ -1190,16 +1247,13 @@ def user_accounts(request):
         # 进行中的预约（已回应但未处理）
         user.active_appointments = Appointment.objects.filter(
             guest=user,
-            is_responded=True,
-            is_processed=False,
-            is_deleted=False
+            status__in=Appointment.QUEUE_STATUSES
         ).count()
         
         # 已完成的预约
         user.completed_appointments = Appointment.objects.filter(
             guest=user,
-            is_processed=True,
-            is_deleted=False
+            status=Appointment.STATUS_PROCESSED
         ).count()
     
     # 排序：按最后登录时间倒序，从未登录的排最后
@@ -1232,7 +1286,7 @@ def user_accounts(request):
     ).count()
     
     # 总预约数
-    appointments_total = Appointment.objects.filter(is_deleted=False).count()
+    appointments_total = Appointment.objects.filter(status__lt=Appointment.STATUS_DELETED).count()
     
     context = {
         'users': users_page,
@@ -1265,6 +1319,7 @@ from .forms import ProfileForm, ProfileRecordForm  # 稍后需要创建这些表
 from .models import Profile, ProfileRecord
 
 @doctor_required
+@use_replica()
 def patients_info(request):
     """档案管理页面"""
     search_query = request.GET.get('search', '')
@@ -1365,33 +1420,35 @@ def profile_detail(request, profile_id):
                 record_form = ProfileRecordForm(request.POST, user=request.user)
             
             if record_form.is_valid():
-                record = record_form.save(commit=False)
-                record.profile = profile
-                record.created_by = request.user
-                record.save()
+                # 记录与通知邮件在同一事务中写入
+                with transaction.atomic():
+                    record = record_form.save(commit=False)
+                    record.profile = profile
+                    record.created_by = request.user
+                    record.save()
                 
-                # 更新档案的更新时间
-                profile.save()
+                    # 更新档案的更新时间
+                    profile.save()
                 
-                # 检查是否发送邮件：只有医师添加的用户可见记录才发送
-                # 用户可见的记录类型包括：'user'（访客记录）和 'doctor_public'（医师公开记录）
-                # 但通常只有医师的 'doctor_public' 记录需要通知用户，访客的 'user' 记录不需要通知
-                if (record.record_type in ['doctor_public'] and 
-                    profile.account and 
-                    profile.account.email):
+                    # 检查是否发送邮件：只有医师添加的用户可见记录才发送
+                    # 用户可见的记录类型包括：'user'（访客记录）和 'doctor_public'（医师公开记录）
+                    # 但通常只有医师的 'doctor_public' 记录需要通知用户，访客的 'user' 记录不需要通知
+                    if (record.record_type in ['doctor_public'] and 
+                        profile.account and 
+                        profile.account.email):
                     
-                    # 发送邮件通知用户
-                    send_profile_record_notification(
-                        profile=profile,
-                        record=record,
-                        action_type='record_added'
-                    )
+                        # 发送邮件通知用户
+                        send_profile_record_notification(
+                            profile=profile,
+                            record=record,
+                            action_type='record_added'
+                        )
                     
-                    # 如果档案处于催促状态，重置为False
-                    if profile.is_urged:
-                        profile.is_urged = False
-                        profile.save()
-                        print(f"档案 {profile.name} 催促状态已重置")
+                        # 如果档案处于催促状态，重置为False
+                        if profile.is_urged:
+                            profile.is_urged = False
+                            profile.save()
+                            print(f"档案 {profile.name} 催促状态已重置")
                 
                 messages.success(request, '记录添加成功')
                 return redirect('profile_detail', profile_id=profile.id)
@@ -1494,35 +1551,18 @@ def delete_profile(request, profile_id):
 # 在 views.py 中添加以下视图函数
 
 from django.http import JsonResponse
+from .account_index import AccountAutocompleteIndex
 
 @doctor_required
 def autocomplete_accounts(request):
-    """自动完成账号搜索"""
+    """自动完成账号搜索（按邮箱前缀匹配）"""
     query = request.GET.get('q', '').strip()
     
-    print(f"搜索账号查询: {query}")  # 调试信息
-    
     if not query:
         return JsonResponse([], safe=False)
     
-    # 搜索非医师账号（排除超级用户）
-    users = CustomUser.objects.filter(
-        email__icontains=query,
-        is_superuser=False
-    ).order_by('email')[:10]  # 限制返回10个结果
-    
-    print(f"找到 {users.count()} 个匹配用户")  # 调试信息
-    
-    # 构建返回数据
-    results = []
-    for user in users:
-        results.append({
-            'id': user.id,
-            'email': user.email,
-            'display': f'{user.email} (用户ID: {user.id})'
-        })
-    
-    print(f"返回结果: {results}")  # 调试信息
+    # 使用内存有序索引按前缀查找，结果按前缀缓存
+    results = AccountAutocompleteIndex.search(query)
     
     return JsonResponse(results, safe=False)
 
@@ -1530,72 +1570,17 @@ def autocomplete_accounts(request):
 # 在导入部分添加
 from .models import Announcement
 from .forms import AnnouncementForm
+from .announcement_fanout import AnnouncementFanout
 
 # 在 views.py 中添加以下函数
 
 def send_announcement_notification(announcement):
     """
     发送纯文本公告通知邮件给所有用户
+    
+    在后台分批逐人发送（复用同一SMTP连接），不阻塞发布请求
     """
-    try:
-        # 获取所有活跃的非超级用户邮箱
-        recipients = list(CustomUser.objects.filter(
-            is_active=True,
-            is_superuser=False
-        ).exclude(email='').distinct())
-        
-        if not recipients:
-            print("没有找到有效的收件人")
-            return
-        
-        # 将时间转换为东八区时间（北京时间）
-        from django.utils import timezone
-        import pytz
-        
-        # 获取公告的创建时间（已经是带时区的时间）
-        created_at = announcement.created_at
-        
-        # 转换为东八区时间
-        beijing_tz = pytz.timezone('Asia/Shanghai')
-        beijing_time = created_at.astimezone(beijing_tz)
-        
-        # 邮件主题
-        subject = f'【缥缈旅】公告：{announcement.title}'
-        
-        # 构建纯文本邮件内容
-        message = f"""
-=== 伯里欧斯的公告 ===
-
-标题：{announcement.title}
-
-公告内容：
-{announcement.content}
-
-发布时间：{beijing_time.strftime('%Y年%m月%d日 %H:%M')}（北京时间）
-
-=== 温馨提示 ===
-1. 此邮件由系统自动发送，请勿直接回复
-2. 感谢您使用缥缈旅
-
-伯里欧斯的小助手
-"""
-        
-        # 提取邮箱列表
-        recipient_emails = [user.email for user in recipients if user.email]
-        
-        # 发送邮件
-        send_mail(
-            subject=subject,
-            message=message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=recipient_emails,
-            fail_silently=True,
-        )
-        
-        print(f"纯文本公告邮件已发送至 {len(recipient_emails)} 个用户")
-        
-    except Exception as e:
-        print(f"公告邮件发送失败: {str(e)}")
+    AnnouncementFanout.start(announcement)
 
 
 @doctor_required
@@ -1688,13 +1673,11 @@ def delete_user_account(request, user_id):
         user_email = user.email
         
         # 1. 软删除该用户的所有预约
-        Appointment.objects.filter(guest=user).update(
-            is_deleted=True,
-            deleted_at=timezone.now()
-        )
+        DoctorQueueManager.delete_guest_appointments(user)
+        DoctorWorkBuffer.invalidate()
         
         # 2. 将该用户的档案的account字段设为NULL（保持档案不删除）
-        Profile.objects.filter(account=user).update(account=None)
+        Profile.objects.filter(account=user).update(account=None, updated_at=timezone.now())
         
         # 3. 删除用户账号
         user.delete()
@@ -1722,9 +1705,13 @@ def delete_user_account(request, user_id):
 
 
 from .backup_utils import DataBackupManager
-from django.http import HttpResponse, JsonResponse, FileResponse
+from .backup_jobs import BackupJobManager
+from django.http import HttpResponse, JsonResponse, FileResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
 import os
+import re
 
 @doctor_required
 def data_backup(request):
@@ -1732,48 +1719,144 @@ def data_backup(request):
     # 列出已有备份
     backups = DataBackupManager.list_backups()
 
-    # 获取当前数据库统计信息
-    stats = DataBackupManager.get_database_info()
+    # 获取当前数据库统计信息（只读副本可用时从副本统计）
+    with use_replica():
+        stats = DataBackupManager.get_database_info()
     
     context = {
         'backups': backups,
         'stats': stats,
+        'codecs': [
+            codec for codec, (compress_type, _) in DataBackupManager.BACKUP_CODECS.items()
+            if compress_type is not None
+        ],
+        'default_codec': getattr(settings, 'BACKUP_CODEC', 'deflate'),
+        'jobs': BackupJobManager.list_jobs(),
+        'tables': [(name, label) for name, _, label, *_ in DataBackupManager.BACKUP_TABLES],
     }
     return render(request, 'app/data_backup.html', context)
 
+def _parse_byte_range(range_header, size):
+    """解析单个字节范围（bytes=start-end / start- / -suffix），返回 (start, end)
+
+    格式不支持（如多段范围）时返回 None，按完整下载处理；范围无法满足时返回 (None, None)。
+    """
+    match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', range_header)
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # 最后 N 个字节
+        length = int(end)
+        if length == 0:
+            return None, None
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size:
+        return None, None
+    if start > end:
+        return None
+    return start, end
+
+def _iter_file_range(filepath, start, length, chunk_size=1024 * 1024):
+    """按块读取文件的一段"""
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
 @doctor_required
 def download_backup(request, filename):
-    """下载备份文件"""
+    """下载备份文件
+
+    支持断点续传（Range / If-Range）和条件请求，ETag 取创建时记录的文件SHA-256。
+    配置 BACKUP_SENDFILE 后由前端代理直接发送文件。
+    """
+    filename = os.path.basename(filename)
     backup_dir = DataBackupManager.get_backup_directory()
     filepath = os.path.join(backup_dir, filename)
-    
-    if os.path.exists(filepath):
-        response = FileResponse(open(filepath, 'rb'), as_attachment=True)
-        response['Content-Type'] = 'application/zip'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
-    else:
+    entry = DataBackupManager.get_backup_entry(filename)
+
+    if entry is None or not os.path.exists(filepath):
         messages.error(request, '备份文件不存在')
         return redirect('data_backup')
 
+    size = os.path.getsize(filepath)
+    # 文件与目录记录不一致时不给出 ETag，避免客户端拼接出错误的文件
+    etag = f'"{entry["sha256"]}"' if entry['sha256'] and size == entry['size'] else None
+    last_modified = int(os.path.getmtime(filepath))
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    sendfile = getattr(settings, 'BACKUP_SENDFILE', None)
+    if sendfile:
+        # 文件内容、Range 由代理处理，这里只给出文件位置和响应头
+        response = HttpResponse(content_type='application/zip')
+        if sendfile == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = getattr(settings, 'BACKUP_ACCEL_PREFIX', '/protected-backups/') + filename
+        else:
+            response['X-Sendfile'] = os.path.abspath(filepath)
+    else:
+        byte_range = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header:
+            # If-Range 与当前文件不符（文件已变化）时忽略 Range，重新下载完整文件
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if if_range is None or (etag is not None and if_range == etag) or (
+                    not if_range.startswith(('"', 'W/')) and parse_http_date_safe(if_range) == last_modified):
+                byte_range = _parse_byte_range(range_header, size)
+
+        if byte_range == (None, None):
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+        if byte_range is None:
+            response = FileResponse(open(filepath, 'rb'), content_type='application/zip')
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                _iter_file_range(filepath, start, end - start + 1),
+                status=206, content_type='application/zip'
+            )
+            response['Content-Length'] = str(end - start + 1)
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['Last-Modified'] = http_date(last_modified)
+    if etag:
+        response['ETag'] = etag
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 
 import traceback  # 添加这行到文件顶部导入部分
 
 @doctor_required
 def create_backup(request):
-    """创建数据备份"""
+    """提交后台备份任务（mode=incremental 时只备份自上次备份以来的变化，mode=snapshot 时创建数据库快照）
+
+    导出在后台线程中进行，页面轮询任务进度，完成后提供下载。
+    """
+    if request.method != 'POST':
+        return redirect('data_backup')
+
     try:
-        backup_path = DataBackupManager.create_backup()
-        filename = os.path.basename(backup_path)
-        
-        messages.success(request, f'数据备份创建成功: {filename}')
-        
-        # 返回备份文件下载
-        response = FileResponse(open(backup_path, 'rb'), as_attachment=True)
-        response['Content-Type'] = 'application/zip'
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        return response
-        
+        mode = request.POST.get('mode') or 'full'
+        codec = request.POST.get('codec') or None
+        # 提交前校验压缩方式，错误直接提示而不是等到任务失败
+        DataBackupManager._resolve_codec(codec)
+        job = BackupJobManager.start_backup(mode=mode, codec=codec, user=request.user)
+        messages.success(request, '备份任务已开始，完成后可在下方下载')
+        return redirect(f"{reverse('data_backup')}?job={job['id']}")
+
     except Exception as e:
         error_msg = f'备份创建失败: {str(e)}'
         print(f"备份错误详情: {traceback.format_exc()}")  # 打印详细错误信息
@@ -1782,7 +1865,7 @@ def create_backup(request):
 
 @doctor_required
 def restore_backup(request):
-    """恢复数据备份"""
+    """提交后台恢复任务（上传的备份文件）"""
     if request.method == 'POST':
         if 'backup_file' not in request.FILES:
             messages.error(request, '请选择备份文件')
@@ -1800,45 +1883,12 @@ def restore_backup(request):
             messages.error(request, '备份文件太大，请确保文件小于100MB')
             return redirect('data_backup')
         
-        # 保存上传的文件到临时位置
-        import tempfile
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
-            for chunk in backup_file.chunks():
-                temp_file.write(chunk)
-            temp_path = temp_file.name
-        
         try:
-            # 执行恢复
-            restore_stats = DataBackupManager.restore_backup(temp_path)
-            
-            # 清理临时文件
-            os.unlink(temp_path)
-            
-            # 统计结果
-            total_restored = sum(restore_stats.get(key, 0) for key in [
-                'users', 'appointments', 'profiles', 'profile_records',
-                'daily_creations', 'announcements', 'processing_pools'
-            ])
-            
-            error_count = len(restore_stats.get('errors', []))
-            
-            if error_count == 0:
-                messages.success(request, f'数据恢复成功！共恢复 {total_restored} 条记录。')
-            else:
-                # 显示前5个错误
-                error_samples = restore_stats['errors'][:5]
-                error_message = f'数据恢复完成，共恢复 {total_restored} 条记录，但有 {error_count} 个错误。'
-                if error_samples:
-                    error_message += f' 示例错误: {error_samples[0]}'
-                messages.warning(request, error_message)
-            
-            return redirect('data_backup')
+            job = BackupJobManager.start_restore(upload=backup_file, user=request.user)
+            messages.success(request, '恢复任务已开始，请等待下方任务完成')
+            return redirect(f"{reverse('data_backup')}?job={job['id']}")
             
         except Exception as e:
-            # 清理临时文件
-            if 'temp_path' in locals() and os.path.exists(temp_path):
-                os.unlink(temp_path)
-            
             error_msg = f'数据恢复失败: {str(e)}'
             print(f"恢复错误详情: {traceback.format_exc()}")  # 打印详细错误信息
             messages.error(request, error_msg)
@@ -1846,6 +1896,32 @@ def restore_backup(request):
     
     return redirect('data_backup')
 
+@doctor_required
+def restore_backup_chain(request, filename):
+    """从服务器上的备份恢复（增量备份会先重放其完整备份及之前的增量备份），在后台任务中执行"""
+    if request.method != 'POST':
+        return redirect('data_backup')
+
+    try:
+        job = BackupJobManager.start_restore(filename=os.path.basename(filename), user=request.user)
+        messages.success(request, '恢复任务已开始，请等待下方任务完成')
+        return redirect(f"{reverse('data_backup')}?job={job['id']}")
+    except Exception as e:
+        print(f"恢复错误详情: {traceback.format_exc()}")
+        messages.error(request, f'数据恢复失败: {str(e)}')
+
+    return redirect('data_backup')
+
+@doctor_required
+def backup_job_status(request, job_id):
+    """备份/恢复任务进度（供页面轮询）"""
+    job = BackupJobManager.get_job(job_id)
+    if job is None:
+        return JsonResponse({'error': '任务不存在'}, status=404)
+    if job['kind'] == 'backup' and job['status'] == 'done':
+        job['download_url'] = reverse('download_backup', args=[job['filename']])
+    return JsonResponse(job)
+
 @doctor_required
 def delete_backup(request, filename):
     """删除备份文件"""
@@ -1861,32 +1937,38 @@ def delete_backup(request, filename):
     return redirect('data_backup')
 
 @doctor_required
-def backup_info(request, filename):
-    """获取备份文件信息"""
-    backup_dir = DataBackupManager.get_backup_directory()
-    filepath = os.path.join(backup_dir, filename)
-    
-    if not os.path.exists(filepath):
-        return JsonResponse({'error': '文件不存在'}, status=404)
-    
+def verify_backup(request, filename):
+    """校验备份文件（不执行恢复）"""
+    if request.method != 'POST':
+        return redirect('data_backup')
+
     try:
-        import zipfile
-        import json
-        
-        with zipfile.ZipFile(filepath, 'r') as zipf:
-            # 读取备份信息
-            with zipf.open('backup_info.json') as f:
-                backup_info = json.load(f)
-            
-            # 获取文件大小
-            file_stat = os.stat(filepath)
-            
-            return JsonResponse({
-                'filename': filename,
-                'size': file_stat.st_size,
-                'created_time': file_stat.st_ctime,
-                'backup_info': backup_info,
-            })
-            
+        result = DataBackupManager.verify_backup(
+            os.path.basename(filename), deep=request.POST.get('deep') == '1'
+        )
+        if result['ok']:
+            messages.success(request, f'备份文件 {filename} 校验通过（用时 {result["seconds"]} 秒）')
+        else:
+            messages.error(request, f'备份文件 {filename} 校验失败: {"; ".join(result["errors"])}')
     except Exception as e:
-        return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+        messages.error(request, f'校验失败: {str(e)}')
+
+    return redirect('data_backup')
+
+@doctor_required
+def backup_info(request, filename):
+    """获取备份文件信息（读取备份目录索引）"""
+    entry = DataBackupManager.get_backup_entry(os.path.basename(filename))
+    if entry is None:
+        return JsonResponse({'error': '文件不存在'}, status=404)
+    if entry['backup_info'] is None:
+        return JsonResponse({'error': '备份文件无法读取'}, status=500)
+
+    return JsonResponse({
+        'filename': entry['filename'],
+        'size': entry['size'],
+        'created_time': entry['created_time'],
+        'sha256': entry['sha256'],
+        'members': entry['members'],
+        'backup_info': entry['backup_info'],
+    })
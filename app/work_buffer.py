@@ -0,0 +1,154 @@
+from django.core.cache import cache
+from django.db import connection, transaction
+from .models import Appointment
+from .queue_manager import AppointmentQueueManager
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class DoctorWorkBuffer:
+    """医师工作预取缓冲区：一次查询预取接下来的N个待办预约，处理后直接从缓冲区渲染下一个
+
+    缓冲区中的预约对象最多缓存5分钟，只用于显示和确定预约ID；修改预约前必须用
+    DoctorQueueManager.lock_appointment 重新读取。
+    """
+
+    CACHE_KEY_GENERATION = 'doctor_work_buffer_generation'
+    CACHE_KEY_BUFFER = 'doctor_work_buffer'
+    CACHE_KEY_HANDLED = 'doctor_work_buffer_handled'
+    CACHE_TIMEOUT = 300  # 5分钟
+    BUFFER_SIZE = 10
+    REFILL_THRESHOLD = 3  # 剩余数量低于该值时后台补充
+
+    # 回应、催单按ID顺序取；处理按队列顺序取
+    KIND_FILTERS = {
+        'respond': {'status': Appointment.STATUS_PENDING},
+        'urge': {'status': Appointment.STATUS_URGED},
+    }
+    KINDS = ('respond', 'urge', 'process')
+
+    @classmethod
+    def _get_generation(cls, kind):
+        generation = cache.get(f'{cls.CACHE_KEY_GENERATION}_{kind}')
+        if generation is None:
+            generation = 1
+            cache.add(f'{cls.CACHE_KEY_GENERATION}_{kind}', generation, None)
+        return generation
+
+    @classmethod
+    def _get_key(cls, kind, doctor_id):
+        return f'{cls.CACHE_KEY_BUFFER}_{kind}_{cls._get_generation(kind)}_{doctor_id}'
+
+    @classmethod
+    def invalidate(cls, *kinds):
+        """使缓冲区失效（不指定类型时全部失效），用于访客修改预约或医师跳序操作"""
+        for kind in kinds or cls.KINDS:
+            try:
+                cache.incr(f'{cls.CACHE_KEY_GENERATION}_{kind}')
+            except ValueError:
+                cache.set(f'{cls.CACHE_KEY_GENERATION}_{kind}', 1, None)
+        logger.info(f"医师工作缓冲区已失效: {', '.join(kinds or cls.KINDS)}")
+
+    @classmethod
+    def _drop_handled(cls, kind, items):
+        """去掉已被（其他医师）处理的预约，一次读取缓存"""
+        if not items:
+            return items
+        handled = cache.get_many([f'{cls.CACHE_KEY_HANDLED}_{kind}_{item.id}' for item in items])
+        if not handled:
+            return items
+        return [item for item in items if f'{cls.CACHE_KEY_HANDLED}_{kind}_{item.id}' not in handled]
+
+    @classmethod
+    def _fetch(cls, kind, after_id=None):
+        """一次查询取出接下来的N个候选预约"""
+        appointments = Appointment.objects.select_related('guest')
+
+        if kind == 'process':
+            queue_ids = AppointmentQueueManager.get_queue()[:cls.BUFFER_SIZE]
+            appointment_map = appointments.in_bulk(queue_ids)
+            return [appointment_map[i] for i in queue_ids if i in appointment_map]
+
+        appointments = appointments.filter(**cls.KIND_FILTERS[kind]).order_by('id')
+        if after_id is not None:
+            appointments = appointments.filter(id__gt=after_id)
+        return list(appointments[:cls.BUFFER_SIZE])
+
+    @classmethod
+    def refill(cls, kind, doctor_id):
+        """补充缓冲区：回应/催单只在队尾追加，处理按最新队列重建"""
+        key = cls._get_key(kind, doctor_id)
+        items = cls._drop_handled(kind, cache.get(key) or [])
+
+        if kind == 'process' or not items:
+            items = cls._fetch(kind)
+        else:
+            items = items + cls._fetch(kind, after_id=items[-1].id)
+            items = items[:cls.BUFFER_SIZE]
+
+        cache.set(key, items, cls.CACHE_TIMEOUT)
+        return items
+
+    @classmethod
+    def _refill_async(cls, kind, doctor_id):
+        """事务提交后在后台线程中补充缓冲区"""
+        def run():
+            try:
+                cls.refill(kind, doctor_id)
+            except Exception as e:
+                logger.error(f"补充医师工作缓冲区失败: {e}")
+            finally:
+                connection.close()
+
+        transaction.on_commit(
+            lambda: threading.Thread(target=run, daemon=True).start()
+        )
+
+    @classmethod
+    def peek(cls, kind, doctor):
+        """获取当前待办的预约（优先从缓冲区读取）"""
+        key = cls._get_key(kind, doctor.id)
+        items = cache.get(key)
+
+        if kind != 'process':
+            remaining = cls._drop_handled(kind, items)
+            if not remaining:
+                remaining = cls.refill(kind, doctor.id)
+            elif len(remaining) != len(items):
+                cache.set(key, remaining, cls.CACHE_TIMEOUT)
+            return remaining[0] if remaining else None
+
+        # 处理顺序由队列决定，缓冲区只负责提供预约数据
+        queue = AppointmentQueueManager.get_queue()
+        if not queue:
+            return None
+
+        for appointment in items or []:
+            if appointment.id == queue[0]:
+                return appointment
+
+        for appointment in cls.refill(kind, doctor.id):
+            if appointment.id == queue[0]:
+                return appointment
+
+        # 队列中的预约已不存在，交给队列管理器处理
+        return AppointmentQueueManager.get_next_appointment()
+
+    @classmethod
+    def pop(cls, kind, doctor, appointment_id):
+        """处理完成后从缓冲区移除该预约，剩余不足时后台补充
+
+        其他医师的缓冲区中可能也有该预约：记录为已处理，其他医师 peek 时跳过，
+        他们缓冲区中的其余预约继续使用。（记录丢失时修改前的 lock_appointment 仍会拒绝过期的操作。）
+        """
+        key = cls._get_key(kind, doctor.id)
+        items = [
+            appointment for appointment in cache.get(key) or []
+            if appointment.id != appointment_id
+        ]
+        cache.set(key, items, cls.CACHE_TIMEOUT)
+        cache.set(f'{cls.CACHE_KEY_HANDLED}_{kind}_{appointment_id}', True, cls.CACHE_TIMEOUT)
+
+        if len(items) < cls.REFILL_THRESHOLD:
+            cls._refill_async(kind, doctor.id)
@@ -78,12 +78,84 @@ WSGI_APPLICATION = 'booking_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# 默认使用 SQLite；环境变量 DB_ENGINE=postgresql 时使用 PostgreSQL（psycopg 3），连接参数取自 POSTGRES_* 环境变量
+# 测试：python manage.py test app（SQLite，内存测试库）；在 PostgreSQL 上运行同一组测试：
+#   DB_ENGINE=postgresql POSTGRES_HOST=localhost POSTGRES_PORT=5432 POSTGRES_USER=booking_system \
+#   POSTGRES_PASSWORD=... python manage.py test app
+# 测试库为 POSTGRES_TEST_DB（默认 test_booking_system），由测试运行器创建和删除，用户需要 CREATEDB 权限；
+# 只适用于 SQLite 的测试（EXPLAIN 查询计划、数据库快照）用 skipUnless 显式跳过，结果中显示为 skipped
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'booking_system'),
+            'USER': os.environ.get('POSTGRES_USER', 'booking_system'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # 使用 Django 内置连接池（psycopg_pool），每个进程最多 max_size 个连接；
+            # 连接池与持久连接不能同时使用，CONN_MAX_AGE 必须为0，请求结束时连接归还给池
+            'CONN_MAX_AGE': 0,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+                    'max_size': int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10)),
+                    'timeout': int(os.environ.get('POSTGRES_POOL_TIMEOUT', 10)),  # 取连接的最长等待时间（秒）
+                },
+            },
+            # 备份导出等 iterator() 查询使用服务端游标分块读取；
+            # 经 PgBouncer 事务池连接时服务端游标不可用，设置 POSTGRES_DISABLE_SERVER_SIDE_CURSORS=1
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('POSTGRES_DISABLE_SERVER_SIDE_CURSORS') == '1',
+            'TEST': {
+                'NAME': os.environ.get('POSTGRES_TEST_DB', 'test_booking_system'),
+            },
+        }
     }
-}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # 连接保持10分钟，WAL 等 PRAGMA 只在新建连接时执行一次（见 app/db_connection.py）
+            # 注意：持久连接按线程保存。start.sh 用 runserver 启动时每个请求在新线程中处理，
+            # 线程结束时连接随之关闭，所以实际上每个请求仍新建连接（WAL、IMMEDIATE 事务等仍然生效）；
+            # 只有使用固定线程的 WSGI 服务器（如 gunicorn --threads）时连接才会在请求之间复用。
+            # 调度进程（run_scheduler）是常驻线程，连接可以复用。
+            'CONN_MAX_AGE': 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # 事务开始时就获取写锁：事务内先读后写时不会因锁升级冲突直接报 database is locked，
+                # 而是按 busy_timeout 排队等待（项目中的 atomic 块都是写事务）
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+# 只读副本（可选）：报表、统计、备份导出等只读查询在 use_replica() 范围内发往副本（见 app/db_router.py）
+# PostgreSQL：设置 POSTGRES_REPLICA_HOST，其余连接参数与主库相同（可用 POSTGRES_REPLICA_PORT / POSTGRES_REPLICA_DB 覆盖）
+# SQLite（本地测试）：设置 SQLITE_REPLICA_PATH，由 manage.py sync_replica 从主库复制
+if DB_ENGINE == 'postgresql' and os.environ.get('POSTGRES_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['POSTGRES_REPLICA_HOST'],
+        'PORT': os.environ.get('POSTGRES_REPLICA_PORT', DATABASES['default']['PORT']),
+        'NAME': os.environ.get('POSTGRES_REPLICA_DB', DATABASES['default']['NAME']),
+    }
+elif DB_ENGINE != 'postgresql' and os.environ.get('SQLITE_REPLICA_PATH'):
+    DATABASES['replica'] = {**DATABASES['default'], 'NAME': os.environ['SQLITE_REPLICA_PATH']}
+if 'replica' in DATABASES:
+    # 测试时副本直接使用测试主库
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['app.db_router.ReplicaRouter']
+REPLICA_MAX_LAG = 60  # 副本延迟超过该秒数时只读查询改用主库
+REPLICA_CHECK_INTERVAL = 5  # 检查副本延迟的间隔（秒）
+REPLICA_HEARTBEAT_INTERVAL = 10  # 主库写入复制心跳的间隔（秒），配置了副本时由调度进程执行
+
+# SQLite 连接参数，覆盖 app/db_connection.py 中的默认值，如 {'mmap_size': 0}
+SQLITE_PRAGMAS = {}
 
 
 # Password validation
@@ -158,6 +230,33 @@ CACHES = {
 # APScheduler 配置
 APSCHEDULER_DATETIME_FORMAT = "N j, Y, f:s a"
 APSCHEDULER_RUN_NOW_TIMEOUT = 25  # 秒
+# 定时任务由 manage.py run_scheduler 单独运行；设为 True 时改为在 Web 进程内启动
+SCHEDULER_AUTOSTART = False
+# 调度进程锁文件：同一台机器上只有持有锁的进程执行定时任务（运行时文件，已加入 .gitignore）
+SCHEDULER_LOCK_FILE = BASE_DIR / 'scheduler.lock'
+
+# 数据备份压缩方式：stored / deflate / lzma / zstd（zstd 需要 Python 3.14）
+BACKUP_CODEC = 'deflate'
+BACKUP_CODEC_LEVEL = None  # None 使用各压缩方式的推荐级别
+
+# 备份下载交给前端代理发送（零拷贝，断点续传由代理处理）：
+# None 由Django发送 / 'x-sendfile'（Apache、lighttpd）/ 'x-accel-redirect'（Nginx）
+BACKUP_SENDFILE = None
+BACKUP_ACCEL_PREFIX = '/protected-backups/'  # Nginx 中指向备份目录的 internal location
+
+# 定时备份：每天 BACKUP_SCHEDULE_HOUR:BACKUP_SCHEDULE_MINUTE（北京时间）执行，None 表示不定时备份
+BACKUP_SCHEDULE_HOUR = 3
+BACKUP_SCHEDULE_MINUTE = 0
+BACKUP_SCHEDULE_MODE = 'full'  # full / incremental / snapshot
+# 保留策略：最近7天每天一个、最近4周每周一个，其余定时备份在定时备份后删除
+# （只清理定时备份；手动创建的备份和快照不会自动删除，它们依赖的备份链也会保留）
+BACKUP_KEEP_DAILY = 7
+BACKUP_KEEP_WEEKLY = 4
+
+# 低峰期维护（重置修改次数、清理已删除预约、压缩处理池、清理每日创建记录、优化数据库），None 表示不执行
+MAINTENANCE_SCHEDULE_HOUR = 4
+MAINTENANCE_SCHEDULE_MINUTE = 30
+MAINTENANCE_TIME_BUDGET = 300  # 一次维护的总时长上限（秒），超出部分下次继续
 
 
 # 开发环境下静态文件目录
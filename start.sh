@@ -16,6 +16,10 @@ else:
     print('✓ 超级用户已存在，跳过创建。')
 EOF
 
+# 启动定时任务调度进程（只启动一个，Web 进程不再各自运行调度器）
+echo "启动定时任务调度进程..."
+python manage.py run_scheduler &
+
 # 启动Django开发服务器
 echo "启动Django开发服务器..."
 exec python manage.py runserver 0.0.0.0:8000
\ No newline at end of file